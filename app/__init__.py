@@ -10,6 +10,10 @@ from .config import DevelopmentConfig
 def create_app(config_class=DevelopmentConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
+
+    # Bring the schema up to date once at startup so request paths never issue DDL
+    from .utils.migrations import migrate
+    migrate(app.config.get("DATABASE_PATH"))
     
     # Register routes blueprint
     from .routes import main as main_blueprint
@@ -0,0 +1,279 @@
+"""
+asgi.py - ASGI entry point for the Caelum ADHD Assistant.
+
+/llm, /respond and /tts-download are served natively on the event loop by
+AsyncLLMEngine, so a request waiting on OpenAI or ElevenLabs holds no worker
+thread. Every other route falls through to the Flask app, run on a thread pool.
+
+    gunicorn app.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+
+import os
+import json
+import asyncio
+from urllib.parse import quote
+from a2wsgi import WSGIMiddleware
+from app import create_app
+from app.config import Config
+from app.async_llm import AsyncLLMEngine
+from app.utils.sse import format_sse, SSE_HEADERS
+from app.utils.llm_limiter import LLMOverloaded
+
+# This is the production entry point, so it defaults to the production config;
+# set FLASK_CONFIG=app.config.DevelopmentConfig to debug locally.
+flask_app = create_app(config_class=os.getenv("FLASK_CONFIG", "app.config.ProductionConfig"))
+
+# Imported after create_app so the blueprint module initializes exactly as under WSGI.
+from app.routes import build_respond_context, remember_reply  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+_engine = None
+
+
+def get_engine():
+    """
+    Returns the AsyncLLMEngine for this process, creating it inside the running loop.
+    """
+    global _engine
+    if _engine is None:
+        _engine = AsyncLLMEngine()
+    return _engine
+
+
+# === WSGI Fallback ===
+
+# The Flask routes are thread-safe, so requests run concurrently on a pool of
+# ASGI_WSGI_THREADS threads rather than one at a time.
+flask_asgi = WSGIMiddleware(flask_app.wsgi_app, workers=Config.ASGI_WSGI_THREADS)
+
+
+async def wsgi_fallback(scope, receive, send):
+    await flask_asgi(scope, receive, send)
+
+
+# === Request & Response Helpers ===
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null") or {}
+    except ValueError:
+        return {}
+
+
+def wants_stream(scope, data):
+    """
+    Mirrors app.utils.sse.wants_stream for raw ASGI scopes.
+    """
+    if data.get("stream"):
+        return True
+    accept = dict(scope.get("headers") or []).get(b"accept", b"").decode("latin-1")
+    return accept.split(",")[0].split(";")[0].strip() == "text/event-stream"
+
+
+async def send_start(send, status, content_type, headers=None):
+    raw_headers = [(b"content-type", content_type.encode("latin-1"))]
+    raw_headers += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+
+
+async def send_body(send, status, body, content_type="application/json", headers=None):
+    if not isinstance(body, (bytes, str)):
+        body = json.dumps(body)
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    await send_start(send, status, content_type, headers)
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_stream(send, chunks, content_type, headers=None):
+    await send_start(send, 200, content_type, headers)
+    try:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        await chunks.aclose()
+    await send({"type": "http.response.body", "body": b""})
+
+
+def declared_length(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"content-length":
+            return int(value) if value.isdigit() else None
+    return None
+
+
+async def send_overloaded(send, error):
+    await send_body(send, 503, {"error": "overloaded", "message": str(error)},
+                    headers={"Retry-After": error.retry_after or 1})
+
+
+async def primed(deltas):
+    """
+    Awaits the first delta before the response starts (see app.utils.sse.prime).
+
+    Returns:
+        async iterator: The same deltas.
+    """
+    try:
+        first = await deltas.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chained():
+        try:
+            if first is not None:
+                yield first
+            async for delta in deltas:
+                yield delta
+        finally:
+            await deltas.aclose()
+
+    return chained()
+
+
+# === Async Routes ===
+
+async def llm_endpoint(scope, receive, send):
+    data = await read_json(receive)
+    prompt = data.get("prompt", "")
+    if not prompt:
+        return await send_body(send, 400, "No prompt provided", "text/plain")
+    engine = get_engine()
+
+    if wants_stream(scope, data):
+        try:
+            deltas = await primed(engine.stream_response(prompt))
+        except LLMOverloaded as e:
+            return await send_overloaded(send, e)
+        except Exception as e:
+            print(f"[DEBUG] Error streaming LLM response: {e}", flush=True)
+            return await send_body(send, 500, "Error generating response", "text/plain")
+
+        async def event_stream():
+            try:
+                async for delta in deltas:
+                    yield format_sse({"delta": delta})
+                yield format_sse({}, event="done")
+            except Exception as e:
+                print(f"[DEBUG] Error streaming LLM response: {e}", flush=True)
+                yield format_sse({"error": "Error generating response"}, event="error")
+
+        return await send_stream(send, event_stream(), "text/event-stream", SSE_HEADERS)
+
+    try:
+        response_text = await engine.generate_response(prompt)
+        await send_body(send, 200, response_text, "text/plain; charset=utf-8")
+    except LLMOverloaded as e:
+        await send_overloaded(send, e)
+    except Exception as e:
+        print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
+        await send_body(send, 500, "Error generating response", "text/plain")
+
+
+async def caelum_respond(scope, receive, send):
+    data = await read_json(receive)
+    # Archetype and mood lookups are local SQLite reads; keep them off the loop.
+    ctx = await asyncio.to_thread(build_respond_context, data)
+    metadata = {
+        "archetype_used": ctx["archetype"],
+        "tone": ctx["tone"],
+        "mood_used": ctx["mood_used"],
+        "mode": ctx["mode"]
+    }
+    engine = get_engine()
+    args = (ctx["user_input"], ctx["tone"], ctx["template"], ctx["archetype"], ctx["mode"], ctx["history"])
+
+    if wants_stream(scope, data):
+        try:
+            deltas = await primed(engine.stream_archetype_prompt(*args))
+        except LLMOverloaded as e:
+            return await send_overloaded(send, e)
+        except Exception as e:
+            return await send_body(send, 500, {"error": str(e)})
+
+        async def event_stream():
+            try:
+                parts = []
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield format_sse({"delta": delta})
+                await asyncio.to_thread(remember_reply, ctx, "".join(parts))
+                yield format_sse(metadata, event="metadata")
+            except Exception as e:
+                yield format_sse({"error": str(e)}, event="error")
+
+        return await send_stream(send, event_stream(), "text/event-stream", SSE_HEADERS)
+
+    try:
+        result = await engine.generate_archetype_prompt(*args)
+        await asyncio.to_thread(remember_reply, ctx, result)
+        await send_body(send, 200, {"response": result, **metadata})
+    except LLMOverloaded as e:
+        await send_overloaded(send, e)
+    except Exception as e:
+        await send_body(send, 500, {"error": str(e)})
+
+
+async def tts_download(scope, receive, send):
+    data = await read_json(receive)
+    try:
+        mp3_path = await get_engine().generate_tts_elevenlabs(data.get("text"), data.get("archetype", "Beau"))
+    except Exception as e:
+        return await send_body(send, 500, {"error": str(e)})
+
+    # File I/O runs on a thread so a slow disk never stalls the loop.
+    async def file_chunks():
+        f = await asyncio.to_thread(open, mp3_path, "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    filename = quote(os.path.basename(mp3_path))
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Content-Length": await asyncio.to_thread(os.path.getsize, mp3_path),
+    }
+    await send_stream(send, file_chunks(), "audio/mpeg", headers)
+
+
+ASYNC_ROUTES = {
+    ("POST", "/llm"): llm_endpoint,
+    ("POST", "/respond"): caelum_respond,
+    ("POST", "/tts-download"): tts_download,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _engine is not None:
+                await _engine.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+    if handler is None:
+        # Refuse an oversize audio upload before the bridge reads its body.
+        if (scope.get("method"), scope.get("path")) == ("POST", "/transcribe") and \
+                (declared_length(scope) or 0) > Config.TRANSCRIBE_MAX_UPLOAD_BYTES:
+            return await send_body(send, 413, {"error": f"Upload exceeds {Config.TRANSCRIBE_MAX_UPLOAD_BYTES} bytes."})
+        return await wsgi_fallback(scope, receive, send)
+    await handler(scope, receive, send)
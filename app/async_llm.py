@@ -0,0 +1,206 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from openai import AsyncOpenAI, RateLimitError
+from app.config import Config
+from app.llm import LLMEngine, MAX_COMPLETION_TOKENS, TEMPERATURE, RETRYABLE_ERRORS, ELEVENLABS_VOICE_SETTINGS
+from app.utils.registry import get_registry
+from app.utils.tts_cache import get_tts_cache, tts_cache_key
+from app.utils.elevenlabs import AsyncElevenLabsClient
+from app.utils.llm_limiter import get_llm_limiter, estimate_tokens, parse_reset, LLMOverloaded
+from app.utils.response_cache import get_response_cache, response_cache_key
+from app.utils.singleflight import AsyncSingleFlight
+
+# === Async Engine ===
+#
+# asyncio counterpart of LLMEngine for the ASGI entrypoint (app/asgi.py). A
+# request waiting on OpenAI or ElevenLabs holds no thread, so one process can
+# keep hundreds of conversations in flight. Calls go through the same shared
+# limiter, response cache and TTS cache as the synchronous engine, which caelum_cli.py and
+# Celery keep using. Identical concurrent LLM and TTS calls share one upstream
+# call through an AsyncSingleFlight per engine, as the sync engine's do.
+
+
+class AsyncLLMEngine:
+    def __init__(self, model: str = "gpt-4", debug: bool = True):
+        """
+        Initializes the AsyncLLMEngine instance. Create it inside the event
+        loop that will use it, since its HTTP pools bind to that loop.
+
+        Args:
+            model (str): The model to use (default "gpt-4").
+            debug (bool): Whether to print debug statements (default True).
+
+        Raises:
+            Exception: If OPENAI_API_KEY is not set.
+        """
+        if not Config.OPENAI_API_KEY:
+            raise Exception("OPENAI_API_KEY is not set.")
+        self.model = model
+        self.debug = debug
+        self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY, timeout=Config.OPENAI_TIMEOUT, max_retries=0)
+        self.elevenlabs = AsyncElevenLabsClient()
+        self.flight = AsyncSingleFlight() if Config.SINGLEFLIGHT_ENABLED else None
+
+    async def aclose(self):
+        """
+        Closes the pooled OpenAI and ElevenLabs connections.
+        """
+        await self.client.close()
+        await self.elevenlabs.aclose()
+
+    async def generate_response(self, prompt: str, system_msg: str = "You are a helpful assistant.", mode: Optional[str] = None,
+                                history: Optional[list] = None) -> str:
+        """
+        Async counterpart of LLMEngine.generate_response.
+        """
+        if self.debug:
+            print(f"[DEBUG] Generating response: {prompt}", flush=True)
+        try:
+            return await self._chat([
+                {"role": "system", "content": system_msg},
+                *(history or []),
+                {"role": "user", "content": prompt}
+            ], mode)
+        except Exception as e:
+            print(f"[DEBUG] Error generating response: {e}", flush=True)
+            raise
+
+    async def generate_archetype_prompt(self, user_input: str, tone: str, template: str, archetype: str, mode: Optional[str] = None,
+                                        history: Optional[list] = None) -> str:
+        """
+        Async counterpart of LLMEngine.generate_archetype_prompt.
+        """
+        messages = LLMEngine.build_archetype_messages(user_input, tone, template, archetype, history)
+        if self.debug:
+            print(f"[DEBUG] Archetype Prompt: {messages}", flush=True)
+        try:
+            return await self._chat(messages, mode)
+        except Exception as e:
+            print(f"[DEBUG] Error in archetype prompt: {e}", flush=True)
+            raise
+
+    async def stream_response(self, prompt: str, system_msg: str = "You are a helpful assistant.", mode: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Async counterpart of LLMEngine.stream_response.
+        """
+        if self.debug:
+            print(f"[DEBUG] Streaming response: {prompt}", flush=True)
+        async for delta in self._stream_chat([
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": prompt}
+        ], mode):
+            yield delta
+
+    async def stream_archetype_prompt(self, user_input: str, tone: str, template: str, archetype: str, mode: Optional[str] = None,
+                                      history: Optional[list] = None) -> AsyncIterator[str]:
+        """
+        Async counterpart of LLMEngine.stream_archetype_prompt.
+        """
+        messages = LLMEngine.build_archetype_messages(user_input, tone, template, archetype, history)
+        if self.debug:
+            print(f"[DEBUG] Streaming Archetype Prompt: {messages}", flush=True)
+        async for delta in self._stream_chat(messages, mode):
+            yield delta
+
+    async def generate_tts_elevenlabs(self, text: str, archetype: str = "Beau") -> str:
+        """
+        Async counterpart of LLMEngine.generate_tts_elevenlabs, sharing its cache.
+        """
+        voice_id = get_registry().get_voice_id(archetype)
+
+        async def synthesize(text: str, output_file: str):
+            await self.elevenlabs.synthesize_to_file(voice_id, text, output_file, ELEVENLABS_VOICE_SETTINGS)
+
+        async def get_or_create():
+            return str(await get_tts_cache().aget_or_create("elevenlabs", voice_id, ELEVENLABS_VOICE_SETTINGS, text, synthesize))
+
+        try:
+            if self.flight is None:
+                return await get_or_create()
+            return await self.flight.do("tts:" + tts_cache_key("elevenlabs", voice_id, ELEVENLABS_VOICE_SETTINGS, text), get_or_create)
+        except Exception as e:
+            print(f"[DEBUG] ElevenLabs TTS error: {e}", flush=True)
+            raise
+
+    @asynccontextmanager
+    async def _completion(self, messages: list, stream: bool = False):
+        # Same retry and limiter policy as LLMEngine._completion.
+        limiter = get_llm_limiter()
+        estimated = estimate_tokens(messages, MAX_COMPLETION_TOKENS)
+        attempt = 0
+        while True:
+            async with limiter.aslot(estimated):
+                try:
+                    raw = await self.client.chat.completions.with_raw_response.create(model=self.model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_COMPLETION_TOKENS,
+                    stream=stream)
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                    if isinstance(e, RateLimitError):
+                        await asyncio.to_thread(limiter.on_rate_limited, parse_reset(e.response.headers.get("retry-after")))
+                else:
+                    # Limiter updates may be Redis round trips; keep them off the loop.
+                    await asyncio.to_thread(limiter.observe_headers, raw.headers)
+                    limiter.on_success()
+                    result = await raw.parse()
+                    if not stream and getattr(result, "usage", None):
+                        await asyncio.to_thread(limiter.record_usage, estimated, result.usage.total_tokens)
+                    yield result
+                    return
+            if attempt >= Config.LLM_MAX_RETRIES:
+                if isinstance(error, RateLimitError):
+                    raise LLMOverloaded() from error
+                raise error
+            if self.debug:
+                print(f"[DEBUG] OpenAI call failed ({error.__class__.__name__}), retrying", flush=True)
+            await asyncio.sleep(limiter.backoff(attempt))
+            attempt += 1
+
+    def _cache_key(self, messages: list, mode: Optional[str]) -> Optional[str]:
+        cache = get_response_cache()
+        if cache is None or cache.ttl_for(mode) <= 0:
+            return None
+        return response_cache_key(self.model, messages, TEMPERATURE, MAX_COMPLETION_TOKENS)
+
+    async def _chat(self, messages: list, mode: Optional[str] = None) -> str:
+        # The cache's shared tier is SQLite, so lookups run off the loop.
+        key = self._cache_key(messages, mode)
+        if key:
+            cached = await asyncio.to_thread(get_response_cache().get, key)
+            if cached is not None:
+                return cached
+
+        async def complete():
+            async with self._completion(messages) as response:
+                text = response.choices[0].message.content
+            # Cached by the leader only, as in LLMEngine._chat.
+            if key:
+                await asyncio.to_thread(get_response_cache().put, key, text, mode)
+            return text
+
+        # Identical concurrent requests share one completion.
+        if self.flight is None:
+            return await complete()
+        return await self.flight.do("llm:" + response_cache_key(self.model, messages, TEMPERATURE, MAX_COMPLETION_TOKENS), complete)
+
+    async def _stream_chat(self, messages: list, mode: Optional[str] = None) -> AsyncIterator[str]:
+        key = self._cache_key(messages, mode)
+        if key:
+            cached = await asyncio.to_thread(get_response_cache().get, key)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        async with self._completion(messages, stream=True) as stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        if key:
+            await asyncio.to_thread(get_response_cache().put, key, "".join(parts), mode)
@@ -1,4 +1,5 @@
 import os
+import json
 
 class Config:
     """
@@ -16,12 +17,69 @@ class Config:
     TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_NUMBER = os.getenv("TWILIO_NUMBER")
 
+    # Outbound messaging: per-number send rate and burst, max wait for capacity,
+    # Twilio HTTP timeout, and whether reply text rides along with its audio
+    # when that audio is already cached. The rate is shared through Redis by
+    # every process when MESSAGING_REDIS_URL is set; otherwise each process
+    # takes 1/MESSAGING_WORKER_PROCESSES of it, so set that to the number of
+    # web plus Celery worker processes that send
+    MESSAGING_RATE_PER_SEC = float(os.getenv("MESSAGING_RATE_PER_SEC", "1"))
+    MESSAGING_BURST = float(os.getenv("MESSAGING_BURST", "5"))
+    MESSAGING_MAX_WAIT = float(os.getenv("MESSAGING_MAX_WAIT", "30"))
+    TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "15"))
+    MESSAGING_COMBINE_MEDIA = os.getenv("MESSAGING_COMBINE_MEDIA", "false").lower() == "true"
+    MESSAGING_REDIS_URL = os.getenv("MESSAGING_REDIS_URL")
+    MESSAGING_WORKER_PROCESSES = max(1, int(os.getenv("MESSAGING_WORKER_PROCESSES", "1")))
+
+    # Broadcast fan-out: recipients per Celery chunk, aggregate send rate across
+    # workers, and how long a broadcast may go without progress before it is resumed
+    BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "50"))
+    BROADCAST_RATE_PER_SEC = float(os.getenv("BROADCAST_RATE_PER_SEC", os.getenv("MESSAGING_RATE_PER_SEC", "1")))
+    BROADCAST_STALL_SECONDS = float(os.getenv("BROADCAST_STALL_SECONDS", "600"))
+
+    # Due-time scheduler: max entries dispatched per tick, and how late an entry
+    # may be (e.g. after beat downtime) before it is skipped rather than sent
+    SCHEDULER_BATCH_LIMIT = int(os.getenv("SCHEDULER_BATCH_LIMIT", "5000"))
+    SCHEDULER_MAX_LATE_SECONDS = float(os.getenv("SCHEDULER_MAX_LATE_SECONDS", "3600"))
+
+    # Public base URL Twilio uses to fetch media and post status callbacks
+    PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "https://duck-healthy-easily.ngrok-free.app")
+
     # Paths & Directories
     DATABASE_PATH = os.getenv("DATABASE_PATH", "custom_archetypes.db")
     AUDIO_OUTPUT_DIR = os.getenv("AUDIO_OUTPUT_DIR", "app/static/audio")
     JOURNAL_EXPORT_DIR = os.getenv("JOURNAL_EXPORT_DIR", "exports")
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
 
+    # SQLite Tuning (applied to every pooled connection)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+    SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", "256"))
+
+    # Write-behind logging for usage and feedback events
+    EVENT_WRITE_BEHIND = os.getenv("EVENT_WRITE_BEHIND", "true").lower() == "true"
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+    EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "1.0"))
+    EVENT_QUEUE_MAX = int(os.getenv("EVENT_QUEUE_MAX", "10000"))
+
+    # Seconds a user's recent-mood ranking is served from the in-process cache
+    MOOD_CACHE_TTL = float(os.getenv("MOOD_CACHE_TTL", "30"))
+
+    # Seconds between archetype registry change-counter checks
+    REGISTRY_CHECK_INTERVAL = float(os.getenv("REGISTRY_CHECK_INTERVAL", "2"))
+
+    # Webhook idempotency: how long a MessageSid is remembered, and how often expired keys are purged
+    IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+    IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+
+    # Audio store limits: byte budget, max file age, send pin lifetime and sweep cadence
+    AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(2 * 1024 ** 3)))
+    AUDIO_MAX_AGE_DAYS = float(os.getenv("AUDIO_MAX_AGE_DAYS", "30"))
+    AUDIO_PIN_SECONDS = float(os.getenv("AUDIO_PIN_SECONDS", str(6 * 3600)))
+    AUDIO_SWEEP_MINUTES = int(os.getenv("AUDIO_SWEEP_MINUTES", "15"))
+
     # Voice Mapping for ElevenLabs TTS
     VOICE_MAP = {
         "Beau": "21m00Tcm4TlvDq8ikWAM",
@@ -31,6 +89,121 @@ class Config:
         "Theo": "MF3mGyEYCl7XYWbV9V6O"
     }
 
+    # ElevenLabs synthesis settings shared by the download, stream and pipelined speech paths
+    ELEVENLABS_VOICE_SETTINGS = {
+        "stability": 0.7,
+        "similarity_boost": 0.8
+    }
+    ELEVENLABS_MODEL_ID = os.getenv("ELEVENLABS_MODEL_ID", "eleven_turbo_v2")
+    ELEVENLABS_OUTPUT_FORMAT = os.getenv("ELEVENLABS_OUTPUT_FORMAT", "mp3_44100_128")
+    ELEVENLABS_TIMEOUT = float(os.getenv("ELEVENLABS_TIMEOUT", "10"))
+
+    # Pooled ElevenLabs HTTP client: keep-alive pool size, timeouts and retry backoff
+    ELEVENLABS_POOL_SIZE = int(os.getenv("ELEVENLABS_POOL_SIZE", "10"))
+    ELEVENLABS_CONNECT_TIMEOUT = float(os.getenv("ELEVENLABS_CONNECT_TIMEOUT", "5"))
+    ELEVENLABS_READ_TIMEOUT = float(os.getenv("ELEVENLABS_READ_TIMEOUT", "60"))
+    ELEVENLABS_MAX_RETRIES = int(os.getenv("ELEVENLABS_MAX_RETRIES", "3"))
+    ELEVENLABS_BACKOFF_BASE = float(os.getenv("ELEVENLABS_BACKOFF_BASE", "0.5"))
+    ELEVENLABS_BACKOFF_MAX = float(os.getenv("ELEVENLABS_BACKOFF_MAX", "8"))
+
+    # Minimum characters buffered before a sentence is handed to the speech stream
+    SPEECH_MIN_SENTENCE_CHARS = int(os.getenv("SPEECH_MIN_SENTENCE_CHARS", "20"))
+
+    # OpenAI request timeout and the shared limiter: in-flight cap, token budget,
+    # how long a caller waits for a slot, retry backoff, and an optional Redis URL
+    # that coordinates all web and Celery processes (unset: per-process limits)
+    OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "40000"))
+    LLM_ACQUIRE_TIMEOUT = float(os.getenv("LLM_ACQUIRE_TIMEOUT", "5"))
+    LLM_LEASE_TTL = float(os.getenv("LLM_LEASE_TTL", "120"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    LLM_LIMITER_REDIS_URL = os.getenv("LLM_LIMITER_REDIS_URL")
+
+    # ASGI server (app/asgi.py): threads running the Flask routes it falls back to
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "10"))
+
+    # /respond/batch: max items per request and LLM calls run concurrently per batch
+    RESPOND_BATCH_MAX_ITEMS = int(os.getenv("RESPOND_BATCH_MAX_ITEMS", "100"))
+    RESPOND_BATCH_PARALLELISM = int(os.getenv("RESPOND_BATCH_PARALLELISM", "4"))
+
+    # Opt-in LLM response cache: in-process LRU size, whether the SQLite tier is
+    # shared across processes, variants collected per prompt before hits are
+    # served, and seconds a response lives per prompt mode (0: never cached).
+    # Reflection and planning replies are personal, so they are not cached by default.
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_SHARED = os.getenv("LLM_CACHE_SHARED", "true").lower() == "true"
+    LLM_CACHE_MAXSIZE = int(os.getenv("LLM_CACHE_MAXSIZE", "1000"))
+    LLM_CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "3"))
+    LLM_CACHE_DEFAULT_TTL = float(os.getenv("LLM_CACHE_DEFAULT_TTL", "3600"))
+    LLM_CACHE_MODE_TTLS = json.loads(os.getenv("LLM_CACHE_MODE_TTLS", json.dumps({
+        "affirmation": 86400,
+        "dopamenu": 86400,
+        "focus": 21600,
+        "planner": 0,
+        "reflection": 0
+    })))
+
+    # Conversation memory: prompt token budget for summary plus recent turns,
+    # target length of the rolling summary, and the minimum seconds between
+    # summary refreshes per conversation
+    CONVERSATION_MEMORY_ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "true").lower() == "true"
+    CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1200"))
+    CONVERSATION_SUMMARY_WORDS = int(os.getenv("CONVERSATION_SUMMARY_WORDS", "150"))
+    CONVERSATION_REFRESH_INTERVAL = float(os.getenv("CONVERSATION_REFRESH_INTERVAL", "120"))
+
+    # Journal retrieval: past entries most similar to a /respond message are
+    # added to its prompt. Embedder ("hashing" runs locally, "openai" uses the
+    # embeddings API), vector size, per-user index directory, matches injected,
+    # lowest cosine similarity kept, and longest excerpt per entry
+    RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+    RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "hashing")
+    RETRIEVAL_OPENAI_MODEL = os.getenv("RETRIEVAL_OPENAI_MODEL", "text-embedding-3-small")
+    RETRIEVAL_DIM = int(os.getenv("RETRIEVAL_DIM", "256"))
+    RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", "indexes/journal")
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+    RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.2"))
+    RETRIEVAL_MAX_CHARS = int(os.getenv("RETRIEVAL_MAX_CHARS", "400"))
+
+    # Journal access (search, tags, export): a server-to-server key allowed to
+    # act for any user, and the secret that signs per-user access tokens
+    API_KEY = os.getenv("API_KEY")
+    USER_TOKEN_SECRET = os.getenv("USER_TOKEN_SECRET")
+
+    # Journal search: default and maximum results per page
+    JOURNAL_SEARCH_PAGE_SIZE = int(os.getenv("JOURNAL_SEARCH_PAGE_SIZE", "20"))
+    JOURNAL_SEARCH_MAX_PAGE_SIZE = int(os.getenv("JOURNAL_SEARCH_MAX_PAGE_SIZE", "100"))
+
+    # Journal export: entries fetched per cursor batch, hours a finished export
+    # and its file are kept before the beat purge removes them, and an optional
+    # explicit wkhtmltopdf binary for PDF exports (default: found on PATH)
+    JOURNAL_EXPORT_BATCH_SIZE = int(os.getenv("JOURNAL_EXPORT_BATCH_SIZE", "500"))
+    JOURNAL_EXPORT_MAX_AGE_HOURS = float(os.getenv("JOURNAL_EXPORT_MAX_AGE_HOURS", "24"))
+    WKHTMLTOPDF_PATH = os.getenv("WKHTMLTOPDF_PATH")
+
+    # Whisper transcription: upload size limit, chunk length and overlap for long
+    # recordings (chunking needs ffmpeg), and chunks transcribed concurrently
+    WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+    TRANSCRIBE_MAX_UPLOAD_BYTES = int(os.getenv("TRANSCRIBE_MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+    # Flask refuses any request body past this with a 413 before Werkzeug parses
+    # or spools it; the largest legitimate body is an audio upload plus its
+    # multipart framing
+    MAX_CONTENT_LENGTH = TRANSCRIBE_MAX_UPLOAD_BYTES + 1024 * 1024
+    TRANSCRIBE_CHUNK_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "120"))
+    TRANSCRIBE_OVERLAP_SECONDS = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "4"))
+    TRANSCRIBE_PARALLELISM = int(os.getenv("TRANSCRIBE_PARALLELISM", "4"))
+
+    # Single-flight coalescing of identical concurrent LLM and TTS calls; the
+    # optional Redis URL extends it across processes. Followers wait at most
+    # SINGLEFLIGHT_WAIT_TIMEOUT seconds before calling upstream themselves.
+    SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+    SINGLEFLIGHT_REDIS_URL = os.getenv("SINGLEFLIGHT_REDIS_URL")
+    SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", "90"))
+    SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "120"))
+    SINGLEFLIGHT_RESULT_TTL = float(os.getenv("SINGLEFLIGHT_RESULT_TTL", "10"))
+
     # Optional: Celery configuration can also be added here
     CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
     CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
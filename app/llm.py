@@ -1,21 +1,30 @@
-import os
-from openai import OpenAI
-
-client = OpenAI(api_key=Config.OPENAI_API_KEY,
-api_key=Config.OPENAI_API_KEY)
-import requests
-from datetime import datetime
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+from openai import OpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
 from app.config import Config
+from app.utils.registry import get_registry
+from app.utils.tts_cache import get_tts_cache, tts_cache_key
+from app.utils.elevenlabs import get_elevenlabs_client
+from app.utils.llm_limiter import get_llm_limiter, estimate_tokens, parse_reset, LLMOverloaded
+from app.utils.response_cache import get_response_cache, response_cache_key
+from app.utils.singleflight import get_single_flight
+from app.utils.transcription import transcribe_file
 
 # === Setup Keys & Paths ===
-if not openai.api_key:
+# Retries are handled by the shared limiter, so the SDK's own are disabled.
+client = OpenAI(
+    api_key=Config.OPENAI_API_KEY, timeout=Config.OPENAI_TIMEOUT, max_retries=0
+) if Config.OPENAI_API_KEY else None
+MAX_COMPLETION_TOKENS = 500
+TEMPERATURE = 0.85
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
 
 ELEVENLABS_API_KEY = Config.ELEVENLABS_API_KEY
 AUDIO_OUTPUT_DIR = Path(Config.AUDIO_OUTPUT_DIR)
 AUDIO_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-VOICE_MAP = Config.VOICE_MAP
+ELEVENLABS_VOICE_SETTINGS = Config.ELEVENLABS_VOICE_SETTINGS
 
 class LLMEngine:
     def __init__(self, model: str = "gpt-4", debug: bool = True):
@@ -31,17 +40,19 @@ class LLMEngine:
         """
         self.model = model
         self.debug = debug
-        if not openai.api_key:
-        if not openai.api_key:
+        if client is None:
             raise Exception("OPENAI_API_KEY is not set.")
 
-    def generate_response(self, prompt: str, system_msg: str = "You are a helpful assistant.") -> str:
+    def generate_response(self, prompt: str, system_msg: str = "You are a helpful assistant.", mode: Optional[str] = None,
+                          history: Optional[list] = None) -> str:
         """
         Generates a response from the OpenAI ChatCompletion API given a prompt.
         
         Args:
             prompt (str): The user prompt.
             system_msg (str): The system message to guide the response.
+            mode (str): The prompt mode, which sets how long the reply may be cached.
+            history (list): Earlier conversation messages (see app.utils.conversation).
         
         Returns:
             str: The generated response from the assistant.
@@ -52,19 +63,17 @@ class LLMEngine:
         if self.debug:
             print(f"[DEBUG] Generating response: {prompt}", flush=True)
         try:
-            response = client.chat.completions.create(model=self.model,
-            messages=[
+            return self._chat([
                 {"role": "system", "content": system_msg},
+                *(history or []),
                 {"role": "user", "content": prompt}
-            ],
-            temperature=0.85,
-            max_tokens=500)
-            return response.choices[0].message.content
+            ], mode)
         except Exception as e:
             print(f"[DEBUG] Error generating response: {e}", flush=True)
             raise
 
-    def generate_archetype_prompt(self, user_input: str, tone: str, template: str, archetype: str) -> str:
+    def generate_archetype_prompt(self, user_input: str, tone: str, template: str, archetype: str, mode: Optional[str] = None,
+                                  history: Optional[list] = None) -> str:
         """
         Generates a tailored response based on an archetype, tone, and template.
         
@@ -73,6 +82,8 @@ class LLMEngine:
             tone (str): The tone to be applied.
             template (str): The prompt template.
             archetype (str): The selected archetype.
+            mode (str): The prompt mode, which sets how long the reply may be cached.
+            history (list): Earlier conversation messages (see app.utils.conversation).
         
         Returns:
             str: The generated response from the assistant.
@@ -80,20 +91,205 @@ class LLMEngine:
         Raises:
             Exception: If the API call fails.
         """
-        messages = [
+        messages = self.build_archetype_messages(user_input, tone, template, archetype, history)
+        if self.debug:
+            print(f"[DEBUG] Archetype Prompt: {messages}", flush=True)
+        try:
+            return self._chat(messages, mode)
+        except Exception as e:
+            print(f"[DEBUG] Error in archetype prompt: {e}", flush=True)
+            raise
+
+    @staticmethod
+    def build_archetype_messages(user_input: str, tone: str, template: str, archetype: str, history: Optional[list] = None) -> list:
+        """
+        Builds the chat messages used for archetype-styled responses.
+        
+        Args:
+            user_input (str): The user input to be processed.
+            tone (str): The tone to be applied.
+            template (str): The prompt template.
+            archetype (str): The selected archetype.
+            history (list): Earlier conversation messages, placed before the user message.
+        
+        Returns:
+            list: The system, history and user messages.
+        """
+        return [
             {"role": "system", "content": f"You are Caelum Wren in {archetype} mode. Tone: {tone}"},
+            *(history or []),
             {"role": "user", "content": f"{template}\nUser input: \"{user_input}\""}
         ]
+
+    def summarize_conversation(self, previous_summary: str, turns: list) -> str:
+        """
+        Folds conversation turns into the rolling summary used by conversation memory.
+        
+        Args:
+            previous_summary (str): The current summary ("" if none).
+            turns (list): {"role", "content"} dicts, oldest first.
+        
+        Returns:
+            str: The updated summary.
+        """
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        return self._chat([
+            {"role": "system", "content": (
+                "You maintain a running summary of a conversation between a user and Caelum, "
+                "an ADHD support assistant. Keep the user's facts, goals, preferences, feelings "
+                f"and open commitments. Reply with the updated summary only, under {Config.CONVERSATION_SUMMARY_WORDS} words."
+            )},
+            {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ])
+
+    @contextmanager
+    def _completion(self, messages: list, stream: bool = False):
+        """
+        Runs one chat completion under the shared limiter, retrying rate limits,
+        timeouts and 5xx errors with jittered backoff. The limiter slot is held
+        until the caller leaves the block, i.e. for the whole stream.
+        
+        Raises:
+            LLMOverloaded: If OpenAI stays rate-limited or no slot frees up in time.
+        """
+        limiter = get_llm_limiter()
+        estimated = estimate_tokens(messages, MAX_COMPLETION_TOKENS)
+        attempt = 0
+        while True:
+            with limiter.slot(estimated):
+                try:
+                    raw = client.chat.completions.with_raw_response.create(model=self.model,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_COMPLETION_TOKENS,
+                    stream=stream)
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                    if isinstance(e, RateLimitError):
+                        limiter.on_rate_limited(parse_reset(e.response.headers.get("retry-after")))
+                else:
+                    limiter.observe_headers(raw.headers)
+                    limiter.on_success()
+                    result = raw.parse()
+                    if not stream and getattr(result, "usage", None):
+                        limiter.record_usage(estimated, result.usage.total_tokens)
+                    yield result
+                    return
+            if attempt >= Config.LLM_MAX_RETRIES:
+                if isinstance(error, RateLimitError):
+                    raise LLMOverloaded() from error
+                raise error
+            if self.debug:
+                print(f"[DEBUG] OpenAI call failed ({error.__class__.__name__}), retrying", flush=True)
+            time.sleep(limiter.backoff(attempt))
+            attempt += 1
+
+    def _cache_key(self, messages: list, mode: Optional[str]) -> Optional[str]:
+        # None when the response cache is off or this mode is never cached.
+        cache = get_response_cache()
+        if cache is None or cache.ttl_for(mode) <= 0:
+            return None
+        return response_cache_key(self.model, messages, TEMPERATURE, MAX_COMPLETION_TOKENS)
+
+    def _chat(self, messages: list, mode: Optional[str] = None) -> str:
+        key = self._cache_key(messages, mode)
+        if key:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                if self.debug:
+                    print("[DEBUG] Response cache hit", flush=True)
+                return cached
+
+        def complete():
+            with self._completion(messages) as response:
+                text = response.choices[0].message.content
+            # Cached by the leader only, so followers don't fill every variant slot with this reply.
+            if key:
+                get_response_cache().put(key, text, mode)
+            return text
+
+        # Identical concurrent requests share one completion.
+        flight = get_single_flight()
+        if flight is None:
+            return complete()
+        return flight.do("llm:" + response_cache_key(self.model, messages, TEMPERATURE, MAX_COMPLETION_TOKENS), complete)
+
+    def _stream_chat(self, messages: list, mode: Optional[str] = None) -> Iterator[str]:
+        key = self._cache_key(messages, mode)
+        if key:
+            cached = get_response_cache().get(key)
+            if cached is not None:
+                if self.debug:
+                    print("[DEBUG] Response cache hit", flush=True)
+                yield cached
+                return
+        parts = []
+        with self._completion(messages, stream=True) as stream:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        # Only a stream that ran to completion is cached.
+        if key:
+            get_response_cache().put(key, "".join(parts), mode)
+
+    def stream_response(self, prompt: str, system_msg: str = "You are a helpful assistant.", mode: Optional[str] = None) -> Iterator[str]:
+        """
+        Streaming counterpart of generate_response: yields text deltas as they arrive.
+        A cached reply is yielded as a single delta.
+        
+        Args:
+            prompt (str): The user prompt.
+            system_msg (str): The system message to guide the response.
+            mode (str): The prompt mode, which sets how long the reply may be cached.
+        
+        Yields:
+            str: Successive fragments of the assistant's response.
+        
+        Raises:
+            Exception: If the API call fails.
+        """
         if self.debug:
-            print(f"[DEBUG] Archetype Prompt: {messages}", flush=True)
+            print(f"[DEBUG] Streaming response: {prompt}", flush=True)
         try:
-            response = client.chat.completions.create(model=self.model,
-            messages=messages,
-            temperature=0.85,
-            max_tokens=500)
-            return response.choices[0].message.content
+            yield from self._stream_chat([
+                {"role": "system", "content": system_msg},
+                {"role": "user", "content": prompt}
+            ], mode)
         except Exception as e:
-            print(f"[DEBUG] Error in archetype prompt: {e}", flush=True)
+            print(f"[DEBUG] Error streaming response: {e}", flush=True)
+            raise
+
+    def stream_archetype_prompt(self, user_input: str, tone: str, template: str, archetype: str, mode: Optional[str] = None,
+                                history: Optional[list] = None) -> Iterator[str]:
+        """
+        Streaming counterpart of generate_archetype_prompt: yields text deltas as they arrive.
+        A cached reply is yielded as a single delta.
+        
+        Args:
+            user_input (str): The user input to be processed.
+            tone (str): The tone to be applied.
+            template (str): The prompt template.
+            archetype (str): The selected archetype.
+            mode (str): The prompt mode, which sets how long the reply may be cached.
+            history (list): Earlier conversation messages (see app.utils.conversation).
+        
+        Yields:
+            str: Successive fragments of the assistant's response.
+        
+        Raises:
+            Exception: If the API call fails.
+        """
+        messages = self.build_archetype_messages(user_input, tone, template, archetype, history)
+        if self.debug:
+            print(f"[DEBUG] Streaming Archetype Prompt: {messages}", flush=True)
+        try:
+            yield from self._stream_chat(messages, mode)
+        except Exception as e:
+            print(f"[DEBUG] Error streaming archetype prompt: {e}", flush=True)
             raise
 
     def transcribe_audio_whisper(self, file_path: str) -> str:
@@ -111,15 +307,37 @@ class LLMEngine:
         """
         try:
             with open(file_path, "rb") as audio_file:
-                result = client.audio.transcribe("whisper-1", audio_file)
+                result = client.audio.transcriptions.create(model=Config.WHISPER_MODEL, file=audio_file)
             return result.text
         except Exception as e:
             print(f"[DEBUG] Whisper transcription error: {e}", flush=True)
             raise
 
+    def transcribe_audio(self, file_path: str, content_hash: str) -> dict:
+        """
+        Transcribes a stored recording through the chunked, cached Whisper pipeline.
+        
+        Args:
+            file_path (str): The path to the audio file.
+            content_hash (str): The file's SHA-256, as returned by save_stream().
+        
+        Returns:
+            dict: {"text", "content_hash", "chunks", "cached"}.
+        
+        Raises:
+            Exception: If transcription fails.
+        """
+        try:
+            return transcribe_file(file_path, content_hash, self.transcribe_audio_whisper)
+        except Exception as e:
+            print(f"[DEBUG] Transcription pipeline error: {e}", flush=True)
+            raise
+
     def generate_tts_elevenlabs(self, text: str, archetype: str = "Beau") -> str:
         """
         Generates a TTS audio file using the ElevenLabs API based on the specified archetype.
+        Identical (voice, settings, text) requests are served from the TTS cache, and
+        concurrent identical requests share one synthesis.
         
         Args:
             text (str): The text to synthesize.
@@ -131,42 +349,33 @@ class LLMEngine:
         Raises:
             Exception: If the TTS API call fails.
         """
-        voice_id = VOICE_MAP.get(archetype, VOICE_MAP["Beau"])
-        output_file = AUDIO_OUTPUT_DIR / f"{archetype}_{datetime.now().timestamp()}.mp3"
-
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        headers = {
-            "xi-api-key": ELEVENLABS_API_KEY,
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "text": text,
-            "voice_settings": {
-                "stability": 0.7,
-                "similarity_boost": 0.8
-            }
-        }
+        voice_id = get_registry().get_voice_id(archetype)
+
+        def synthesize(text: str, output_file: str):
+            get_elevenlabs_client().synthesize_to_file(voice_id, text, output_file, ELEVENLABS_VOICE_SETTINGS)
+
+        def get_or_create():
+            return str(get_tts_cache().get_or_create("elevenlabs", voice_id, ELEVENLABS_VOICE_SETTINGS, text, synthesize))
 
         try:
-            response = requests.post(url, headers=headers, json=payload)
-            if response.status_code == 200:
-                with open(output_file, "wb") as f:
-                    f.write(response.content)
-                return str(output_file)
-            else:
-                raise Exception(f"ElevenLabs API failed: {response.status_code} – {response.text}")
+            flight = get_single_flight()
+            if flight is None:
+                return get_or_create()
+            return flight.do("tts:" + tts_cache_key("elevenlabs", voice_id, ELEVENLABS_VOICE_SETTINGS, text), get_or_create)
         except Exception as e:
             print(f"[DEBUG] ElevenLabs TTS error: {e}", flush=True)
             raise
 
     def set_voice_map(self, new_map: dict):
         """
-        Updates the global voice map with new mappings.
+        Updates the voice map with new mappings.
+        The mappings are persisted through the archetype registry, so every
+        web and Celery process picks them up without a restart.
         
         Args:
             new_map (dict): A dictionary of voice mappings to update.
         """
-        global VOICE_MAP
-        VOICE_MAP.update(new_map)
+        registry = get_registry()
+        registry.set_voice_map(new_map)
         if self.debug:
-            print(f"[DEBUG] Voice map updated: {VOICE_MAP}", flush=True)
+            print(f"[DEBUG] Voice map updated: {registry.voice_map()}", flush=True)
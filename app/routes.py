@@ -1,23 +1,33 @@
 import os 
 import uuid
-import sqlite3
 import requests
 import websocket
 import json
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context
-from gtts import gTTS
-from twilio.rest import Client
 from datetime import datetime
-from markdown import markdown
-import pdfkit
 from app.llm import LLMEngine
+from tasks import generate_reply_text, export_journal, remember_exchange
 from app.config import Config
+from app.utils.registry import get_registry
+from app.utils.idempotency import claim_message, release_message
+from app.utils.audio_store import get_audio_store, TERMINAL_MESSAGE_STATUSES
+from app.utils.sse import format_sse, wants_stream, prime, SSE_HEADERS
+from app.utils.llm_limiter import LLMOverloaded
+from app.utils.speech import iter_sentences, stream_speech
+from app.utils.transcription import save_stream, extension_for, discard_upload, UploadTooLarge
+from app.utils.conversation import build_context
+from app.utils.retrieval import search_journal, format_journal_context
+from app.utils.journal_search import search_entries, list_tags, InvalidCursor
+from app.utils.auth import is_authorized
+from app.utils.journal_export import create_export, get_export, set_export_status, EXPORT_FORMATS, EXPORT_DONE, EXPORT_FAILED
 from app.utils.helpers import (
     get_recent_mood_summary,
+    get_recent_mood_summaries,
     map_mood_to_archetype,
-    log_archetype_use,
+    queue_archetype_use,
     get_prompt_scaffold,
-    log_feedback_entry
+    queue_feedback_entry
 )
 
 # Define the blueprint first
@@ -34,34 +44,51 @@ llm = LLMEngine()
 # === TWILIO INTEGRATION === 📡
 @main.route('/webhook', methods=['POST'])
 def webhook():
+    """
+    Acknowledges an inbound WhatsApp message immediately and hands the reply
+    (LLM text, then gTTS audio) to the Celery pipeline in tasks.py. A voice
+    note is passed along to be transcribed by the pipeline.
+    Twilio retries of the same MessageSid attach to the first attempt instead
+    of starting another pipeline.
+    """
     sender = request.values.get('From')
     message_body = request.values.get('Body')
+    message_sid = request.values.get('MessageSid')
+    args = (sender, message_body, message_sid)
+    if (request.values.get('MediaContentType0') or '').startswith('audio/'):
+        args += (request.values.get('MediaUrl0'), request.values.get('MediaContentType0'))
     print(f"Received message from {sender}: {message_body}")
+    ack = Response("<?xml version='1.0' encoding='UTF-8'?><Response></Response>", mimetype='application/xml')
+
+    task_id = uuid.uuid4().hex
+    if message_sid:
+        claimed, existing = claim_message(message_sid, task_id=task_id)
+        if not claimed:
+            print(f"[DEBUG] Duplicate delivery of {message_sid}; attached to task {existing['task_id']} ({existing['status']})", flush=True)
+            return ack
 
     try:
-        generated_response = llm.generate_response(message_body)
+        generate_reply_text.apply_async(args=args, task_id=task_id)
     except Exception as e:
-        print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
-        generated_response = "I am sorry, I could not process your request."
-
-    audio_filename = f"response_{uuid.uuid4().hex}.mp3"
-    audio_dir = os.path.join(os.getcwd(), "app", "static", "audio")
-    os.makedirs(audio_dir, exist_ok=True)
-    audio_filepath = os.path.join(audio_dir, audio_filename)
+        # Let Twilio retry later rather than silently dropping the message.
+        print(f"[DEBUG] Error enqueuing reply pipeline: {e}", flush=True)
+        if message_sid:
+            release_message(message_sid)
+        return Response("Reply pipeline unavailable", status=503)
 
-    tts = gTTS(generated_response)
-    tts.save(audio_filepath)
-    media_url = f"https://duck-healthy-easily.ngrok-free.app/static/audio/{audio_filename}"
-
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-
-    client.messages.create(body=generated_response, from_=twilio_number, to=sender)
-    client.messages.create(media_url=[media_url], from_=twilio_number, to=sender)
-
-    return Response("<?xml version='1.0' encoding='UTF-8'?><Response></Response>", mimetype='application/xml')
+    return ack
 
 # === GENERIC LLM ENDPOINTS === 🧠
+def overloaded_response(error):
+    """
+    Returns a fast 503 telling the client when to retry, used when OpenAI
+    capacity is exhausted.
+    """
+    response = jsonify({"error": "overloaded", "message": str(error)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after or 1)
+    return response
+
 @main.route('/llm', methods=['POST'])
 def llm_endpoint():
     data = request.get_json()
@@ -69,9 +96,31 @@ def llm_endpoint():
     if not prompt:
         return Response("No prompt provided", status=400)
 
+    if wants_stream(request, data):
+        try:
+            deltas = prime(llm.stream_response(prompt))
+        except LLMOverloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            print(f"[DEBUG] Error streaming LLM response: {e}", flush=True)
+            return Response("Error generating response", status=500)
+
+        def event_stream():
+            try:
+                for delta in deltas:
+                    yield format_sse({"delta": delta})
+                yield format_sse({}, event="done")
+            except Exception as e:
+                print(f"[DEBUG] Error streaming LLM response: {e}", flush=True)
+                yield format_sse({"error": "Error generating response"}, event="error")
+
+        return Response(stream_with_context(event_stream()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
     try:
         response_text = llm.generate_response(prompt)
         return Response(response_text, mimetype="text/plain")
+    except LLMOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
         return Response("Error generating response", status=500)
@@ -83,13 +132,22 @@ def status_callback():
     error_code = request.values.get('ErrorCode')
     error_message = request.values.get('ErrorMessage')
     print(f"Status update: {message_sid}, {message_status}, {error_code}, {error_message}")
+    if message_sid and message_status in TERMINAL_MESSAGE_STATUSES:
+        get_audio_store().release_message_pins(message_sid)
     return Response("Status received", status=200)
 
 # === CAELUM INTEGRATION === 👤
-@main.route('/respond', methods=['POST'])
-def caelum_respond():
-    data = request.json
-    user_input = data.get("input")
+def build_respond_context(data, recent_moods=None, with_history=True):
+    """
+    Resolves archetype, tone, template and mood for a /respond payload and
+    logs the archetype use. Shared by the JSON and streaming responses.
+    /respond/batch passes ``recent_moods`` already looked up for the user.
+    With conversation memory on, a known user's earlier turns on the payload's
+    ``channel`` (default "respond") are loaded within the token budget. With
+    retrieval on, their most relevant past journal entries are added too.
+    """
+    raw_input = data.get("input")
+    user_input = raw_input
     archetype_name = data.get("custom_archetype")
     user_id = data.get("user_id", "anonymous")
     mode = data.get("mode")
@@ -98,7 +156,8 @@ def caelum_respond():
     template = None
 
     if not archetype_name:
-        recent_moods = get_recent_mood_summary(user_id, top_n=1)
+        if recent_moods is None:
+            recent_moods = get_recent_mood_summary(user_id, top_n=1)
         mood_based = map_mood_to_archetype(recent_moods[0]) if recent_moods else {
             "archetype": "Beau",
             "tone": "Warm, structured"
@@ -108,11 +167,8 @@ def caelum_respond():
     else:
         recent_moods = []
 
-    conn = sqlite3.connect("custom_archetypes.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT tone, template FROM archetypes WHERE name = ?", (archetype_name,))
-    row = cursor.fetchone()
-    conn.close()
+    registry = get_registry()
+    row = registry.get_prompt(archetype_name)
 
     if row:
         tone = tone or row[0]
@@ -122,26 +178,172 @@ def caelum_respond():
         template = "[Beau Mode]\nGently respond."
 
     mood_used = recent_moods[0] if recent_moods else "unspecified"
-    is_custom = archetype_name not in ["Beau", "Fox", "Jasper", "Theo", "Orion"]
-    log_archetype_use(user_id, archetype_name, is_custom, module="respond", mood=mood_used)
+    is_custom = not registry.is_builtin(archetype_name)
+    queue_archetype_use(user_id, archetype_name, is_custom, module="respond", mood=mood_used)
 
     if mode:
         scaffold = get_prompt_scaffold(mode)
         if scaffold:
             user_input = f"{scaffold}\n{user_input}"
 
+    channel = data.get("channel", "respond")
+    memory = with_history and Config.CONVERSATION_MEMORY_ENABLED and user_id != "anonymous"
+    history = build_context(user_id, channel)["messages"] if memory else []
+    if with_history and Config.RETRIEVAL_ENABLED and user_id != "anonymous" and raw_input:
+        try:
+            journal_context = format_journal_context(search_journal(user_id, raw_input))
+        except Exception as e:
+            print(f"[DEBUG] Journal retrieval failed: {e}", flush=True)
+            journal_context = None
+        if journal_context:
+            history = [journal_context, *history]
+
+    return {
+        "user_id": user_id,
+        "channel": channel,
+        "memory": memory,
+        "raw_input": raw_input,
+        "history": history,
+        "user_input": user_input,
+        "archetype": archetype_name,
+        "tone": tone,
+        "template": template,
+        "mood_used": mood_used,
+        "mode": mode
+    }
+
+def remember_reply(ctx, reply):
+    """
+    Stores a finished /respond exchange in the user's conversation memory.
+    """
+    if ctx["memory"] and reply:
+        remember_exchange(ctx["user_id"], ctx["channel"], ctx["raw_input"], reply)
+
+def remembering(deltas, ctx):
+    """
+    Passes stream deltas through and stores the full reply once the stream
+    completes.
+    """
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+        yield delta
+    remember_reply(ctx, "".join(parts))
+
+@main.route('/respond', methods=['POST'])
+def caelum_respond():
+    """
+    Generates an archetype-styled reply. With ``"stream": true`` (or
+    ``Accept: text/event-stream``) the reply is streamed as SSE ``delta``
+    frames followed by a trailing ``metadata`` event.
+    """
+    data = request.json
+    ctx = build_respond_context(data)
+    metadata = {
+        "archetype_used": ctx["archetype"],
+        "tone": ctx["tone"],
+        "mood_used": ctx["mood_used"],
+        "mode": ctx["mode"]
+    }
+
+    if wants_stream(request, data):
+        try:
+            deltas = prime(remembering(llm.stream_archetype_prompt(ctx["user_input"], ctx["tone"], ctx["template"], ctx["archetype"], ctx["mode"], ctx["history"]), ctx))
+        except LLMOverloaded as e:
+            return overloaded_response(e)
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+        def event_stream():
+            try:
+                for delta in deltas:
+                    yield format_sse({"delta": delta})
+                yield format_sse(metadata, event="metadata")
+            except Exception as e:
+                yield format_sse({"error": str(e)}, event="error")
+
+        return Response(stream_with_context(event_stream()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
     try:
-        result = llm.generate_archetype_prompt(user_input, tone, template, archetype_name)
-        return jsonify({
-            "response": result,
-            "archetype_used": archetype_name,
-            "tone": tone,
-            "mood_used": mood_used,
-            "mode": mode
-        })
+        result = llm.generate_archetype_prompt(ctx["user_input"], ctx["tone"], ctx["template"], ctx["archetype"], ctx["mode"], ctx["history"])
+        remember_reply(ctx, result)
+        return jsonify({"response": result, **metadata})
+    except LLMOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def respond_batch_item(ctx):
+    """
+    Generates one /respond/batch reply, reporting failure as an item error
+    instead of failing the whole batch.
+    """
+    try:
+        result = llm.generate_archetype_prompt(ctx["user_input"], ctx["tone"], ctx["template"], ctx["archetype"], ctx["mode"])
+    except LLMOverloaded as e:
+        return {"error": "overloaded", "retry_after": e.retry_after or 1}
+    except Exception as e:
+        return {"error": str(e)}
+    return {
+        "response": result,
+        "archetype_used": ctx["archetype"],
+        "tone": ctx["tone"],
+        "mood_used": ctx["mood_used"],
+        "mode": ctx["mode"]
+    }
+
+@main.route('/respond/batch', methods=['POST'])
+def caelum_respond_batch():
+    """
+    Generates /respond replies for many users in one request. Takes
+    ``{"items": [{user_id, input, mode, custom_archetype}, ...]}``; moods are
+    looked up with one grouped query and the LLM calls run concurrently, at
+    most Config.RESPOND_BATCH_PARALLELISM at a time. Results come back in
+    input order, each holding either a reply or an ``error``.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list."}), 400
+    if len(items) > Config.RESPOND_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {Config.RESPOND_BATCH_MAX_ITEMS} items per batch."}), 400
+
+    # Invalid items get their own error and never reach the mood query.
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("input"), str) or not item["input"]:
+            results[index] = {"error": "Each item needs an input."}
+        elif not isinstance(item.get("user_id", "anonymous"), str):
+            results[index] = {"error": "user_id must be a string."}
+        else:
+            valid.append(index)
+
+    mood_users = [items[index].get("user_id", "anonymous") for index in valid
+                  if not items[index].get("custom_archetype")]
+    moods = get_recent_mood_summaries(mood_users, top_n=1)
+
+    pending = []
+    for index in valid:
+        item = items[index]
+        try:
+            ctx = build_respond_context(item, recent_moods=moods.get(item.get("user_id", "anonymous")), with_history=False)
+        except Exception as e:
+            results[index] = {"error": str(e)}
+            continue
+        pending.append((index, ctx))
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(Config.RESPOND_BATCH_PARALLELISM, len(pending))) as pool:
+            replies = pool.map(respond_batch_item, [ctx for _, ctx in pending])
+            for (index, _), reply in zip(pending, replies):
+                results[index] = reply
+
+    for index, item in enumerate(items):
+        user_id = item.get("user_id", "anonymous") if isinstance(item, dict) else None
+        results[index] = {"index": index, "user_id": user_id, **results[index]}
+    return jsonify({"results": results})
+
 @main.route('/feedback/respond', methods=['POST'])
 def feedback_respond():
     data = request.get_json()
@@ -157,7 +359,7 @@ def feedback_respond():
         return jsonify({"error": "Rating must be between 1 and 5."}), 400
 
     try:
-        log_feedback_entry(
+        queue_feedback_entry(
             user_id=user_id,
             archetype=archetype,
             mood=mood,
@@ -170,6 +372,149 @@ def feedback_respond():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# === JOURNAL ACCESS === 🔐
+def journal_access_denied(user_id):
+    """
+    Returns a 401 response unless the request carries a valid API key or a
+    user token for ``user_id`` (see app/utils/auth.py), else None.
+    """
+    if is_authorized(user_id, request.headers):
+        return None
+    return jsonify({"error": "A valid X-User-Token or X-API-Key is required."}), 401
+
+# === JOURNAL EXPORT === 📄
+def export_links(export_id):
+    return {
+        "status_url": f"/journal/export/{export_id}",
+        "download_url": f"/journal/export/{export_id}/download"
+    }
+
+@main.route('/journal/export', methods=['POST'])
+def journal_export():
+    """
+    Queues a Markdown or PDF export of a user's journal. Rendering happens in
+    a Celery worker; poll the status URL, then fetch the download URL.
+    """
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    fmt = data.get("format", "markdown")
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    denied = journal_access_denied(user_id)
+    if denied:
+        return denied
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(EXPORT_FORMATS)}."}), 400
+
+    export_id = create_export(user_id, fmt)
+    try:
+        export_journal.delay(export_id)
+    except Exception as e:
+        print(f"[DEBUG] Error enqueuing journal export: {e}", flush=True)
+        set_export_status(export_id, EXPORT_FAILED, error="Export queue unavailable")
+        return jsonify({"error": "Export queue unavailable"}), 503
+    return jsonify({"job_id": export_id, "status": "queued", **export_links(export_id)}), 202
+
+@main.route('/journal/export/<export_id>', methods=['GET'])
+def journal_export_status(export_id):
+    job = get_export(export_id)
+    if job is None:
+        return jsonify({"error": "Export not found."}), 404
+    denied = journal_access_denied(job["user_id"])
+    if denied:
+        return denied
+    return jsonify({
+        "job_id": export_id,
+        "status": job["status"],
+        "format": job["format"],
+        "error": job["error"],
+        **export_links(export_id)
+    })
+
+@main.route('/journal/export/<export_id>/download', methods=['GET'])
+def journal_export_download(export_id):
+    job = get_export(export_id)
+    if job is None:
+        return jsonify({"error": "Export not found."}), 404
+    denied = journal_access_denied(job["user_id"])
+    if denied:
+        return denied
+    if job["status"] != EXPORT_DONE or not job["path"] or not os.path.exists(job["path"]):
+        return jsonify({"error": "Export is not ready.", "status": job["status"]}), 409
+    mimetype = "application/pdf" if job["format"] == "pdf" else "text/markdown"
+    download_name = f"journal-{job['user_id']}{EXPORT_FORMATS[job['format']]}"
+    return send_file(job["path"], mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+# === JOURNAL SEARCH === 🔎
+@main.route('/journal/search', methods=['GET'])
+def journal_search():
+    """
+    Searches a user's journal. ``q`` is matched word by word (``"phrases"`` and
+    ``prefix*`` work) and ranked by relevance, with matches highlighted in each
+    snippet; each ``tag`` parameter narrows the results to entries carrying it.
+    Pass ``next_cursor`` back as ``cursor`` for the next page.
+    """
+    user_id = request.args.get("user_id")
+    query = request.args.get("q", "")
+    tags = request.args.getlist("tag")
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    denied = journal_access_denied(user_id)
+    if denied:
+        return denied
+    if not query.strip() and not tags:
+        return jsonify({"error": "q or tag is required."}), 400
+    try:
+        result = search_entries(user_id, query, tags, request.args.get("limit", type=int), request.args.get("cursor"))
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@main.route('/journal/tags', methods=['GET'])
+def journal_tags():
+    """
+    Lists the tags a user has used, most used first.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "user_id is required."}), 400
+    denied = journal_access_denied(user_id)
+    if denied:
+        return denied
+    return jsonify({"tags": list_tags(user_id, request.args.get("limit", type=int))})
+
+# === SPEECH-TO-TEXT === 🎙️
+@main.route('/transcribe', methods=['POST'])
+def transcribe():
+    """
+    Transcribes an uploaded recording with Whisper. Accepts a multipart
+    ``file`` field or a raw audio body; either way the upload is streamed to
+    Config.UPLOAD_DIR in chunks rather than read into memory. Long recordings
+    are transcribed as parallel chunks, and repeat uploads come from the cache.
+    The stored upload is deleted once transcribed.
+    """
+    max_bytes = Config.TRANSCRIBE_MAX_UPLOAD_BYTES
+    # Refuse a declared oversize body before reading any of it.
+    if request.content_length and request.content_length > max_bytes:
+        return jsonify({"error": f"Upload exceeds {max_bytes} bytes."}), 413
+    upload = request.files.get("file")
+    try:
+        if upload is not None:
+            path, content_hash, size = save_stream(upload.stream, extension=extension_for(upload.mimetype, upload.filename))
+        else:
+            path, content_hash, size = save_stream(request.stream, extension=extension_for(request.mimetype))
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    try:
+        if size == 0:
+            return jsonify({"error": "No audio provided."}), 400
+        result = llm.transcribe_audio(path, content_hash)
+        return jsonify({**result, "bytes": size})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        discard_upload(path)
+
 # === TEXT-TO-SPEECH SERVICES === 🔊
 @main.route('/tts-stream', methods=['POST'])
 def tts_stream():
@@ -180,7 +525,7 @@ def tts_stream():
     data = request.json
     text = data.get("text")
     archetype = data.get("archetype", "Beau")
-    voice_id = Config.VOICE_MAP.get(archetype, Config.VOICE_MAP["Beau"])
+    voice_id = get_registry().get_voice_id(archetype)
 
     def audio_stream():
         url = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
@@ -193,10 +538,7 @@ def tts_stream():
 
         payload = {
             "text": text,
-            "voice_settings": {
-                "stability": 0.7,
-                "similarity_boost": 0.8
-            }
+            "voice_settings": Config.ELEVENLABS_VOICE_SETTINGS
         }
 
         ws.send(json.dumps(payload))
@@ -214,6 +556,33 @@ def tts_stream():
 
     return Response(stream_with_context(audio_stream()), mimetype="audio/mpeg")
 
+@main.route('/speak-stream', methods=['POST'])
+def speak_stream():
+    """
+    Generates a /respond reply and streams it as speech. LLM deltas are cut at
+    sentence boundaries and fed into one ElevenLabs stream-input session while
+    generation continues, so audio starts after the first sentence.
+    Accepts the same payload as /respond.
+    """
+    data = request.json
+    ctx = build_respond_context(data)
+    voice_id = get_registry().get_voice_id(ctx["archetype"])
+    try:
+        deltas = prime(remembering(llm.stream_archetype_prompt(ctx["user_input"], ctx["tone"], ctx["template"], ctx["archetype"], ctx["mode"], ctx["history"]), ctx))
+    except LLMOverloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    def audio_stream():
+        try:
+            yield from stream_speech(iter_sentences(deltas), voice_id)
+        except Exception as e:
+            print(f"[DEBUG] Speech streaming error: {e}", flush=True)
+
+    headers = {"X-Archetype-Used": ctx["archetype"], "Cache-Control": "no-cache"}
+    return Response(stream_with_context(audio_stream()), mimetype="audio/mpeg", headers=headers)
+
 @main.route('/tts-download', methods=['POST'])
 def tts_download():
     """
@@ -0,0 +1,234 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from app.config import Config
+from app.utils.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# === Size-Bounded Audio Store ===
+#
+# Every MP3 under Config.AUDIO_OUTPUT_DIR is tracked in audio_files with its
+# size and last access time. Files live in two levels of hash-prefix shard
+# directories (ab/cd/name.mp3) so no directory grows unbounded. A periodic
+# sweep evicts files older than the age limit, then least-recently-used files
+# until the byte budget is met. Files referenced by an outbound Twilio media
+# message are pinned and skipped until the message reaches a final status or
+# the pin expires.
+#
+# Accesses are written straight to audio_files, so a sweep running in another
+# process (the Celery beat worker) sees every recent hit. A file already
+# touched within TOUCH_RESOLUTION seconds is not rewritten, so a hot clip costs
+# one write per interval rather than one per request.
+
+TOUCH_RESOLUTION = 60
+TOUCH_SQL = "UPDATE audio_files SET last_access = ? WHERE rel_path = ? AND last_access < ?"
+TERMINAL_MESSAGE_STATUSES = {"delivered", "read", "failed", "undelivered", "canceled"}
+
+
+class AudioStore:
+    def __init__(self, root=None, max_bytes=None, max_age=None, db_path=None):
+        """
+        Initializes an audio store rooted at ``root``.
+
+        Args:
+            root (str): Directory holding the audio files (default Config.AUDIO_OUTPUT_DIR).
+            max_bytes (int): Byte budget enforced by sweep() (default Config.AUDIO_MAX_BYTES).
+            max_age (float): Max file age in seconds (default Config.AUDIO_MAX_AGE_DAYS days).
+            db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        """
+        self.root = Path(root or Config.AUDIO_OUTPUT_DIR)
+        self.max_bytes = Config.AUDIO_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = Config.AUDIO_MAX_AGE_DAYS * 86400 if max_age is None else max_age
+        self.db_path = db_path
+
+    def rel_path(self, path):
+        """
+        Returns a file's path relative to the store root, using forward slashes.
+        """
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def path_for(self, filename):
+        """
+        Returns the sharded location for a file name (root/ab/cd/filename).
+
+        Args:
+            filename (str): The file name, e.g. "<sha256>.mp3".
+
+        Returns:
+            Path: The absolute-or-relative path under the store root.
+        """
+        digest = hashlib.sha1(filename.encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / digest[2:4] / filename
+
+    def register(self, path):
+        """
+        Starts tracking a newly written file.
+
+        Args:
+            path (str): Path to the file under the store root.
+        """
+        now = time.time()
+        with get_connection(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO audio_files (rel_path, bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?)
+            ''', (self.rel_path(path), os.path.getsize(path), now, now))
+
+    def touch(self, path):
+        """
+        Records an access to a file.
+
+        Args:
+            path (str): Path to the file under the store root.
+        """
+        now = time.time()
+        with get_connection(self.db_path) as conn:
+            conn.execute(TOUCH_SQL, (now, self.rel_path(path), now - TOUCH_RESOLUTION))
+
+    def pin(self, path, ttl=None):
+        """
+        Protects a file from eviction, e.g. while Twilio fetches it as media.
+
+        Args:
+            path (str): Path to the file under the store root.
+            ttl (float): Seconds before the pin lapses on its own (default Config.AUDIO_PIN_SECONDS).
+
+        Returns:
+            int: The pin id, for attach_pin().
+        """
+        expires_at = time.time() + (ttl or Config.AUDIO_PIN_SECONDS)
+        with get_connection(self.db_path) as conn:
+            cursor = conn.execute(
+                "INSERT INTO audio_pins (rel_path, expires_at) VALUES (?, ?)",
+                (self.rel_path(path), expires_at)
+            )
+            return cursor.lastrowid
+
+    def attach_pin(self, pin_id, message_sid):
+        """
+        Associates a pin with the outbound message that references the file,
+        so the status callback can release it.
+
+        Args:
+            pin_id (int): The id returned by pin().
+            message_sid (str): The outbound Twilio message sid.
+        """
+        with get_connection(self.db_path) as conn:
+            conn.execute("UPDATE audio_pins SET message_sid = ? WHERE pin_id = ?", (message_sid, pin_id))
+
+    def release_message_pins(self, message_sid):
+        """
+        Releases every pin held for an outbound message.
+
+        Args:
+            message_sid (str): The outbound Twilio message sid.
+        """
+        with get_connection(self.db_path) as conn:
+            conn.execute("DELETE FROM audio_pins WHERE message_sid = ?", (message_sid,))
+
+    def adopt_untracked(self):
+        """
+        Registers legacy files sitting directly in the store root (the old flat
+        layout) so they are subject to eviction. Shard directories are not scanned.
+
+        Returns:
+            int: The number of files adopted.
+        """
+        if not self.root.is_dir():
+            return 0
+        rows = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".mp3"):
+                    st = entry.stat()
+                    rows.append((self.rel_path(entry.path), st.st_size, st.st_mtime, st.st_atime))
+        with get_connection(self.db_path) as conn:
+            conn.executemany('''
+                INSERT OR IGNORE INTO audio_files (rel_path, bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+        return len(rows)
+
+    def sweep(self):
+        """
+        Evicts files past the age limit, then least-recently-used files until
+        the store fits its byte budget. Pinned files are never evicted.
+
+        Returns:
+            dict: {"evicted": int, "freed_bytes": int, "total_bytes": int}.
+        """
+        now = time.time()
+        self.adopt_untracked()
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute("DELETE FROM audio_pins WHERE expires_at <= ?", (now,))
+
+        unpinned = '''
+            NOT EXISTS (SELECT 1 FROM audio_pins p WHERE p.rel_path = f.rel_path AND p.expires_at > ?)
+        '''
+        victims = conn.execute(f'''
+            SELECT rel_path, bytes FROM audio_files f
+            WHERE created_at < ? AND {unpinned}
+        ''', (now - self.max_age, now)).fetchall()
+        victim_paths = {rel for rel, _ in victims}
+
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM audio_files").fetchone()[0]
+        total -= sum(size for _, size in victims)
+        if total > self.max_bytes:
+            for rel, size in conn.execute(f'''
+                SELECT rel_path, bytes FROM audio_files f
+                WHERE {unpinned}
+                ORDER BY last_access
+            ''', (now,)):
+                if total <= self.max_bytes:
+                    break
+                if rel in victim_paths:
+                    continue
+                victims.append((rel, size))
+                victim_paths.add(rel)
+                total -= size
+
+        evicted, freed = 0, 0
+        for rel, size in victims:
+            # Re-check the pin at delete time so a send that started after the
+            # victim list was built still keeps its file.
+            with conn:
+                deleted = conn.execute(f'''
+                    DELETE FROM audio_files AS f WHERE rel_path = ? AND {unpinned}
+                ''', (rel, time.time())).rowcount
+            if not deleted:
+                continue
+            try:
+                os.remove(self.root / rel)
+            except FileNotFoundError:
+                pass
+            evicted += 1
+            freed += size
+
+        if evicted:
+            logger.info(f"Audio sweep evicted {evicted} files ({freed} bytes).")
+        remaining = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM audio_files").fetchone()[0]
+        return {"evicted": evicted, "freed_bytes": freed, "total_bytes": remaining}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_audio_store():
+    """
+    Returns the process-wide audio store, creating it on first use.
+
+    Returns:
+        AudioStore: The shared store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = AudioStore()
+    return _store
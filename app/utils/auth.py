@@ -0,0 +1,52 @@
+import hmac
+import hashlib
+from app.config import Config
+
+# === Journal Access ===
+#
+# Endpoints that return a user's journal take the user_id from the request,
+# so the caller must prove it may act for that user. Two credentials work:
+#   X-User-Token - HMAC-SHA256 of the user_id under USER_TOKEN_SECRET, handed
+#                  to a client by whatever signs its users in
+#   X-API-Key    - the server-to-server API_KEY, which may act for any user
+# With neither setting configured every request is refused.
+
+USER_TOKEN_HEADER = "X-User-Token"
+API_KEY_HEADER = "X-API-Key"
+
+
+def sign_user_id(user_id, secret=None):
+    """
+    Returns the access token for a user.
+
+    Args:
+        user_id (str): The user the token is for.
+        secret (str): Signing secret. Defaults to Config.USER_TOKEN_SECRET.
+
+    Returns:
+        str: A hex HMAC-SHA256 of the user id.
+    """
+    secret = secret or Config.USER_TOKEN_SECRET
+    if not secret:
+        raise ValueError("USER_TOKEN_SECRET is not set.")
+    return hmac.new(secret.encode("utf-8"), user_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def is_authorized(user_id, headers):
+    """
+    Checks that a request may read or export ``user_id``'s journal.
+
+    Args:
+        user_id (str): The user the request acts for.
+        headers: The request headers.
+
+    Returns:
+        bool: True for a valid API key or a valid token for this user.
+    """
+    api_key = headers.get(API_KEY_HEADER)
+    if Config.API_KEY and api_key and hmac.compare_digest(api_key, Config.API_KEY):
+        return True
+    token = headers.get(USER_TOKEN_HEADER)
+    if Config.USER_TOKEN_SECRET and token and user_id:
+        return hmac.compare_digest(token, sign_user_id(user_id))
+    return False
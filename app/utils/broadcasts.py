@@ -0,0 +1,322 @@
+import time
+from datetime import datetime
+from app.utils.db import get_connection
+from app.utils.scheduler import schedule_rows
+
+# === Subscriptions & Broadcast Fan-Out ===
+#
+# A subscription is a recipient, their timezone and the programs they receive
+# ("morning", "evening", "focus"). A broadcast renders one program's message
+# once and snapshots its recipients into broadcast_recipients; Celery chunks
+# then claim and send to each recipient. Every recipient's outcome is stored,
+# so a broadcast interrupted by a crash resumes with only the recipients that
+# were never sent.
+
+BROADCAST_SENDING = "sending"
+BROADCAST_DONE = "done"
+
+RECIPIENT_PENDING = "pending"
+RECIPIENT_SENDING = "sending"
+RECIPIENT_SENT = "sent"
+RECIPIENT_FAILED = "failed"
+
+
+# === Subscriptions ===
+
+def subscribe(recipient, programs, timezone="UTC", db_path=None):
+    """
+    Creates or replaces a recipient's subscription and schedules each program's
+    next local delivery time.
+
+    Args:
+        recipient (str): The recipient address (e.g. "whatsapp:+15550001").
+        programs (iterable): Program names to receive.
+        timezone (str): IANA timezone name, e.g. "Europe/Berlin".
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            INSERT INTO subscriptions (recipient, timezone, enabled, created_at)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (recipient) DO UPDATE SET timezone = excluded.timezone, enabled = 1
+        ''', (recipient, timezone, datetime.now().isoformat()))
+        conn.execute("DELETE FROM subscription_programs WHERE recipient = ?", (recipient,))
+        conn.executemany(
+            "INSERT INTO subscription_programs (program, recipient) VALUES (?, ?)",
+            [(program, recipient) for program in set(programs)]
+        )
+        conn.execute("DELETE FROM schedule_due WHERE recipient = ?", (recipient,))
+        conn.executemany(
+            "INSERT INTO schedule_due (recipient, program, next_due) VALUES (?, ?, ?)",
+            schedule_rows(recipient, set(programs), timezone, time.time())
+        )
+
+
+def unsubscribe(recipient, db_path=None):
+    """
+    Disables a recipient's subscription, keeping their settings but
+    dropping their scheduled deliveries.
+
+    Args:
+        recipient (str): The recipient address.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute("UPDATE subscriptions SET enabled = 0 WHERE recipient = ?", (recipient,))
+        conn.execute("DELETE FROM schedule_due WHERE recipient = ?", (recipient,))
+
+
+def get_subscription(recipient, db_path=None):
+    """
+    Returns a recipient's subscription.
+
+    Args:
+        recipient (str): The recipient address.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict | None: {"recipient", "timezone", "enabled", "programs"}, or None.
+    """
+    conn = get_connection(db_path)
+    row = conn.execute(
+        "SELECT timezone, enabled FROM subscriptions WHERE recipient = ?", (recipient,)
+    ).fetchone()
+    if not row:
+        return None
+    programs = [r[0] for r in conn.execute(
+        "SELECT program FROM subscription_programs WHERE recipient = ? ORDER BY program", (recipient,)
+    )]
+    return {"recipient": recipient, "timezone": row[0], "enabled": bool(row[1]), "programs": programs}
+
+
+# === Broadcasts ===
+
+def create_broadcast(broadcast_key, program, body, recipients=None, db_path=None):
+    """
+    Creates a broadcast and snapshots its recipients, or returns the existing
+    one for ``broadcast_key`` so a re-run tick resumes rather than duplicates.
+    Explicit recipients passed for an existing key are added to it (reopening
+    it if it had finished); recipients already on it are not sent twice.
+
+    Args:
+        broadcast_key (str): Unique key for this run, e.g. "morning:2024-05-01T07".
+        program (str): The program being sent.
+        body (str): The message text.
+        recipients (list): Explicit recipients. Defaults to every enabled
+            subscriber of ``program``.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        tuple: (broadcast_id, created).
+    """
+    now = time.time()
+    with get_connection(db_path) as conn:
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO broadcasts (broadcast_key, program, body, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (broadcast_key, program, body, BROADCAST_SENDING, now, now))
+        created = bool(cursor.rowcount)
+        if created:
+            broadcast_id = cursor.lastrowid
+        else:
+            broadcast_id = conn.execute(
+                "SELECT broadcast_id FROM broadcasts WHERE broadcast_key = ?", (broadcast_key,)
+            ).fetchone()[0]
+            if recipients is None:
+                return broadcast_id, False
+
+        if recipients is None:
+            conn.execute('''
+                INSERT INTO broadcast_recipients (broadcast_id, recipient, status)
+                SELECT ?, sp.recipient, ?
+                FROM subscription_programs sp
+                JOIN subscriptions s ON s.recipient = sp.recipient
+                WHERE sp.program = ? AND s.enabled = 1
+            ''', (broadcast_id, RECIPIENT_PENDING, program))
+        else:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO broadcast_recipients (broadcast_id, recipient, status) VALUES (?, ?, ?)",
+                [(broadcast_id, recipient, RECIPIENT_PENDING) for recipient in recipients]
+            )
+            if not created and conn.total_changes > before:
+                conn.execute(
+                    "UPDATE broadcasts SET status = ?, completed_at = NULL, updated_at = ? WHERE broadcast_id = ?",
+                    (BROADCAST_SENDING, now, broadcast_id)
+                )
+    return broadcast_id, created
+
+
+def get_broadcast(broadcast_id, db_path=None):
+    """
+    Returns a broadcast's message and status.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict | None: {"broadcast_id", "program", "body", "media_url", "status"}, or None.
+    """
+    row = get_connection(db_path).execute(
+        "SELECT program, body, media_url, status FROM broadcasts WHERE broadcast_id = ?", (broadcast_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {"broadcast_id": broadcast_id, "program": row[0], "body": row[1], "media_url": row[2], "status": row[3]}
+
+
+def set_broadcast_media(broadcast_id, media_url, db_path=None):
+    """
+    Stores the rendered audio URL so a resumed broadcast never re-renders it.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        media_url (str): The public URL of the rendered audio.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute(
+            "UPDATE broadcasts SET media_url = ?, updated_at = ? WHERE broadcast_id = ?",
+            (media_url, time.time(), broadcast_id)
+        )
+
+
+def touch_broadcast(broadcast_id, db_path=None):
+    """
+    Marks a broadcast as active, e.g. after its chunks were (re-)enqueued.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute("UPDATE broadcasts SET updated_at = ? WHERE broadcast_id = ?", (time.time(), broadcast_id))
+
+
+def pending_recipients(broadcast_id, stale_after, db_path=None):
+    """
+    Lists recipients still owed a message: never claimed, or claimed by a
+    sender that stopped reporting more than ``stale_after`` seconds ago.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        stale_after (float): Seconds after which a claim is considered abandoned.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        list: Recipient addresses in a stable order.
+    """
+    rows = get_connection(db_path).execute('''
+        SELECT recipient FROM broadcast_recipients
+        WHERE broadcast_id = ? AND (status = ? OR (status = ? AND claimed_at < ?))
+        ORDER BY recipient
+    ''', (broadcast_id, RECIPIENT_PENDING, RECIPIENT_SENDING, time.time() - stale_after))
+    return [row[0] for row in rows]
+
+
+def claim_recipient(broadcast_id, recipient, stale_after, db_path=None):
+    """
+    Atomically claims one recipient for sending.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        recipient (str): The recipient address.
+        stale_after (float): Seconds after which another sender's claim may be taken over.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        bool: True if the caller should send to this recipient.
+    """
+    now = time.time()
+    with get_connection(db_path) as conn:
+        cursor = conn.execute('''
+            UPDATE broadcast_recipients SET status = ?, claimed_at = ?
+            WHERE broadcast_id = ? AND recipient = ?
+              AND (status = ? OR (status = ? AND claimed_at < ?))
+        ''', (RECIPIENT_SENDING, now, broadcast_id, recipient,
+              RECIPIENT_PENDING, RECIPIENT_SENDING, now - stale_after))
+        return cursor.rowcount == 1
+
+
+def record_recipient(broadcast_id, recipient, status, message_sid=None, error=None, db_path=None):
+    """
+    Records the outcome for one recipient.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        recipient (str): The recipient address.
+        status (str): RECIPIENT_SENT, RECIPIENT_FAILED or RECIPIENT_PENDING (to hand it back).
+        message_sid (str): The outbound Twilio message sid, if sent.
+        error (str): The failure reason, if any.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            UPDATE broadcast_recipients SET status = ?, message_sid = ?, error = ?
+            WHERE broadcast_id = ? AND recipient = ?
+        ''', (status, message_sid, error, broadcast_id, recipient))
+        conn.execute("UPDATE broadcasts SET updated_at = ? WHERE broadcast_id = ?", (time.time(), broadcast_id))
+
+
+def finish_broadcast_if_done(broadcast_id, db_path=None):
+    """
+    Marks a broadcast done once no recipient is pending or in flight.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        bool: True if the broadcast is (now) done.
+    """
+    now = time.time()
+    with get_connection(db_path) as conn:
+        cursor = conn.execute('''
+            UPDATE broadcasts SET status = ?, completed_at = ?, updated_at = ?
+            WHERE broadcast_id = ? AND status != ? AND NOT EXISTS (
+                SELECT 1 FROM broadcast_recipients
+                WHERE broadcast_id = ? AND status IN (?, ?)
+            )
+        ''', (BROADCAST_DONE, now, now, broadcast_id, BROADCAST_DONE,
+              broadcast_id, RECIPIENT_PENDING, RECIPIENT_SENDING))
+        if cursor.rowcount:
+            return True
+        row = conn.execute("SELECT status FROM broadcasts WHERE broadcast_id = ?", (broadcast_id,)).fetchone()
+    return bool(row) and row[0] == BROADCAST_DONE
+
+
+def broadcast_progress(broadcast_id, db_path=None):
+    """
+    Returns per-status recipient counts for a broadcast.
+
+    Args:
+        broadcast_id (int): The broadcast id.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict: e.g. {"sent": 120, "pending": 30, "failed": 2}.
+    """
+    rows = get_connection(db_path).execute(
+        "SELECT status, COUNT(*) FROM broadcast_recipients WHERE broadcast_id = ? GROUP BY status",
+        (broadcast_id,)
+    )
+    return {status: count for status, count in rows}
+
+
+def stalled_broadcasts(stale_after, db_path=None):
+    """
+    Lists unfinished broadcasts with no progress for ``stale_after`` seconds.
+
+    Args:
+        stale_after (float): Seconds of inactivity before a broadcast is resumed.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        list: Broadcast ids.
+    """
+    rows = get_connection(db_path).execute(
+        "SELECT broadcast_id FROM broadcasts WHERE status = ? AND updated_at < ?",
+        (BROADCAST_SENDING, time.time() - stale_after)
+    )
+    return [row[0] for row in rows]
@@ -0,0 +1,61 @@
+import time
+import threading
+from collections import OrderedDict
+
+# === In-Process Caches ===
+
+
+class TTLCache:
+    """
+    A small thread-safe mapping whose entries expire after a fixed TTL.
+    The least recently written entry is evicted once ``maxsize`` is reached.
+    """
+
+    def __init__(self, ttl, maxsize=10000):
+        """
+        Args:
+            ttl (float): Seconds an entry stays valid.
+            maxsize (int): Max number of entries kept.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for ``key``, or ``default`` if missing or expired.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        """
+        Stores ``value`` under ``key`` for ``ttl`` seconds.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Removes ``key`` from the cache if present.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,193 @@
+import time
+from app.config import Config
+from app.utils.db import get_connection
+
+# === Conversation Memory ===
+#
+# Turns are stored per (user_id, channel) with their token count, computed
+# once on write, so assembling a prompt only sums stored integers. The
+# context is the rolling summary plus as many recent turns, verbatim, as fit
+# CONVERSATION_TOKEN_BUDGET. Once unsummarized turns overflow the budget,
+# a Celery task (tasks.refresh_conversation_summary) folds the overflow into
+# the summary and drops those turns. Prompt size and lookup cost therefore
+# stay bounded however long the conversation runs, and the summary call never
+# sits on the request path.
+
+TURN_OVERHEAD_TOKENS = 4
+FETCH_BATCH = 50
+
+
+def count_tokens(text):
+    """
+    Estimates a message's tokens with the same four-characters-per-token rule
+    as the OpenAI limiter, plus the per-message overhead.
+
+    Args:
+        text (str): The message content.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return len(text or "") // 4 + TURN_OVERHEAD_TOKENS
+
+
+def _summary_row(conn, user_id, channel):
+    row = conn.execute('''
+        SELECT summary, summary_tokens, covered_through FROM conversation_summaries
+        WHERE user_id = ? AND channel = ?
+    ''', (user_id, channel)).fetchone()
+    return row if row else ("", 0, 0)
+
+
+def record_exchange(user_id, channel, user_text, reply, budget=None, db_path=None):
+    """
+    Stores a user message and the assistant's reply.
+
+    Args:
+        user_id (str): The user.
+        channel (str): Where the conversation happens ("whatsapp", "respond").
+        user_text (str): What the user said.
+        reply (str): What the assistant answered.
+        budget (int): Prompt token budget. Defaults to Config.CONVERSATION_TOKEN_BUDGET.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        bool: True once the unsummarized turns no longer fit the budget, i.e.
+        a summary refresh is due.
+    """
+    budget = budget or Config.CONVERSATION_TOKEN_BUDGET
+    now = time.time()
+    with get_connection(db_path) as conn:
+        conn.executemany('''
+            INSERT INTO conversation_turns (user_id, channel, role, content, tokens, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (user_id, channel, "user", user_text, count_tokens(user_text), now),
+            (user_id, channel, "assistant", reply, count_tokens(reply), now),
+        ])
+        _, summary_tokens, covered_through = _summary_row(conn, user_id, channel)
+        pending = conn.execute('''
+            SELECT COALESCE(SUM(tokens), 0) FROM conversation_turns
+            WHERE user_id = ? AND channel = ? AND turn_id > ?
+        ''', (user_id, channel, covered_through)).fetchone()[0]
+    return summary_tokens + pending > budget
+
+
+def build_context(user_id, channel, budget=None, db_path=None):
+    """
+    Assembles the conversation context for the next prompt: the rolling
+    summary, then the newest turns that fit the remaining budget, oldest first.
+
+    Args:
+        user_id (str): The user.
+        channel (str): The conversation channel.
+        budget (int): Token budget. Defaults to Config.CONVERSATION_TOKEN_BUDGET.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict: {"messages": chat messages to place before the new user message,
+        "tokens": their estimated size, "fold_through": the newest turn id left
+        out of the window (None if everything fit)}.
+    """
+    budget = budget or Config.CONVERSATION_TOKEN_BUDGET
+    conn = get_connection(db_path)
+    summary, summary_tokens, covered_through = _summary_row(conn, user_id, channel)
+    remaining = budget - summary_tokens
+    turns = []
+    used = 0
+    fold_through = None
+    cursor = conn.execute('''
+        SELECT turn_id, role, content, tokens FROM conversation_turns
+        WHERE user_id = ? AND channel = ? AND turn_id > ?
+        ORDER BY turn_id DESC
+    ''', (user_id, channel, covered_through))
+    try:
+        while fold_through is None:
+            rows = cursor.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            for turn_id, role, content, tokens in rows:
+                if used + tokens > remaining:
+                    fold_through = turn_id
+                    break
+                turns.append({"role": role, "content": content})
+                used += tokens
+    finally:
+        cursor.close()
+
+    messages = [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] if summary else []
+    messages.extend(reversed(turns))
+    return {"messages": messages, "tokens": used + summary_tokens, "fold_through": fold_through}
+
+
+def request_refresh(user_id, channel, min_interval=None, db_path=None):
+    """
+    Marks a summary refresh as requested unless one was requested recently,
+    so a burst of messages enqueues one refresh rather than many.
+
+    Returns:
+        bool: True if the caller should enqueue the refresh.
+    """
+    min_interval = Config.CONVERSATION_REFRESH_INTERVAL if min_interval is None else min_interval
+    now = time.time()
+    with get_connection(db_path) as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO conversation_summaries (user_id, channel) VALUES (?, ?)", (user_id, channel)
+        )
+        cursor = conn.execute('''
+            UPDATE conversation_summaries SET refresh_requested_at = ?
+            WHERE user_id = ? AND channel = ?
+              AND (refresh_requested_at IS NULL OR refresh_requested_at < ?)
+        ''', (now, user_id, channel, now - min_interval))
+        return cursor.rowcount > 0
+
+
+def refresh_summary(user_id, channel, summarize, budget=None, db_path=None):
+    """
+    Folds the turns that no longer fit the budget into the rolling summary
+    and deletes them.
+
+    Args:
+        user_id (str): The user.
+        channel (str): The conversation channel.
+        summarize (callable): ``summarize(previous_summary, turns) -> str`` where
+            turns is a list of {"role", "content"} dicts, oldest first.
+        budget (int): Token budget. Defaults to Config.CONVERSATION_TOKEN_BUDGET.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        bool: True if the summary was updated.
+    """
+    conn = get_connection(db_path)
+    summary, _, covered_through = _summary_row(conn, user_id, channel)
+    fold_through = build_context(user_id, channel, budget, db_path)["fold_through"]
+    if fold_through is None:
+        with conn:
+            conn.execute('''
+                UPDATE conversation_summaries SET refresh_requested_at = NULL WHERE user_id = ? AND channel = ?
+            ''', (user_id, channel))
+        return False
+
+    turns = [{"role": row[0], "content": row[1]} for row in conn.execute('''
+        SELECT role, content FROM conversation_turns
+        WHERE user_id = ? AND channel = ? AND turn_id > ? AND turn_id <= ?
+        ORDER BY turn_id
+    ''', (user_id, channel, covered_through, fold_through))]
+    new_summary = summarize(summary, turns).strip()
+
+    with conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO conversation_summaries (user_id, channel) VALUES (?, ?)", (user_id, channel)
+        )
+        # Guarded on covered_through so a concurrent refresh can't fold the same turns twice.
+        cursor = conn.execute('''
+            UPDATE conversation_summaries
+            SET summary = ?, summary_tokens = ?, covered_through = ?, refresh_requested_at = NULL, updated_at = ?
+            WHERE user_id = ? AND channel = ? AND covered_through = ?
+        ''', (new_summary, count_tokens(new_summary), fold_through, time.time(), user_id, channel, covered_through))
+        if cursor.rowcount == 0:
+            return False
+        conn.execute('''
+            DELETE FROM conversation_turns WHERE user_id = ? AND channel = ? AND turn_id <= ?
+        ''', (user_id, channel, fold_through))
+    return True
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+from app.config import Config
+
+# === Pooled SQLite Access ===
+#
+# Each thread (and each forked gunicorn/Celery worker) keeps one long-lived
+# connection per database file instead of reconnecting on every helper call.
+
+_local = threading.local()
+_registry_lock = threading.Lock()
+_all_connections = []
+_generation = 0
+
+
+def resolve_db_path(db_path=None):
+    """
+    Resolves the database path, falling back to Config.DATABASE_PATH.
+
+    Args:
+        db_path (str): An explicit database path, or None.
+
+    Returns:
+        str: The database path to use.
+    """
+    return db_path or Config.DATABASE_PATH
+
+
+def _file_identity(db_path):
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _apply_pragmas(conn):
+    conn.execute(f"PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    synchronous = str(Config.SQLITE_SYNCHRONOUS).upper()
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        synchronous = "NORMAL"
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    # Negative cache_size is interpreted by SQLite as KiB rather than pages.
+    conn.execute(f"PRAGMA cache_size = -{int(Config.SQLITE_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA foreign_keys = ON")
+
+
+def _open(db_path):
+    conn = sqlite3.connect(
+        db_path,
+        timeout=Config.SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+        cached_statements=Config.SQLITE_STATEMENT_CACHE_SIZE,
+        check_same_thread=False,
+    )
+    _apply_pragmas(conn)
+    with _registry_lock:
+        _all_connections.append(conn)
+    return conn
+
+
+def _close(conn):
+    with _registry_lock:
+        if conn in _all_connections:
+            _all_connections.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _thread_pool():
+    # A forked worker inherits the parent's thread-local state; never reuse
+    # connections that were opened in another process.
+    pid = os.getpid()
+    if getattr(_local, "pid", None) != pid or getattr(_local, "generation", None) != _generation:
+        _local.pid = pid
+        _local.generation = _generation
+        _local.connections = {}
+    return _local.connections
+
+
+def get_connection(db_path=None):
+    """
+    Returns the calling thread's pooled connection for a database file.
+
+    The connection is opened once per thread and process, configured for WAL
+    mode with the tuned pragmas from Config, and reused on later calls. It can
+    be used as a context manager to commit or roll back a transaction; it is
+    never closed by the ``with`` block.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        sqlite3.Connection: A ready-to-use connection.
+    """
+    db_path = resolve_db_path(db_path)
+    pool = _thread_pool()
+    identity = _file_identity(db_path)
+    cached = pool.get(db_path)
+    if cached is not None:
+        conn, cached_identity = cached
+        if identity is not None and identity == cached_identity:
+            return conn
+        # The file was deleted or replaced underneath us; drop the stale handle.
+        _close(conn)
+        del pool[db_path]
+
+    conn = _open(db_path)
+    pool[db_path] = (conn, _file_identity(db_path))
+    return conn
+
+
+def close_connection(db_path=None):
+    """
+    Closes the calling thread's pooled connection for a database file, if any.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    db_path = resolve_db_path(db_path)
+    cached = _thread_pool().pop(db_path, None)
+    if cached is not None:
+        _close(cached[0])
+
+
+def close_all_connections():
+    """
+    Closes every pooled connection opened by this process, across all threads.
+    Intended for shutdown hooks and test teardown.
+    """
+    global _generation
+    with _registry_lock:
+        conns = list(_all_connections)
+        _all_connections.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def _forget_inherited_connections():
+    # SQLite handles must not be used (or closed) across fork; just drop them.
+    global _generation
+    _all_connections.clear()
+    _generation += 1
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_connections)
@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import random
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.config import Config
+
+# === Pooled ElevenLabs HTTP Client ===
+#
+# One keep-alive requests.Session per process, so repeated synthesis reuses the
+# TLS connection instead of handshaking on every call. Rate limits (429) and
+# server errors (5xx) are retried with jittered exponential backoff, honouring
+# Retry-After when ElevenLabs sends it. Audio is streamed to disk in chunks, so
+# memory stays flat regardless of text length.
+
+API_BASE = "https://api.elevenlabs.io/v1"
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+CHUNK_SIZE = 64 * 1024
+
+
+class ElevenLabsError(Exception):
+    """Raised when ElevenLabs returns a non-success response."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"ElevenLabs API failed: {status_code} – {detail}")
+        self.status_code = status_code
+
+
+def _payload(text, voice_settings, model_id):
+    payload = {
+        "text": text,
+        "voice_settings": voice_settings or Config.ELEVENLABS_VOICE_SETTINGS
+    }
+    if model_id:
+        payload["model_id"] = model_id
+    return payload
+
+
+class _ElevenLabsBase:
+    # Settings and retry backoff shared by the sync and async clients.
+
+    def _configure(self, api_key, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max):
+        self.api_key = api_key or Config.ELEVENLABS_API_KEY
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else Config.ELEVENLABS_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else Config.ELEVENLABS_READ_TIMEOUT,
+        )
+        self.max_retries = Config.ELEVENLABS_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = Config.ELEVENLABS_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = Config.ELEVENLABS_BACKOFF_MAX if backoff_max is None else backoff_max
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter keeps a burst of workers from retrying in lockstep.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+class ElevenLabsClient(_ElevenLabsBase):
+    def __init__(self, api_key=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_base=None, backoff_max=None):
+        """
+        Initializes a pooled ElevenLabs client.
+
+        Args:
+            api_key (str): The ElevenLabs API key. Defaults to Config.ELEVENLABS_API_KEY.
+            pool_size (int): Keep-alive connections held per host.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait between bytes of the response.
+            max_retries (int): Retries for 429/5xx and connection errors.
+            backoff_base (float): Initial backoff in seconds; doubles per attempt.
+            backoff_max (float): Upper bound on a single backoff.
+        """
+        self._configure(api_key, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max)
+        pool_size = pool_size or Config.ELEVENLABS_POOL_SIZE
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update({"xi-api-key": self.api_key or ""})
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a request, retrying rate-limit, server and connection errors.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The API path below /v1, e.g. "/text-to-speech/<voice_id>".
+            **kwargs: Passed to requests.Session.request.
+
+        Returns:
+            requests.Response: A successful (2xx) response.
+
+        Raises:
+            ElevenLabsError: If the final response is not successful.
+            requests.RequestException: If the final attempt failed to connect.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, f"{API_BASE}{path}", **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.ok:
+                return response
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response)
+                response.close()
+                time.sleep(delay)
+                attempt += 1
+                continue
+            detail = response.text
+            response.close()
+            raise ElevenLabsError(response.status_code, detail)
+
+    def synthesize_to_file(self, voice_id, text, output_path, voice_settings=None, model_id=None):
+        """
+        Synthesizes text and streams the MP3 response straight to disk.
+
+        Args:
+            voice_id (str): The ElevenLabs voice ID.
+            text (str): The text to synthesize.
+            output_path (str): Where to write the MP3.
+            voice_settings (dict): Defaults to Config.ELEVENLABS_VOICE_SETTINGS.
+            model_id (str): Optional ElevenLabs model override.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        payload = _payload(text, voice_settings, model_id)
+        written = 0
+        with self.request("POST", f"/text-to-speech/{voice_id}", json=payload, stream=True) as response:
+            with open(output_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+                        written += len(chunk)
+        return written
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncElevenLabsClient(_ElevenLabsBase):
+    """
+    asyncio counterpart on a pooled httpx.AsyncClient, with the same retry and
+    streamed-to-disk behaviour. Create it inside the event loop that uses it.
+    """
+
+    def __init__(self, api_key=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff_base=None, backoff_max=None):
+        self._configure(api_key, connect_timeout, read_timeout, max_retries, backoff_base, backoff_max)
+        pool_size = pool_size or Config.ELEVENLABS_POOL_SIZE
+        self.http = httpx.AsyncClient(
+            base_url=API_BASE,
+            headers={"xi-api-key": self.api_key or ""},
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def synthesize_to_file(self, voice_id, text, output_path, voice_settings=None, model_id=None):
+        """
+        Synthesizes text and streams the MP3 response straight to disk.
+
+        Returns:
+            int: The number of bytes written.
+
+        Raises:
+            ElevenLabsError: If the final response is not successful.
+            httpx.TransportError: If the final attempt failed to connect.
+        """
+        payload = _payload(text, voice_settings, model_id)
+        attempt = 0
+        while True:
+            try:
+                async with self.http.stream("POST", f"/text-to-speech/{voice_id}", json=payload) as response:
+                    if response.status_code < 400:
+                        written = 0
+                        with open(output_path, "wb") as f:
+                            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                                f.write(chunk)
+                                written += len(chunk)
+                        return written
+                    detail = (await response.aread()).decode("utf-8", "replace")
+                    if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                        raise ElevenLabsError(response.status_code, detail)
+                    delay = self._backoff(attempt, response)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_elevenlabs_client():
+    """
+    Returns the process-wide ElevenLabs client, creating it on first use.
+    A forked Celery worker builds its own client rather than sharing the
+    parent's pooled sockets.
+
+    Returns:
+        ElevenLabsClient: The shared client.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = ElevenLabsClient()
+                _client_pid = pid
+    return _client
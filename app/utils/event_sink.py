@@ -0,0 +1,225 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from itertools import groupby
+from app.config import Config
+from app.utils.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# === Write-Behind Event Sink ===
+#
+# Request handlers hand rows to an in-memory queue; a background thread
+# writes them with executemany in a single transaction once a batch fills up
+# or the flush interval elapses. The queue is bounded so a slow disk sheds
+# low-value events instead of stalling requests.
+#
+# Required rows are never shed. If the queue is full they are written
+# synchronously, and a failure there raises to the caller. If a background
+# batch fails, its rows are retried one by one. Required rows that hit a
+# transient error (locked database, I/O) stay pending for the next flush.
+# Rows that can never be written are logged and dropped.
+
+_STOP = object()
+
+
+class BatchedEventWriter:
+    def __init__(self, db_path=None, batch_size=None, flush_interval=None, max_queue=None):
+        """
+        Initializes a write-behind writer for one SQLite database.
+
+        Args:
+            db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+            batch_size (int): Rows that trigger an immediate flush (default Config.EVENT_BATCH_SIZE).
+            flush_interval (float): Max seconds a row waits before being written (default Config.EVENT_FLUSH_INTERVAL).
+            max_queue (int): Max queued rows before events are shed (default Config.EVENT_QUEUE_MAX).
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size or Config.EVENT_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.EVENT_FLUSH_INTERVAL
+        self.max_queue = max_queue or Config.EVENT_QUEUE_MAX
+        self.written = 0
+        self.dropped = 0
+        self._pid = None
+        self._thread = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # Rows queued before a fork belong to the parent process.
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, statement, params, required=False):
+        """
+        Queues one row for a parameterized INSERT.
+
+        Args:
+            statement (str): The SQL statement to execute for this row.
+            params (tuple): The statement parameters.
+            required (bool): If True and the queue is full, write synchronously
+                instead of dropping the row, and keep retrying it if a
+                background write fails.
+
+        Returns:
+            bool: True if the row was queued or written, False if it was shed.
+
+        Raises:
+            sqlite3.Error: If a required row written synchronously could not be stored.
+        """
+        self._ensure_started()
+        row = (statement, params, required)
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            if required:
+                self._execute([row])
+                self.written += 1
+                return True
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Event queue full; shed {self.dropped} events so far.")
+            return False
+
+    def flush(self, timeout=5.0):
+        """
+        Blocks until every row queued so far has been written.
+
+        Args:
+            timeout (float): Max seconds to wait.
+
+        Returns:
+            bool: True if the flush completed within the timeout.
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """
+        Flushes outstanding rows and stops the background thread.
+
+        Args:
+            timeout (float): Max seconds to wait for the final flush.
+        """
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Event queue full at shutdown; remaining events lost.")
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP or isinstance(item, threading.Event):
+                pending = self._write(pending)
+                deadline = time.monotonic() + self.flush_interval if pending else None
+                if item is _STOP:
+                    if pending:
+                        logger.error(f"Event writer stopped with {len(pending)} required events unwritten.")
+                    return
+                item.set()
+                continue
+
+            if item is not None:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                pending = self._write(pending)
+                # Required rows left over are retried after another interval.
+                deadline = time.monotonic() + self.flush_interval if pending else None
+
+    def _execute(self, rows):
+        conn = get_connection(self.db_path)
+        with conn:
+            for statement, group in groupby(rows, key=lambda row: row[0]):
+                conn.executemany(statement, [row[1] for row in group])
+
+    def _write(self, rows):
+        """
+        Writes a batch, falling back to one row at a time if it fails.
+
+        Returns:
+            list: Required rows that hit a transient error and should be retried.
+        """
+        if not rows:
+            return []
+        try:
+            self._execute(rows)
+            self.written += len(rows)
+            return []
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} queued events, retrying one by one: {e}")
+
+        retry = []
+        for row in rows:
+            try:
+                self._execute([row])
+                self.written += 1
+            except sqlite3.OperationalError:
+                if row[2]:
+                    retry.append(row)
+                else:
+                    self.dropped += 1
+            except Exception as e:
+                self.dropped += 1
+                logger.error(f"Dropping event that cannot be written: {e}")
+        return retry
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_event_writer(db_path=None):
+    """
+    Returns the process-wide write-behind writer for a database, creating it on first use.
+    The writer is flushed and stopped automatically at interpreter exit.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        BatchedEventWriter: The shared writer.
+    """
+    key = db_path or Config.DATABASE_PATH
+    writer = _writers.get(key)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                writer = BatchedEventWriter(db_path)
+                _writers[key] = writer
+                atexit.register(writer.close)
+    return writer
@@ -1,6 +1,10 @@
-import sqlite3
 from datetime import datetime, timedelta
-from collections import Counter
+from app.config import Config
+from app.utils.cache import TTLCache
+from app.utils.db import get_connection, resolve_db_path
+from app.utils.event_sink import get_event_writer
+from app.utils.migrations import migrate
+from app.utils.retrieval import index_journal_entries
 
 # === Journal + Archetype Helpers ===
 
@@ -14,65 +18,37 @@ def sample_helper():
     return "This is a helper function."
 
 
-def init_journal_db(db_path="custom_archetypes.db"):
+def init_journal_db(db_path=None):
     """
     Initializes the journal_entries table in the SQLite database.
+    The DDL itself is owned by app.utils.migrations; this applies any pending migrations.
     
     Args:
-        db_path (str): Path to the SQLite database file.
-    """
-    with sqlite3.connect(db_path) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS journal_entries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                date TEXT,
-                entry_text TEXT,
-                mood TEXT,
-                energy_level TEXT,
-                archetype TEXT,
-                tags TEXT
-            )
-        ''')
-        conn.commit()
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    migrate(db_path)
 
 
-def init_archetype_db(db_path="custom_archetypes.db"):
+def init_archetype_db(db_path=None):
     """
     Initializes the archetypes and archetype_versions tables in the SQLite database.
+    The DDL itself is owned by app.utils.migrations; this applies any pending migrations.
     
     Args:
-        db_path (str): Path to the SQLite database file.
-    """
-    with sqlite3.connect(db_path) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS archetypes (
-                name TEXT PRIMARY KEY,
-                tone TEXT,
-                template TEXT,
-                traits TEXT,
-                tags TEXT,
-                created_at TEXT
-            )
-        ''')
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS archetype_versions (
-                version_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                archetype_name TEXT,
-                tone TEXT,
-                template TEXT,
-                traits TEXT,
-                tags TEXT,
-                version_label TEXT,
-                created_at TEXT
-            )
-        ''')
-        conn.commit()
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    migrate(db_path)
 
 
 # === Archetype Usage Logging ===
 
-def log_archetype_use(user_id, archetype, is_custom, module, mood, db_path="custom_archetypes.db"):
+USAGE_INSERT_SQL = '''
+    INSERT INTO archetype_usage (user_id, archetype, is_custom, module, mood, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+
+def log_archetype_use(user_id, archetype, is_custom, module, mood, db_path=None):
     """
     Logs the usage of an archetype by a user.
     
@@ -82,39 +58,49 @@ def log_archetype_use(user_id, archetype, is_custom, module, mood, db_path="cust
         is_custom (bool): True if the archetype is custom.
         module (str): The module (endpoint) where the archetype was used.
         mood (str): The mood associated with the usage.
-        db_path (str): Path to the SQLite database file.
-    """
-    with sqlite3.connect(db_path) as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS archetype_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                archetype TEXT,
-                is_custom INTEGER,
-                module TEXT,
-                mood TEXT,
-                timestamp TEXT
-            )
-        ''')
-        conn.execute('''
-            INSERT INTO archetype_usage (user_id, archetype, is_custom, module, mood, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, archetype, int(is_custom), module, mood, datetime.now().isoformat()))
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute(USAGE_INSERT_SQL, (user_id, archetype, int(is_custom), module, mood, datetime.now().isoformat()))
         conn.commit()
 
 
-def get_archetype_usage_summary(user_id, db_path="custom_archetypes.db"):
+def queue_archetype_use(user_id, archetype, is_custom, module, mood, db_path=None):
+    """
+    Queues an archetype usage row on the write-behind writer instead of committing inline.
+    Falls back to log_archetype_use when Config.EVENT_WRITE_BEHIND is disabled.
+    Usage rows are shed rather than blocking the request if the queue is full.
+    
+    Args:
+        user_id (str): The ID of the user.
+        archetype (str): The archetype used.
+        is_custom (bool): True if the archetype is custom.
+        module (str): The module (endpoint) where the archetype was used.
+        mood (str): The mood associated with the usage.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    
+    Returns:
+        bool: True if the row was queued or written, False if it was shed.
+    """
+    if not Config.EVENT_WRITE_BEHIND:
+        log_archetype_use(user_id, archetype, is_custom, module, mood, db_path=db_path)
+        return True
+    row = (user_id, archetype, int(is_custom), module, mood, datetime.now().isoformat())
+    return get_event_writer(db_path).submit(USAGE_INSERT_SQL, row)
+
+
+def get_archetype_usage_summary(user_id, db_path=None):
     """
     Retrieves a summary of archetype usage for a given user.
     
     Args:
         user_id (str): The user ID to filter by.
-        db_path (str): Path to the SQLite database file.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
     
     Returns:
         list: A list of tuples (archetype, count) representing usage counts.
     """
-    with sqlite3.connect(db_path) as conn:
+    with get_connection(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT archetype, COUNT(*) FROM archetype_usage
@@ -124,18 +110,18 @@ def get_archetype_usage_summary(user_id, db_path="custom_archetypes.db"):
         return cursor.fetchall()
 
 
-def get_mood_archetype_matrix(user_id, db_path="custom_archetypes.db"):
+def get_mood_archetype_matrix(user_id, db_path=None):
     """
     Retrieves a matrix of mood and archetype combinations with usage counts for a given user.
     
     Args:
         user_id (str): The user ID to filter by.
-        db_path (str): Path to the SQLite database file.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
     
     Returns:
         list: A list of tuples (mood, archetype, count).
     """
-    with sqlite3.connect(db_path) as conn:
+    with get_connection(db_path) as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT mood, archetype, COUNT(*) FROM archetype_usage
@@ -147,30 +133,142 @@ def get_mood_archetype_matrix(user_id, db_path="custom_archetypes.db"):
 
 # === Emotion-Adaptive Helpers ===
 
-def get_recent_mood_summary(user_id, db_path="custom_archetypes.db", lookback_days=3, top_n=1):
+_mood_summary_cache = TTLCache(ttl=Config.MOOD_CACHE_TTL)
+
+
+def get_recent_mood_summary(user_id, db_path=None, lookback_days=3, top_n=1):
     """
     Retrieves the most common recent moods for a user within a specified lookback period.
+    Reads the per-day journal_mood_daily rollup (kept current by triggers on
+    journal_entries) and caches the ranking per user for Config.MOOD_CACHE_TTL
+    seconds. The window is whole days: entries dated on or after the cutoff day count.
     
     Args:
         user_id (str): The ID of the user.
-        db_path (str): Path to the SQLite database file.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
         lookback_days (int): Number of days to look back.
         top_n (int): Number of top moods to return.
     
     Returns:
         list: A list of moods, sorted by frequency.
     """
-    cutoff = datetime.now() - timedelta(days=lookback_days)
-    with sqlite3.connect(db_path) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT mood FROM journal_entries
-            WHERE user_id = ? AND date >= ?
-        ''', (user_id, cutoff.isoformat()))
-        moods = [row[0] for row in cursor.fetchall() if row[0]]
-    mood_counts = Counter(moods)
-    most_common = mood_counts.most_common(top_n)
-    return [m[0] for m in most_common] if most_common else []
+    cache_key = (resolve_db_path(db_path), user_id)
+    by_window = _mood_summary_cache.get(cache_key) or {}
+    ranked = by_window.get(lookback_days)
+    if ranked is None:
+        cutoff_day = (datetime.now() - timedelta(days=lookback_days)).date().isoformat()
+        with get_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT mood, SUM(entry_count) AS total FROM journal_mood_daily
+                WHERE user_id = ? AND day >= ?
+                GROUP BY mood
+                ORDER BY total DESC, mood
+            ''', (user_id, cutoff_day))
+            ranked = [row[0] for row in cursor.fetchall()]
+        _mood_summary_cache.set(cache_key, {**by_window, lookback_days: ranked})
+    return ranked[:top_n]
+
+
+# SQLite caps bound parameters per statement; batch lookups are split below it.
+MOOD_BATCH_CHUNK = 500
+
+
+def get_recent_mood_summaries(user_ids, db_path=None, lookback_days=3, top_n=1):
+    """
+    Batch form of get_recent_mood_summary. Users already in the cache are served
+    from it; the rest are ranked with one grouped query over the rollup.
+    
+    Args:
+        user_ids (iterable): The IDs of the users.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        lookback_days (int): Number of days to look back.
+        top_n (int): Number of top moods to return per user.
+    
+    Returns:
+        dict: user_id -> list of moods, sorted by frequency.
+    """
+    resolved = resolve_db_path(db_path)
+    rankings = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        ranked = (_mood_summary_cache.get((resolved, user_id)) or {}).get(lookback_days)
+        if ranked is None:
+            missing.append(user_id)
+        else:
+            rankings[user_id] = ranked
+
+    if missing:
+        cutoff_day = (datetime.now() - timedelta(days=lookback_days)).date().isoformat()
+        fetched = {user_id: [] for user_id in missing}
+        with get_connection(db_path) as conn:
+            for start in range(0, len(missing), MOOD_BATCH_CHUNK):
+                chunk = missing[start:start + MOOD_BATCH_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(f'''
+                    SELECT user_id, mood, SUM(entry_count) AS total FROM journal_mood_daily
+                    WHERE user_id IN ({placeholders}) AND day >= ?
+                    GROUP BY user_id, mood
+                    ORDER BY user_id, total DESC, mood
+                ''', (*chunk, cutoff_day)).fetchall()
+                for user_id, mood, _ in rows:
+                    fetched[user_id].append(mood)
+        for user_id, ranked in fetched.items():
+            cache_key = (resolved, user_id)
+            by_window = _mood_summary_cache.get(cache_key) or {}
+            _mood_summary_cache.set(cache_key, {**by_window, lookback_days: ranked})
+        rankings.update(fetched)
+
+    return {user_id: ranked[:top_n] for user_id, ranked in rankings.items()}
+
+
+def invalidate_mood_summary(user_id, db_path=None):
+    """
+    Drops the cached mood ranking for a user so the next lookup re-reads the rollup.
+    
+    Args:
+        user_id (str): The ID of the user.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    _mood_summary_cache.invalidate((resolve_db_path(db_path), user_id))
+
+
+# === Journal Logging ===
+
+def log_journal_entry(user_id, entry_text, mood=None, energy_level=None, archetype=None, tags=None, date=None, db_path=None):
+    """
+    Records a journal entry. The daily mood rollup is updated by a trigger in
+    the same transaction, and the user's cached mood ranking is invalidated.
+    With retrieval enabled the entry is added to the user's vector index.
+    
+    Args:
+        user_id (str): The ID of the user.
+        entry_text (str): The journal text.
+        mood (str): The mood reported with the entry.
+        energy_level (str): The energy level reported with the entry.
+        archetype (str): The archetype active when the entry was written.
+        tags (str): Free-text tags.
+        date (str): ISO timestamp for the entry. Defaults to now.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    
+    Returns:
+        int: The id of the new journal entry.
+    """
+    date = date or datetime.now().isoformat()
+    with get_connection(db_path) as conn:
+        cursor = conn.execute('''
+            INSERT INTO journal_entries (user_id, date, entry_text, mood, energy_level, archetype, tags)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, date, entry_text, mood, energy_level, archetype, tags))
+        entry_id = cursor.lastrowid
+    invalidate_mood_summary(user_id, db_path)
+    if Config.RETRIEVAL_ENABLED:
+        try:
+            index_journal_entries(user_id, db_path)
+        except Exception as e:
+            # The next search catches the index up, so the entry is never lost.
+            print(f"[DEBUG] Error indexing journal entry {entry_id}: {e}", flush=True)
+    return entry_id
 
 
 MOOD_ARCHETYPE_MAP = {
@@ -223,7 +321,12 @@ def get_prompt_scaffold(mode):
 
 # === Feedback Logging ===
 
-def log_feedback_entry(user_id, archetype, mood, input_text, response_text, rating, comment, db_path="custom_archetypes.db"):
+FEEDBACK_INSERT_SQL = '''
+    INSERT INTO feedback (user_id, archetype, mood, input, response, rating, comment, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def log_feedback_entry(user_id, archetype, mood, input_text, response_text, rating, comment, db_path=None):
     """
     Records user feedback after receiving a response from the assistant.
     
@@ -235,27 +338,11 @@ def log_feedback_entry(user_id, archetype, mood, input_text, response_text, rati
         response_text (str): The response generated by the assistant.
         rating (int): A rating on a scale of 1 to 5.
         comment (str): Optional text feedback.
-        db_path (str): Path to the SQLite database file.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
     """
-    with sqlite3.connect(db_path) as conn:
+    with get_connection(db_path) as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                archetype TEXT,
-                mood TEXT,
-                input TEXT,
-                response TEXT,
-                rating INTEGER,
-                comment TEXT,
-                timestamp TEXT
-            )
-        ''')
-        cursor.execute('''
-            INSERT INTO feedback (user_id, archetype, mood, input, response, rating, comment, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        cursor.execute(FEEDBACK_INSERT_SQL, (
             user_id,
             archetype,
             mood,
@@ -268,6 +355,28 @@ def log_feedback_entry(user_id, archetype, mood, input_text, response_text, rati
         conn.commit()
 
 
+def queue_feedback_entry(user_id, archetype, mood, input_text, response_text, rating, comment, db_path=None):
+    """
+    Queues a feedback row on the write-behind writer instead of committing inline.
+    Feedback is never shed: if the queue is full the row is written synchronously.
+    
+    Args:
+        user_id (str): The ID of the user providing feedback.
+        archetype (str): The archetype used for the response.
+        mood (str): The user's mood at the time of the response.
+        input_text (str): The input prompt provided by the user.
+        response_text (str): The response generated by the assistant.
+        rating (int): A rating on a scale of 1 to 5.
+        comment (str): Optional text feedback.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    if not Config.EVENT_WRITE_BEHIND:
+        log_feedback_entry(user_id, archetype, mood, input_text, response_text, rating, comment, db_path=db_path)
+        return
+    row = (user_id, archetype, mood, input_text, response_text, rating, comment, datetime.now().isoformat())
+    get_event_writer(db_path).submit(FEEDBACK_INSERT_SQL, row, required=True)
+
+
 # === Debugging Utility ===
 
 def sample_helper():
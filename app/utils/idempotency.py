@@ -0,0 +1,141 @@
+import time
+from app.config import Config
+from app.utils.db import get_connection
+
+# === Webhook Idempotency ===
+#
+# Twilio retries /webhook when it is slow to answer. Each inbound MessageSid
+# is claimed once; a retry that finds an existing claim attaches to that
+# attempt instead of starting new work. Pipeline stages record their results
+# under the same key so a redelivered Celery task never repeats a paid API
+# call or sends a second message.
+
+STATUS_IN_FLIGHT = "in_flight"
+STATUS_DONE = "done"
+
+_last_purge = 0.0
+
+
+def claim_message(message_sid, task_id=None, ttl=None, db_path=None):
+    """
+    Atomically claims an inbound message for processing.
+
+    Args:
+        message_sid (str): Twilio's MessageSid for the inbound message.
+        task_id (str): Optional id of the work started for this message.
+        ttl (float): Seconds the claim is remembered (default Config.IDEMPOTENCY_TTL).
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        tuple: (claimed, record). ``claimed`` is True if the caller owns the
+        message and should start work; otherwise ``record`` is a dict with the
+        existing claim's status and task_id.
+    """
+    now = time.time()
+    expires_at = now + (ttl or Config.IDEMPOTENCY_TTL)
+    _maybe_purge(now, db_path)
+    with get_connection(db_path) as conn:
+        cursor = conn.execute('''
+            INSERT INTO inbound_messages (message_sid, status, task_id, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (message_sid) DO UPDATE SET
+                status = excluded.status, task_id = excluded.task_id,
+                created_at = excluded.created_at, expires_at = excluded.expires_at
+            WHERE inbound_messages.expires_at < excluded.created_at
+        ''', (message_sid, STATUS_IN_FLIGHT, task_id, now, expires_at))
+        if cursor.rowcount:
+            conn.execute("DELETE FROM inbound_message_stages WHERE message_sid = ?", (message_sid,))
+            return True, None
+        row = conn.execute(
+            "SELECT status, task_id FROM inbound_messages WHERE message_sid = ?", (message_sid,)
+        ).fetchone()
+    return False, {"status": row[0], "task_id": row[1]} if row else None
+
+
+def release_message(message_sid, db_path=None):
+    """
+    Drops a claim (e.g. when enqueueing failed) so Twilio's next retry can start fresh.
+
+    Args:
+        message_sid (str): Twilio's MessageSid for the inbound message.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute("DELETE FROM inbound_message_stages WHERE message_sid = ?", (message_sid,))
+        conn.execute("DELETE FROM inbound_messages WHERE message_sid = ?", (message_sid,))
+
+
+def complete_message(message_sid, db_path=None):
+    """
+    Marks a claimed message as fully handled.
+
+    Args:
+        message_sid (str): Twilio's MessageSid for the inbound message.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute("UPDATE inbound_messages SET status = ? WHERE message_sid = ?", (STATUS_DONE, message_sid))
+
+
+def get_stage_result(message_sid, stage, db_path=None):
+    """
+    Returns the recorded result of a pipeline stage for a message.
+
+    Args:
+        message_sid (str): Twilio's MessageSid for the inbound message.
+        stage (str): The stage name (e.g. "text", "text_sent").
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        str: The stored result, or None if the stage has not completed.
+    """
+    with get_connection(db_path) as conn:
+        row = conn.execute(
+            "SELECT result FROM inbound_message_stages WHERE message_sid = ? AND stage = ?",
+            (message_sid, stage)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def record_stage_result(message_sid, stage, result, db_path=None):
+    """
+    Records that a pipeline stage completed for a message.
+
+    Args:
+        message_sid (str): Twilio's MessageSid for the inbound message.
+        stage (str): The stage name.
+        result (str): The stage's output (generated text, media URL, outbound sid).
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO inbound_message_stages (message_sid, stage, result, completed_at)
+            VALUES (?, ?, ?, ?)
+        ''', (message_sid, stage, result, time.time()))
+
+
+def purge_expired(db_path=None):
+    """
+    Deletes expired claims and their stage records.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        int: The number of claims removed.
+    """
+    now = time.time()
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            DELETE FROM inbound_message_stages WHERE message_sid IN (
+                SELECT message_sid FROM inbound_messages WHERE expires_at < ?
+            )
+        ''', (now,))
+        return conn.execute("DELETE FROM inbound_messages WHERE expires_at < ?", (now,)).rowcount
+
+
+def _maybe_purge(now, db_path):
+    global _last_purge
+    if now - _last_purge >= Config.IDEMPOTENCY_PURGE_INTERVAL:
+        _last_purge = now
+        purge_expired(db_path)
@@ -0,0 +1,322 @@
+import os
+import html
+import time
+import uuid
+from datetime import datetime
+from markdown import markdown
+from app.config import Config
+from app.utils.db import get_connection
+
+# === Journal Export ===
+#
+# Exports run as Celery jobs (tasks.export_journal), so wkhtmltopdf never runs
+# in a web worker. Entries are read month by month through a cursor in
+# JOURNAL_EXPORT_BATCH_SIZE batches instead of fetchall, and the document is
+# written to disk as it is rendered. Each month's Markdown is cached in
+# journal_export_fragments under a (count, max id) fingerprint. A repeat
+# export reuses every month that hasn't changed and re-renders only months
+# with new entries. Edits and deletes drop the affected fragment via
+# triggers. PDFs are built from an HTML file converted fragment by fragment,
+# then handed to wkhtmltopdf. Finished exports are deleted, file and job,
+# after JOURNAL_EXPORT_MAX_AGE_HOURS by the beat purge.
+#
+# Entry fields are HTML-escaped as they are rendered, so journal text can't
+# inject markup that wkhtmltopdf would act on. wkhtmltopdf also runs with local
+# file access, images and JavaScript off (PDF_OPTIONS), so Markdown image
+# syntax can't make it fetch URLs either.
+
+EXPORT_QUEUED = "queued"
+EXPORT_RUNNING = "running"
+EXPORT_DONE = "done"
+EXPORT_FAILED = "failed"
+
+EXPORT_FORMATS = {"markdown": ".md", "pdf": ".pdf"}
+
+PDF_OPTIONS = {
+    "encoding": "UTF-8",
+    "quiet": "",
+    "disable-local-file-access": "",
+    "no-images": "",
+    "disable-javascript": "",
+}
+
+HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>body {{ font-family: Georgia, serif; margin: 2em; }} h2 {{ page-break-before: auto; }}</style>
+</head><body>
+"""
+
+
+# === Export Jobs ===
+
+def create_export(user_id, fmt="markdown", db_path=None):
+    """
+    Records a queued export job.
+
+    Args:
+        user_id (str): Whose journal to export.
+        fmt (str): "markdown" or "pdf".
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        str: The export id.
+
+    Raises:
+        ValueError: If ``fmt`` is not a supported format.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    export_id = uuid.uuid4().hex
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            INSERT INTO journal_exports (export_id, user_id, format, status, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (export_id, user_id, fmt, EXPORT_QUEUED, time.time()))
+    return export_id
+
+
+def get_export(export_id, db_path=None):
+    """
+    Returns an export job.
+
+    Returns:
+        dict | None: {"export_id", "user_id", "format", "status", "path", "error"}, or None.
+    """
+    row = get_connection(db_path).execute(
+        "SELECT user_id, format, status, path, error FROM journal_exports WHERE export_id = ?", (export_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {"export_id": export_id, "user_id": row[0], "format": row[1], "status": row[2], "path": row[3], "error": row[4]}
+
+
+def set_export_status(export_id, status, path=None, error=None, db_path=None):
+    finished_at = time.time() if status in (EXPORT_DONE, EXPORT_FAILED) else None
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            UPDATE journal_exports SET status = ?, path = ?, error = ?, finished_at = ? WHERE export_id = ?
+        ''', (status, path, error, finished_at, export_id))
+
+
+def purge_expired_exports(max_age=None, db_path=None):
+    """
+    Deletes finished exports older than ``max_age`` along with their files.
+
+    Args:
+        max_age (float): Seconds a finished export is kept. Defaults to
+            Config.JOURNAL_EXPORT_MAX_AGE_HOURS.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        int: How many exports were removed.
+    """
+    max_age = Config.JOURNAL_EXPORT_MAX_AGE_HOURS * 3600 if max_age is None else max_age
+    conn = get_connection(db_path)
+    expired = conn.execute(
+        "SELECT export_id, path FROM journal_exports WHERE finished_at IS NOT NULL AND finished_at < ?",
+        (time.time() - max_age,)
+    ).fetchall()
+    for export_id, path in expired:
+        # The file goes first, so a row is never left pointing at nothing.
+        if path and os.path.exists(path):
+            os.remove(path)
+        with conn:
+            conn.execute("DELETE FROM journal_exports WHERE export_id = ?", (export_id,))
+    return len(expired)
+
+
+# === Rendering ===
+
+def month_fingerprints(user_id, db_path=None):
+    """
+    Returns each month's entry count and highest entry id, in date order.
+
+    Returns:
+        list: (month, entry_count, max_entry_id) tuples; month is "YYYY-MM" ('' if undated).
+    """
+    return get_connection(db_path).execute('''
+        SELECT COALESCE(substr(date, 1, 7), '') AS month, COUNT(*), MAX(id)
+        FROM journal_entries WHERE user_id = ?
+        GROUP BY month ORDER BY month
+    ''', (user_id,)).fetchall()
+
+
+def iter_month_entries(user_id, month, db_path=None, batch_size=None):
+    """
+    Yields one month's entries in date order, fetched in batches.
+
+    Yields:
+        tuple: (date, entry_text, mood, energy_level, archetype, tags).
+    """
+    batch_size = batch_size or Config.JOURNAL_EXPORT_BATCH_SIZE
+    cursor = get_connection(db_path).execute('''
+        SELECT date, entry_text, mood, energy_level, archetype, tags FROM journal_entries
+        WHERE user_id = ? AND COALESCE(substr(date, 1, 7), '') = ?
+        ORDER BY date, id
+    ''', (user_id, month))
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def render_entry(entry):
+    """
+    Renders one journal entry as Markdown, with every field HTML-escaped.
+
+    Args:
+        entry (tuple): (date, entry_text, mood, energy_level, archetype, tags).
+
+    Returns:
+        str: The entry's Markdown section.
+    """
+    date, entry_text, mood, energy_level, archetype, tags = entry
+    try:
+        heading = datetime.fromisoformat(date).strftime("%A, %d %B %Y · %H:%M")
+    except (TypeError, ValueError):
+        heading = html.escape(date or "Undated")
+    details = [f"*{label}:* {html.escape(str(value))}" for label, value in
+               (("Mood", mood), ("Energy", energy_level), ("Archetype", archetype), ("Tags", tags)) if value]
+    parts = [f"### {heading}\n"]
+    if details:
+        parts.append(" · ".join(details) + "\n")
+    parts.append(f"{html.escape((entry_text or '').strip())}\n\n")
+    return "\n".join(parts)
+
+
+def render_month(user_id, month, db_path=None):
+    """
+    Renders a month of entries as Markdown.
+
+    Returns:
+        str: The month's Markdown, starting with its heading.
+    """
+    title = datetime.strptime(month, "%Y-%m").strftime("%B %Y") if month else "Undated"
+    parts = [f"## {title}\n\n"]
+    parts.extend(render_entry(entry) for entry in iter_month_entries(user_id, month, db_path))
+    return "".join(parts)
+
+
+def iter_month_fragments(user_id, db_path=None, stats=None):
+    """
+    Yields each month's Markdown in date order, reusing cached fragments whose
+    fingerprint still matches and re-rendering (and re-caching) the rest.
+
+    Args:
+        user_id (str): Whose journal to render.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        stats (dict): If given, "rendered" and "reused" month counts are added to it.
+
+    Yields:
+        str: One month's Markdown.
+    """
+    conn = get_connection(db_path)
+    # Only fingerprints up front; cached Markdown is read one month at a time.
+    cached = {
+        row[0]: row[1:] for row in conn.execute(
+            "SELECT month, entry_count, max_entry_id FROM journal_export_fragments WHERE user_id = ?",
+            (user_id,)
+        )
+    }
+    for month, entry_count, max_entry_id in month_fingerprints(user_id, db_path):
+        if cached.get(month) == (entry_count, max_entry_id):
+            row = conn.execute(
+                "SELECT markdown FROM journal_export_fragments WHERE user_id = ? AND month = ?", (user_id, month)
+            ).fetchone()
+            if row:
+                if stats is not None:
+                    stats["reused"] = stats.get("reused", 0) + 1
+                yield row[0]
+                continue
+        text = render_month(user_id, month, db_path)
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO journal_export_fragments
+                    (user_id, month, entry_count, max_entry_id, markdown, rendered_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, month, entry_count, max_entry_id, text, time.time()))
+        if stats is not None:
+            stats["rendered"] = stats.get("rendered", 0) + 1
+        yield text
+
+
+def export_title(user_id):
+    return f"Journal — {user_id}"
+
+
+def write_markdown(user_id, out_path, db_path=None):
+    """
+    Writes a user's journal to a Markdown file, one month at a time.
+
+    Returns:
+        dict: {"rendered": int, "reused": int} month counts.
+    """
+    stats = {"rendered": 0, "reused": 0}
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(f"# {export_title(user_id)}\n\n*Exported {datetime.now().strftime('%d %B %Y')}*\n\n")
+        for fragment in iter_month_fragments(user_id, db_path, stats):
+            f.write(fragment)
+    return stats
+
+
+def write_pdf(user_id, out_path, db_path=None):
+    """
+    Writes a user's journal to a PDF via an intermediate HTML file and wkhtmltopdf.
+    Call this from a Celery worker only.
+
+    Returns:
+        dict: {"rendered": int, "reused": int} month counts.
+    """
+    import pdfkit
+
+    stats = {"rendered": 0, "reused": 0}
+    html_path = f"{out_path}.html"
+    try:
+        with open(html_path, "w", encoding="utf-8") as f:
+            title = html.escape(export_title(user_id))
+            f.write(HTML_HEAD.format(title=title))
+            f.write(f"<h1>{title}</h1>\n")
+            for fragment in iter_month_fragments(user_id, db_path, stats):
+                f.write(markdown(fragment))
+                f.write("\n")
+            f.write("</body></html>\n")
+        configuration = pdfkit.configuration(wkhtmltopdf=Config.WKHTMLTOPDF_PATH) if Config.WKHTMLTOPDF_PATH else None
+        pdfkit.from_file(html_path, out_path, configuration=configuration, options=PDF_OPTIONS)
+    finally:
+        if os.path.exists(html_path):
+            os.remove(html_path)
+    return stats
+
+
+def run_export(export_id, db_path=None):
+    """
+    Renders a queued export to Config.JOURNAL_EXPORT_DIR and records the outcome.
+
+    Returns:
+        dict: The finished job, as from get_export().
+
+    Raises:
+        Exception: Whatever rendering raised, after the job is marked failed.
+    """
+    job = get_export(export_id, db_path)
+    if job is None:
+        raise ValueError(f"Unknown export: {export_id}")
+    if job["status"] == EXPORT_DONE and job["path"] and os.path.exists(job["path"]):
+        return job
+
+    os.makedirs(Config.JOURNAL_EXPORT_DIR, exist_ok=True)
+    out_path = os.path.abspath(os.path.join(Config.JOURNAL_EXPORT_DIR, f"{export_id}{EXPORT_FORMATS[job['format']]}"))
+    set_export_status(export_id, EXPORT_RUNNING, db_path=db_path)
+    try:
+        writer = write_pdf if job["format"] == "pdf" else write_markdown
+        stats = writer(job["user_id"], out_path, db_path)
+    except Exception as e:
+        set_export_status(export_id, EXPORT_FAILED, error=str(e), db_path=db_path)
+        raise
+    set_export_status(export_id, EXPORT_DONE, path=out_path, db_path=db_path)
+    print(f"[DEBUG] Journal export {export_id}: {stats['rendered']} months rendered, {stats['reused']} reused", flush=True)
+    return get_export(export_id, db_path)
@@ -0,0 +1,262 @@
+import re
+import json
+import html
+import base64
+from app.config import Config
+from app.utils.db import get_connection
+
+# === Journal Search ===
+#
+# Word search runs against journal_fts, an FTS5 index over entry_text, tags
+# and mood that triggers keep in sync with journal_entries (migration 14).
+# Every query is pinned to the user's owner token, so its cost follows the
+# user's own journal rather than the whole table. Hits are ranked by bm25,
+# with tag matches weighted above body text.
+# Snippets are cut by FTS5 around the matched terms. Tags are normalized into
+# tags/journal_entry_tags, so a tag filter is an index lookup rather than a
+# LIKE scan over the free-text column.
+#
+# Pagination is keyset-based. The cursor carries the last row's sort key
+# (bm25 score and id, or date and id when only browsing by tag), so page N
+# costs the same as page 1. Tag browsing is stable across writes. Ranked
+# pages are not: bm25 uses term statistics from the whole index, shared by
+# all users, so any write between two pages can nudge scores and move a
+# row across the cursor (shown twice or skipped).
+
+BM25_WEIGHTS = (1.0, 2.0, 1.0, 0.0)  # entry_text, tags, mood, owner
+SNIPPET_TOKENS = 16
+PREVIEW_CHARS = 160
+# Sentinels around matched terms, swapped for <mark> after HTML-escaping the snippet.
+MARK_START, MARK_END = "\x02", "\x03"
+TERM_PATTERN = re.compile(r'"([^"]+)"|(\w[\w\'-]*\*?)')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+def normalize_tag(tag):
+    """
+    Normalizes a tag the way the tag triggers do: trimmed, lowercase, no leading '#'.
+    """
+    return (tag or "").strip().strip("#").strip().lower()
+
+
+def build_match_query(text):
+    """
+    Turns free text into a safe FTS5 query: every word or "quoted phrase" must
+    match, and a trailing * on a word matches it as a prefix.
+
+    Args:
+        text (str): The user's search text.
+
+    Returns:
+        str | None: The MATCH expression, or None if the text has no terms.
+    """
+    terms = []
+    for phrase, word in TERM_PATTERN.findall(text or ""):
+        if phrase:
+            terms.append('"' + phrase.replace('"', '""') + '"')
+        elif word.endswith("*") and len(word) > 1:
+            terms.append(f'"{word[:-1]}"*')
+        elif word != "*":
+            terms.append(f'"{word}"')
+    return " ".join(terms) or None
+
+
+def owner_token(user_id):
+    """
+    Returns the token journal_fts indexes a user's entries under; matches
+    'u' || hex(user_id) in the FTS triggers.
+    """
+    return "u" + user_id.encode("utf-8").hex().upper()
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a pagination cursor.
+
+    Returns:
+        list: The [sort value, id] key of the last row returned.
+
+    Raises:
+        InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor.") from e
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], int):
+        raise InvalidCursor("Invalid cursor.")
+    return key
+
+
+def _highlight(snippet):
+    return html.escape(snippet or "").replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def _preview(text):
+    text = " ".join((text or "").split())
+    if len(text) > PREVIEW_CHARS:
+        text = text[:PREVIEW_CHARS].rsplit(" ", 1)[0] + "…"
+    return html.escape(text)
+
+
+def _tag_filter(tags):
+    # Entries carrying every requested tag, found through the (tag_id, entry_id) index.
+    placeholders = ", ".join("?" for _ in tags)
+    sql = f'''
+        e.id IN (
+            SELECT jet.entry_id FROM journal_entry_tags jet JOIN tags t ON t.tag_id = jet.tag_id
+            WHERE t.name IN ({placeholders})
+            GROUP BY jet.entry_id HAVING COUNT(*) = ?
+        )
+    '''
+    return sql, [*tags, len(tags)]
+
+
+def _entry_tags(conn, entry_ids):
+    if not entry_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in entry_ids)
+    tags = {}
+    for entry_id, name in conn.execute(f'''
+        SELECT jet.entry_id, t.name FROM journal_entry_tags jet JOIN tags t ON t.tag_id = jet.tag_id
+        WHERE jet.entry_id IN ({placeholders}) ORDER BY t.name
+    ''', entry_ids):
+        tags.setdefault(entry_id, []).append(name)
+    return tags
+
+
+def search_entries(user_id, query=None, tags=None, limit=None, cursor=None, db_path=None):
+    """
+    Searches a user's journal by words, tags or both.
+
+    With ``query``, entries are ranked by relevance and each result carries a
+    snippet with the matched terms wrapped in <mark>. With only ``tags``,
+    entries are listed newest first with a short preview.
+
+    Args:
+        user_id (str): Whose journal to search.
+        query (str): Search text; words must all match, "phrases" match exactly,
+            and a trailing * matches a prefix.
+        tags (list): Tags every result must carry.
+        limit (int): Page size. Defaults to Config.JOURNAL_SEARCH_PAGE_SIZE,
+            capped at Config.JOURNAL_SEARCH_MAX_PAGE_SIZE.
+        cursor (str): The ``next_cursor`` of the previous page.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict: {"results": [{"id", "date", "mood", "tags", "snippet", "score"}],
+        "next_cursor": str or None}.
+
+    Raises:
+        InvalidCursor: If ``cursor`` is malformed.
+    """
+    limit = max(1, min(limit or Config.JOURNAL_SEARCH_PAGE_SIZE, Config.JOURNAL_SEARCH_MAX_PAGE_SIZE))
+    tags = sorted({normalize_tag(tag) for tag in tags or [] if normalize_tag(tag)})
+    match = build_match_query(query)
+    after = decode_cursor(cursor) if cursor else None
+    if not match and not tags:
+        return {"results": [], "next_cursor": None}
+
+    conn = get_connection(db_path)
+    conditions, params = ["e.user_id = ?"], [user_id]
+    if tags:
+        sql, tag_params = _tag_filter(tags)
+        conditions.append(sql)
+        params.extend(tag_params)
+
+    if match:
+        match = f'owner : "{owner_token(user_id)}" AND {{entry_text tags mood}} : ({match})'
+        if after:
+            conditions.append("(score > ? OR (score = ? AND e.id > ?))")
+            params.extend([after[0], after[0], after[1]])
+        rows = conn.execute(f'''
+            SELECT e.id, e.date, e.mood, bm25(journal_fts, ?, ?, ?, ?) AS score
+            FROM journal_fts JOIN journal_entries e ON e.id = journal_fts.rowid
+            WHERE journal_fts MATCH ? AND {" AND ".join(conditions)}
+            ORDER BY score, e.id
+            LIMIT ?
+        ''', (*BM25_WEIGHTS, match, *params, limit + 1)).fetchall()
+        page = rows[:limit]
+        ids = [row[0] for row in page]
+        # Snippets only for the rows on this page.
+        placeholders = ", ".join("?" for _ in ids)
+        snippets = dict(conn.execute(f'''
+            SELECT rowid, snippet(journal_fts, 0, ?, ?, '…', ?) FROM journal_fts
+            WHERE journal_fts MATCH ? AND rowid IN ({placeholders})
+        ''', (MARK_START, MARK_END, SNIPPET_TOKENS, match, *ids))) if ids else {}
+        entry_tags = _entry_tags(conn, ids)
+        results = [{
+            "id": entry_id,
+            "date": date,
+            "mood": mood,
+            "tags": entry_tags.get(entry_id, []),
+            "snippet": _highlight(snippets.get(entry_id)),
+            "score": round(-score, 4)
+        } for entry_id, date, mood, score in page]
+        next_key = [page[-1][3], page[-1][0]] if len(rows) > limit else None
+    else:
+        if after:
+            conditions.append("(COALESCE(e.date, '') < ? OR (COALESCE(e.date, '') = ? AND e.id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        rows = conn.execute(f'''
+            SELECT e.id, e.date, e.mood, e.entry_text FROM journal_entries e
+            WHERE {" AND ".join(conditions)}
+            ORDER BY COALESCE(e.date, '') DESC, e.id DESC
+            LIMIT ?
+        ''', (*params, limit + 1)).fetchall()
+        page = rows[:limit]
+        entry_tags = _entry_tags(conn, [row[0] for row in page])
+        results = [{
+            "id": entry_id,
+            "date": date,
+            "mood": mood,
+            "tags": entry_tags.get(entry_id, []),
+            "snippet": _preview(entry_text),
+            "score": None
+        } for entry_id, date, mood, entry_text in page]
+        next_key = [page[-1][1] or "", page[-1][0]] if len(rows) > limit else None
+
+    return {"results": results, "next_cursor": encode_cursor(next_key) if next_key else None}
+
+
+# === Tags ===
+
+def list_tags(user_id, limit=None, db_path=None):
+    """
+    Returns the tags a user has used, most used first.
+
+    Returns:
+        list: {"tag", "count"} dicts.
+    """
+    rows = get_connection(db_path).execute('''
+        SELECT t.name, COUNT(*) AS uses
+        FROM journal_entries e
+        JOIN journal_entry_tags jet ON jet.entry_id = e.id
+        JOIN tags t ON t.tag_id = jet.tag_id
+        WHERE e.user_id = ?
+        GROUP BY t.name
+        ORDER BY uses DESC, t.name
+        LIMIT ?
+    ''', (user_id, limit or -1)).fetchall()
+    return [{"tag": name, "count": count} for name, count in rows]
+
+
+def archetypes_with_tag(tag, db_path=None):
+    """
+    Returns the names of stored archetypes carrying a tag.
+
+    Returns:
+        list: Archetype names, sorted.
+    """
+    rows = get_connection(db_path).execute('''
+        SELECT at.archetype_name FROM archetype_tags at JOIN tags t ON t.tag_id = at.tag_id
+        WHERE t.name = ? ORDER BY at.archetype_name
+    ''', (normalize_tag(tag),)).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,311 @@
+import re
+import time
+import asyncio
+import uuid
+import random
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from app.config import Config
+
+# === Adaptive OpenAI Rate Limiter ===
+#
+# Every OpenAI call takes a slot that caps in-flight requests and reserves its
+# estimated tokens against a per-minute budget. With LLM_LIMITER_REDIS_URL set,
+# the slots, budget and cooldown live in Redis and are shared by every
+# gunicorn and Celery process; otherwise each process uses a local stand-in.
+#
+# The concurrency cap is adaptive. A 429 halves it and starts a shared cooldown,
+# either from Retry-After or from the rate-limit reset headers. Each window of
+# successful calls adds one back. Retries use full-jitter backoff. A caller
+# that cannot get a slot within LLM_ACQUIRE_TIMEOUT gets LLMOverloaded at once
+# rather than queuing until the web worker times out.
+
+
+class LLMOverloaded(Exception):
+    """Raised when no OpenAI capacity is available within the allowed wait."""
+
+    def __init__(self, message="The assistant is busy right now. Please try again shortly.", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value):
+    """
+    Parses an OpenAI reset header ("1s", "6m0s", "250ms") or Retry-After seconds.
+
+    Args:
+        value (str): The header value.
+
+    Returns:
+        float | None: Seconds, or None if the value is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Roughly estimates a chat request's token cost (about four characters per
+    prompt token, plus the completion allowance).
+    """
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return prompt_chars // 4 + len(messages) * 4 + max_tokens
+
+
+class LocalLimiterBackend:
+    """Per-process stand-in for the Redis backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._window = None
+        self._tokens = 0
+        self._cooldown_until = 0.0
+
+    def try_acquire(self, lease_id, tokens, limit, tokens_per_minute, lease_ttl, now):
+        with self._lock:
+            self._leases = {k: v for k, v in self._leases.items() if v > now}
+            window = int(now // 60)
+            if window != self._window:
+                self._window, self._tokens = window, 0
+            if self._cooldown_until > now or len(self._leases) >= limit:
+                return False
+            if self._tokens and self._tokens + tokens > tokens_per_minute:
+                return False
+            self._leases[lease_id] = now + lease_ttl
+            self._tokens += tokens
+            return True
+
+    def release(self, lease_id):
+        with self._lock:
+            self._leases.pop(lease_id, None)
+
+    def adjust_tokens(self, delta, now):
+        with self._lock:
+            if self._window == int(now // 60):
+                self._tokens = max(0, self._tokens + delta)
+
+    def set_cooldown(self, until):
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, until)
+
+    def cooldown_until(self):
+        with self._lock:
+            return self._cooldown_until
+
+
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if tonumber(redis.call('GET', KEYS[3]) or '0') > tonumber(ARGV[1]) then return 0 end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[5]) then return 0 end
+local used = tonumber(redis.call('GET', KEYS[2]) or '0')
+if used > 0 and used + tonumber(ARGV[4]) > tonumber(ARGV[6]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+redis.call('INCRBY', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[2], 120)
+return 1
+"""
+
+
+class RedisLimiterBackend:
+    """Shares slots, token budget and cooldown across processes through Redis."""
+
+    def __init__(self, url, prefix="caelum:llm"):
+        import redis
+        self.redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.prefix = prefix
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+
+    def _tokens_key(self, now):
+        return f"{self.prefix}:tokens:{int(now // 60)}"
+
+    def try_acquire(self, lease_id, tokens, limit, tokens_per_minute, lease_ttl, now):
+        keys = [f"{self.prefix}:inflight", self._tokens_key(now), f"{self.prefix}:cooldown"]
+        args = [now, now + lease_ttl, lease_id, tokens, limit, tokens_per_minute]
+        return bool(self._acquire(keys=keys, args=args))
+
+    def release(self, lease_id):
+        self.redis.zrem(f"{self.prefix}:inflight", lease_id)
+
+    def adjust_tokens(self, delta, now):
+        self.redis.incrby(self._tokens_key(now), delta)
+
+    def set_cooldown(self, until):
+        key = f"{self.prefix}:cooldown"
+        if until > float(self.redis.get(key) or 0):
+            self.redis.set(key, until, ex=max(1, int(until - time.time()) + 1))
+
+    def cooldown_until(self):
+        return float(self.redis.get(f"{self.prefix}:cooldown") or 0)
+
+
+class AdaptiveLimiter:
+    def __init__(self, backend=None, max_concurrency=None, tokens_per_minute=None,
+                 acquire_timeout=None, lease_ttl=None):
+        """
+        Initializes the limiter.
+
+        Args:
+            backend: LocalLimiterBackend or RedisLimiterBackend (default chosen from Config).
+            max_concurrency (int): Upper bound on in-flight OpenAI requests.
+            tokens_per_minute (int): Token budget per minute.
+            acquire_timeout (float): Seconds a caller may wait for a slot.
+            lease_ttl (float): Seconds after which a slot held by a crashed process lapses.
+        """
+        self.backend = backend or LocalLimiterBackend()
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.tokens_per_minute = tokens_per_minute or Config.LLM_TOKENS_PER_MINUTE
+        self.acquire_timeout = Config.LLM_ACQUIRE_TIMEOUT if acquire_timeout is None else acquire_timeout
+        self.lease_ttl = lease_ttl or Config.LLM_LEASE_TTL
+        self.limit = self.max_concurrency
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def _backend_call(self, method, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            if isinstance(self.backend, LocalLimiterBackend):
+                raise
+            # Redis is unreachable: keep limiting, just within this process.
+            print(f"[DEBUG] LLM limiter backend error, falling back to local: {e}", flush=True)
+            self.backend = LocalLimiterBackend()
+            return getattr(self.backend, method)(*args)
+
+    def _acquire_step(self, lease_id, tokens, deadline):
+        """
+        Tries once to take a slot.
+
+        Returns:
+            float | None: None once the slot is held, otherwise seconds to wait before retrying.
+
+        Raises:
+            LLMOverloaded: If the deadline passed or a cooldown outlasts it.
+        """
+        if self._backend_call("try_acquire", lease_id, tokens, self.limit,
+                              self.tokens_per_minute, self.lease_ttl, time.time()):
+            return None
+        remaining = deadline - time.monotonic()
+        cooldown = self._backend_call("cooldown_until") - time.time()
+        if remaining <= 0 or cooldown > remaining:
+            # Fail fast rather than sleep through a cooldown that outlasts our wait.
+            raise LLMOverloaded(retry_after=int(cooldown) + 1 if cooldown > 0 else 1)
+        return remaining
+
+    @contextmanager
+    def slot(self, tokens):
+        """
+        Holds one request slot and reserves ``tokens`` from the minute budget.
+
+        Args:
+            tokens (int): The estimated token cost of the request.
+
+        Raises:
+            LLMOverloaded: If no slot frees up within acquire_timeout.
+        """
+        lease_id = uuid.uuid4().hex
+        tokens = min(tokens, self.tokens_per_minute)
+        deadline = time.monotonic() + self.acquire_timeout
+        delay = 0.05
+        while (remaining := self._acquire_step(lease_id, tokens, deadline)) is not None:
+            time.sleep(min(remaining, random.uniform(0, delay)))
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            self._backend_call("release", lease_id)
+
+    @asynccontextmanager
+    async def aslot(self, tokens):
+        """
+        Async counterpart of slot(): waits without blocking the event loop.
+        Backend calls may be Redis round trips, so they run on a thread.
+        """
+        lease_id = uuid.uuid4().hex
+        tokens = min(tokens, self.tokens_per_minute)
+        deadline = time.monotonic() + self.acquire_timeout
+        delay = 0.05
+        while (remaining := await asyncio.to_thread(self._acquire_step, lease_id, tokens, deadline)) is not None:
+            await asyncio.sleep(min(remaining, random.uniform(0, delay)))
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self._backend_call, "release", lease_id)
+
+    def record_usage(self, estimated, actual):
+        """
+        Corrects the minute budget once the real token usage is known.
+        """
+        if actual is not None and actual != estimated:
+            self._backend_call("adjust_tokens", actual - estimated, time.time())
+
+    def observe_headers(self, headers):
+        """
+        Starts a cooldown when OpenAI reports the request or token budget exhausted.
+
+        Args:
+            headers (Mapping): Response headers.
+        """
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is not None and reset and int(remaining) <= 0:
+                self._backend_call("set_cooldown", time.time() + reset)
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self._successes = 0
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        Halves the concurrency cap and starts a shared cooldown.
+
+        Args:
+            retry_after (float): Seconds from Retry-After or the reset headers, if known.
+        """
+        with self._lock:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+        self._backend_call("set_cooldown", time.time() + (retry_after or Config.LLM_BACKOFF_BASE))
+
+    def backoff(self, attempt):
+        """
+        Returns a full-jitter backoff delay for a retry attempt (0-based).
+        """
+        return random.uniform(0, min(Config.LLM_BACKOFF_MAX, Config.LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter():
+    """
+    Returns the process-wide OpenAI limiter, creating it on first use.
+
+    Returns:
+        AdaptiveLimiter: The shared limiter.
+    """
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                backend = RedisLimiterBackend(Config.LLM_LIMITER_REDIS_URL) if Config.LLM_LIMITER_REDIS_URL else None
+                _limiter = AdaptiveLimiter(backend)
+    return _limiter
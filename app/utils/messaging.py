@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from app.config import Config
+
+# === Outbound Messaging Service ===
+#
+# One Twilio client per process over a pooled keep-alive HTTP session, instead
+# of a new Client (and connection) per task. Sends are paced by a token bucket
+# per sending number so bursts stay inside Twilio's per-number throughput, and
+# every send reports its latency.
+#
+# Every web and Celery process sends, so the bucket has to be shared to hold
+# the rate. With MESSAGING_REDIS_URL set it lives in Redis and is refilled by
+# a script using the Redis clock. Otherwise, or while Redis is unreachable,
+# each process keeps a local bucket holding 1/MESSAGING_WORKER_PROCESSES of
+# the rate and burst.
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a send could not get a token within the allowed wait."""
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        Initializes a token bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float): Maximum tokens held, i.e. the allowed burst.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available.
+
+        Returns:
+            float: 0.0 if a token was taken, otherwise seconds until one will be.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, max_wait):
+        """
+        Blocks until a token is available.
+
+        Args:
+            max_wait (float): Longest time to wait, in seconds.
+
+        Raises:
+            RateLimitExceeded: If no token became available in time.
+        """
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self.try_acquire()
+            if wait == 0.0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitExceeded(f"No send capacity within {max_wait}s")
+            time.sleep(wait)
+
+
+_TAKE_SCRIPT = """
+local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket(TokenBucket):
+    def __init__(self, client, key, rate, capacity, fallback):
+        """
+        Initializes a token bucket shared by every process through Redis.
+
+        Args:
+            client (redis.Redis): The Redis client.
+            key (str): The Redis key holding the bucket.
+            rate (float): Tokens added per second, across all processes.
+            capacity (float): Maximum tokens held, across all processes.
+            fallback (TokenBucket): Used while Redis is unreachable.
+        """
+        super().__init__(rate, capacity)
+        self.key = key
+        self.fallback = fallback
+        self._take = client.register_script(_TAKE_SCRIPT)
+
+    def try_acquire(self):
+        import redis
+        try:
+            return float(self._take(keys=[self.key], args=[self.rate, self.capacity]))
+        except redis.RedisError as e:
+            print(f"[DEBUG] Shared send limiter unavailable, using local share: {e}", flush=True)
+            return self.fallback.try_acquire()
+
+
+class MessagingService:
+    def __init__(self, account_sid=None, auth_token=None, from_number=None,
+                 rate=None, burst=None, max_wait=None, client=None, redis_url=None, workers=None):
+        """
+        Initializes the messaging service.
+
+        Args:
+            account_sid (str): Twilio account SID. Defaults to Config.TWILIO_ACCOUNT_SID.
+            auth_token (str): Twilio auth token. Defaults to Config.TWILIO_AUTH_TOKEN.
+            from_number (str): Default sending number. Defaults to Config.TWILIO_NUMBER.
+            rate (float): Messages per second allowed per sending number.
+            burst (float): Messages a sending number may send back to back.
+            max_wait (float): Seconds a send may wait for capacity before failing.
+            client (twilio.rest.Client): Optional preconfigured client.
+            redis_url (str): Redis holding the shared buckets. Defaults to Config.MESSAGING_REDIS_URL.
+            workers (int): Sending processes splitting the rate when Redis is not used.
+                Defaults to Config.MESSAGING_WORKER_PROCESSES.
+        """
+        self.from_number = from_number or Config.TWILIO_NUMBER
+        self.rate = Config.MESSAGING_RATE_PER_SEC if rate is None else rate
+        self.burst = Config.MESSAGING_BURST if burst is None else burst
+        self.max_wait = Config.MESSAGING_MAX_WAIT if max_wait is None else max_wait
+        self.workers = max(1, workers or Config.MESSAGING_WORKER_PROCESSES)
+        redis_url = redis_url or Config.MESSAGING_REDIS_URL
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        else:
+            self.redis = None
+        self.client = client or Client(
+            account_sid or Config.TWILIO_ACCOUNT_SID,
+            auth_token or Config.TWILIO_AUTH_TOKEN,
+            http_client=TwilioHttpClient(pool_connections=True, timeout=Config.TWILIO_TIMEOUT)
+        )
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.total_latency = 0.0
+
+    def _bucket(self, sender):
+        with self._lock:
+            bucket = self._buckets.get(sender)
+            if bucket is None:
+                # This process's share, so N processes together stay at the configured rate.
+                bucket = TokenBucket(self.rate / self.workers, max(1.0, self.burst / self.workers))
+                if self.redis is not None:
+                    bucket = RedisTokenBucket(self.redis, f"caelum:send:{sender}", self.rate, self.burst, bucket)
+                self._buckets[sender] = bucket
+            return bucket
+
+    def send(self, to, body=None, media_url=None, status_callback=None, from_=None):
+        """
+        Sends one message; text and media go together when both are given.
+
+        Args:
+            to (str): The recipient (e.g. "whatsapp:+15550001").
+            body (str): Optional message text.
+            media_url (str | list): Optional media URL(s).
+            status_callback (str): Optional status callback URL.
+            from_ (str): Sending number. Defaults to the service's number.
+
+        Returns:
+            MessageInstance: The created Twilio message.
+
+        Raises:
+            RateLimitExceeded: If the sender's bucket stayed empty for max_wait.
+        """
+        sender = from_ or self.from_number
+        self._bucket(sender).acquire(self.max_wait)
+
+        params = {"from_": sender, "to": to}
+        if body:
+            params["body"] = body
+        if media_url:
+            params["media_url"] = media_url if isinstance(media_url, list) else [media_url]
+        if status_callback:
+            params["status_callback"] = status_callback
+
+        start = time.monotonic()
+        message = self.client.messages.create(**params)
+        latency = time.monotonic() - start
+        with self._lock:
+            self.sent += 1
+            self.total_latency += latency
+        print(f"[DEBUG] Twilio send {message.sid} to {to} took {latency * 1000:.0f} ms", flush=True)
+        return message
+
+    def stats(self):
+        """
+        Returns this process's send count and mean send latency.
+
+        Returns:
+            dict: {"sent": int, "avg_latency_ms": float}.
+        """
+        with self._lock:
+            avg = (self.total_latency / self.sent * 1000) if self.sent else 0.0
+            return {"sent": self.sent, "avg_latency_ms": round(avg, 1)}
+
+
+_service = None
+_service_pid = None
+_service_lock = threading.Lock()
+
+
+def get_messaging_service():
+    """
+    Returns the process-wide messaging service, creating it on first use.
+    A forked Celery worker builds its own rather than sharing pooled sockets.
+
+    Returns:
+        MessagingService: The shared service.
+    """
+    global _service, _service_pid
+    pid = os.getpid()
+    if _service is None or _service_pid != pid:
+        with _service_lock:
+            if _service is None or _service_pid != pid:
+                _service = MessagingService()
+                _service_pid = pid
+    return _service
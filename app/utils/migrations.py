@@ -0,0 +1,672 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.utils.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# === Versioned Schema Migrations ===
+#
+# All table and index DDL lives here. Each migration is applied exactly once,
+# in order, and recorded in schema_migrations. Request paths never issue DDL.
+# A step is either a SQL string or a callable taking the open connection.
+
+
+# Local delivery hours per program as of migration 9. Frozen here so the
+# backfill keeps its meaning if the live schedule in app.utils.scheduler changes.
+_BACKFILL_PROGRAM_HOURS = {
+    "morning": [7],
+    "evening": [21],
+    "focus": list(range(10, 17)),
+}
+
+
+def _backfill_due_time(program, timezone_name, after):
+    hours = _BACKFILL_PROGRAM_HOURS.get(program)
+    if not hours:
+        return None
+    try:
+        tz = ZoneInfo(timezone_name) if timezone_name else ZoneInfo("UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo("UTC")
+    today = datetime.fromtimestamp(after, tz).date()
+    for offset in range(3):
+        day = today + timedelta(days=offset)
+        for hour in hours:
+            candidate = datetime(day.year, day.month, day.day, hour, tzinfo=tz).timestamp()
+            if candidate > after:
+                return candidate
+    return None
+
+
+def _backfill_schedule(conn):
+    # Give subscribers created before the due-time queue their next deliveries.
+    now = time.time()
+    subscribers = conn.execute('''
+        SELECT s.recipient, s.timezone, GROUP_CONCAT(sp.program)
+        FROM subscriptions s JOIN subscription_programs sp ON sp.recipient = s.recipient
+        WHERE s.enabled = 1
+        GROUP BY s.recipient
+    ''').fetchall()
+    for recipient, timezone, programs in subscribers:
+        rows = [(recipient, program, _backfill_due_time(program, timezone, now)) for program in programs.split(",")]
+        conn.executemany(
+            "INSERT OR IGNORE INTO schedule_due (recipient, program, next_due) VALUES (?, ?, ?)",
+            [row for row in rows if row[2] is not None]
+        )
+
+
+def _tag_array(column):
+    # SQL turning a free-text tag column ("Work, sleep; #meds" or a JSON array)
+    # into a JSON array for json_each(). Trigger bodies can't use CTEs, so the
+    # text is split with replace() instead.
+    escaped = f"replace(replace({column}, '\\', '\\\\'), '\"', '\\\"')"
+    for separator in ("';'", "'#'", "char(9)", "char(10)", "char(13)"):
+        escaped = f"replace({escaped}, {separator}, ',')"
+    split = f"'[\"' || replace({escaped}, ',', '\",\"') || '\"]'"
+    return (f"CASE WHEN json_valid({column}) AND json_type({column}) = 'array' THEN {column} "
+            f"WHEN json_valid({split}) THEN {split} ELSE '[]' END")
+
+
+_TAG_NAME = "lower(trim(CAST({alias}value AS TEXT), ' #'))"
+
+
+def _tag_names(column):
+    # SELECT yielding the distinct normalized tags in a tag column.
+    name = _TAG_NAME.format(alias="")
+    return f"SELECT DISTINCT {name} FROM json_each({_tag_array(column)}) WHERE {name} != ''"
+
+
+def _backfill_tag_steps(table, key, join_table, join_key):
+    # Derive join rows for rows written before the tag triggers existed.
+    name = _TAG_NAME.format(alias="j.")
+    return [
+        f"""
+        INSERT OR IGNORE INTO tags (name)
+        SELECT DISTINCT {name} FROM {table} src, json_each({_tag_array("src.tags")}) j
+        WHERE src.tags IS NOT NULL AND {name} != ''
+        """,
+        f"""
+        INSERT OR IGNORE INTO {join_table} ({join_key}, tag_id)
+        SELECT src.{key}, t.tag_id FROM {table} src, json_each({_tag_array("src.tags")}) j
+        JOIN tags t ON t.name = {name}
+        WHERE src.tags IS NOT NULL
+        """,
+    ]
+
+MIGRATIONS = [
+    (1, "Base journal, archetype, usage and feedback tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS journal_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            date TEXT,
+            entry_text TEXT,
+            mood TEXT,
+            energy_level TEXT,
+            archetype TEXT,
+            tags TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archetypes (
+            name TEXT PRIMARY KEY,
+            tone TEXT,
+            template TEXT,
+            traits TEXT,
+            tags TEXT,
+            created_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archetype_versions (
+            version_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            archetype_name TEXT,
+            tone TEXT,
+            template TEXT,
+            traits TEXT,
+            tags TEXT,
+            version_label TEXT,
+            created_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archetype_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            archetype TEXT,
+            is_custom INTEGER,
+            module TEXT,
+            mood TEXT,
+            timestamp TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            archetype TEXT,
+            mood TEXT,
+            input TEXT,
+            response TEXT,
+            rating INTEGER,
+            comment TEXT,
+            timestamp TEXT
+        )
+        ''',
+    ]),
+    (2, "Covering indexes for per-user mood and usage lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_journal_user_date ON journal_entries (user_id, date, mood)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_user_archetype_mood ON archetype_usage (user_id, archetype, mood)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_user_mood_archetype ON archetype_usage (user_id, mood, archetype)",
+        "CREATE INDEX IF NOT EXISTS idx_usage_user_timestamp ON archetype_usage (user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_user_timestamp ON feedback (user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_archetype_versions_name ON archetype_versions (archetype_name, created_at)",
+    ]),
+    (3, "Per-user daily mood rollup maintained by journal triggers", [
+        '''
+        CREATE TABLE IF NOT EXISTS journal_mood_daily (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            mood TEXT NOT NULL,
+            entry_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day, mood)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_mood_insert AFTER INSERT ON journal_entries
+        WHEN NEW.user_id IS NOT NULL AND NEW.date IS NOT NULL AND NEW.mood IS NOT NULL AND NEW.mood != ''
+        BEGIN
+            INSERT INTO journal_mood_daily (user_id, day, mood, entry_count)
+            VALUES (NEW.user_id, substr(NEW.date, 1, 10), NEW.mood, 1)
+            ON CONFLICT (user_id, day, mood) DO UPDATE SET entry_count = entry_count + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_mood_delete AFTER DELETE ON journal_entries
+        WHEN OLD.user_id IS NOT NULL AND OLD.date IS NOT NULL AND OLD.mood IS NOT NULL AND OLD.mood != ''
+        BEGIN
+            UPDATE journal_mood_daily SET entry_count = entry_count - 1
+            WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND mood = OLD.mood;
+            DELETE FROM journal_mood_daily
+            WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND mood = OLD.mood AND entry_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_mood_update AFTER UPDATE OF user_id, date, mood ON journal_entries
+        BEGIN
+            UPDATE journal_mood_daily SET entry_count = entry_count - 1
+            WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND mood = OLD.mood;
+            DELETE FROM journal_mood_daily
+            WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND mood = OLD.mood AND entry_count <= 0;
+            INSERT INTO journal_mood_daily (user_id, day, mood, entry_count)
+            SELECT NEW.user_id, substr(NEW.date, 1, 10), NEW.mood, 1
+            WHERE NEW.user_id IS NOT NULL AND NEW.date IS NOT NULL AND NEW.mood IS NOT NULL AND NEW.mood != ''
+            ON CONFLICT (user_id, day, mood) DO UPDATE SET entry_count = entry_count + 1;
+        END
+        ''',
+        '''
+        INSERT OR REPLACE INTO journal_mood_daily (user_id, day, mood, entry_count)
+        SELECT user_id, substr(date, 1, 10), mood, COUNT(*) FROM journal_entries
+        WHERE user_id IS NOT NULL AND date IS NOT NULL AND mood IS NOT NULL AND mood != ''
+        GROUP BY user_id, substr(date, 1, 10), mood
+        ''',
+    ]),
+    (4, "Voice overrides and change counter for the archetype registry", [
+        '''
+        CREATE TABLE IF NOT EXISTS archetype_voices (
+            name TEXT PRIMARY KEY,
+            voice_id TEXT NOT NULL,
+            updated_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS registry_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO registry_version (id, version) VALUES (1, 0)",
+    ] + [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_bump AFTER {event} ON {table}
+        BEGIN
+            UPDATE registry_version SET version = version + 1 WHERE id = 1;
+        END
+        '''
+        for table in ("archetypes", "archetype_voices")
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]),
+    (5, "Idempotency keys for inbound webhook messages", [
+        '''
+        CREATE TABLE IF NOT EXISTS inbound_messages (
+            message_sid TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            task_id TEXT,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_inbound_messages_expires ON inbound_messages (expires_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS inbound_message_stages (
+            message_sid TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            result TEXT,
+            completed_at REAL NOT NULL,
+            PRIMARY KEY (message_sid, stage)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (6, "Content-addressed TTS cache entries", [
+        '''
+        CREATE TABLE IF NOT EXISTS tts_cache_entries (
+            cache_key TEXT PRIMARY KEY,
+            engine TEXT NOT NULL,
+            voice_id TEXT,
+            path TEXT NOT NULL,
+            bytes INTEGER,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            last_hit_at TEXT
+        )
+        ''',
+    ]),
+    (7, "Audio store accounting and send pins for LRU eviction", [
+        '''
+        CREATE TABLE IF NOT EXISTS audio_files (
+            rel_path TEXT PRIMARY KEY,
+            bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_audio_files_last_access ON audio_files (last_access)",
+        "CREATE INDEX IF NOT EXISTS idx_audio_files_created_at ON audio_files (created_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS audio_pins (
+            pin_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rel_path TEXT NOT NULL,
+            message_sid TEXT,
+            expires_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_audio_pins_path ON audio_pins (rel_path, expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_audio_pins_message ON audio_pins (message_sid)",
+    ]),
+    (8, "Subscriptions and resumable broadcast fan-out", [
+        '''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            recipient TEXT PRIMARY KEY,
+            timezone TEXT NOT NULL DEFAULT 'UTC',
+            enabled INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS subscription_programs (
+            program TEXT NOT NULL,
+            recipient TEXT NOT NULL REFERENCES subscriptions (recipient) ON DELETE CASCADE,
+            PRIMARY KEY (program, recipient)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_subscription_programs_recipient ON subscription_programs (recipient)",
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            broadcast_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            broadcast_key TEXT NOT NULL UNIQUE,
+            program TEXT NOT NULL,
+            body TEXT NOT NULL,
+            media_url TEXT,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            completed_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status, updated_at)",
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts (broadcast_id) ON DELETE CASCADE,
+            recipient TEXT NOT NULL,
+            status TEXT NOT NULL,
+            claimed_at REAL,
+            message_sid TEXT,
+            error TEXT,
+            PRIMARY KEY (broadcast_id, recipient)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients (broadcast_id, status)",
+    ]),
+    (9, "Per-recipient due-time queue for timezone-aware scheduling", [
+        '''
+        CREATE TABLE IF NOT EXISTS schedule_due (
+            recipient TEXT NOT NULL REFERENCES subscriptions (recipient) ON DELETE CASCADE,
+            program TEXT NOT NULL,
+            next_due REAL NOT NULL,
+            PRIMARY KEY (recipient, program)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_schedule_due_next_due ON schedule_due (next_due)",
+        _backfill_schedule,
+    ]),
+    (10, "Shared tier of the LLM response cache", [
+        '''
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_key TEXT NOT NULL,
+            mode TEXT,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_key ON llm_response_cache (cache_key, expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires ON llm_response_cache (expires_at)",
+    ]),
+    (11, "Whisper transcripts cached by audio content hash", [
+        '''
+        CREATE TABLE IF NOT EXISTS transcriptions (
+            content_hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            chunks INTEGER NOT NULL DEFAULT 1,
+            duration REAL,
+            created_at TEXT
+        )
+        ''',
+    ]),
+    (12, "Journal export jobs and cached per-month Markdown fragments", [
+        '''
+        CREATE TABLE IF NOT EXISTS journal_exports (
+            export_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            format TEXT NOT NULL,
+            status TEXT NOT NULL,
+            path TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS journal_export_fragments (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            entry_count INTEGER NOT NULL,
+            max_entry_id INTEGER NOT NULL,
+            markdown TEXT NOT NULL,
+            rendered_at REAL NOT NULL,
+            PRIMARY KEY (user_id, month)
+        )
+        ''',
+        # A new entry changes the month's (count, max id) fingerprint; edits and
+        # deletes drop the cached fragment outright.
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_export_update AFTER UPDATE ON journal_entries
+        BEGIN
+            DELETE FROM journal_export_fragments
+            WHERE (user_id = OLD.user_id AND month = COALESCE(substr(OLD.date, 1, 7), ''))
+               OR (user_id = NEW.user_id AND month = COALESCE(substr(NEW.date, 1, 7), ''));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_export_delete AFTER DELETE ON journal_entries
+        BEGIN
+            DELETE FROM journal_export_fragments
+            WHERE user_id = OLD.user_id AND month = COALESCE(substr(OLD.date, 1, 7), '');
+        END
+        ''',
+    ]),
+    (13, "Per-user conversation turns and rolling summaries", [
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_turns (
+            turn_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_conversation_turns_user ON conversation_turns (user_id, channel, turn_id)",
+        '''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            user_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            summary TEXT NOT NULL DEFAULT '',
+            summary_tokens INTEGER NOT NULL DEFAULT 0,
+            covered_through INTEGER NOT NULL DEFAULT 0,
+            refresh_requested_at REAL,
+            updated_at REAL,
+            PRIMARY KEY (user_id, channel)
+        )
+        ''',
+    ]),
+    (14, "FTS5 index and normalized tags for journal entries and archetypes", [
+        # External-content FTS table: the text lives only in journal_entries and
+        # the triggers keep the index in step with every insert, edit and delete.
+        # The owner column holds one token per user ('u' || hex(user_id)), so a
+        # search intersects with that user's doclist instead of ranking every
+        # user's matches. Prefix indexes keep "word*" queries cheap.
+        '''
+        CREATE VIEW IF NOT EXISTS journal_fts_content AS
+        SELECT id, entry_text, tags, mood, 'u' || hex(user_id) AS owner FROM journal_entries
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS journal_fts USING fts5(
+            entry_text, tags, mood, owner,
+            content = 'journal_fts_content', content_rowid = 'id',
+            tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_fts_insert AFTER INSERT ON journal_entries
+        BEGIN
+            INSERT INTO journal_fts (rowid, entry_text, tags, mood, owner)
+            VALUES (NEW.id, NEW.entry_text, NEW.tags, NEW.mood, 'u' || hex(NEW.user_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_fts_delete AFTER DELETE ON journal_entries
+        BEGIN
+            INSERT INTO journal_fts (journal_fts, rowid, entry_text, tags, mood, owner)
+            VALUES ('delete', OLD.id, OLD.entry_text, OLD.tags, OLD.mood, 'u' || hex(OLD.user_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_fts_update AFTER UPDATE OF user_id, entry_text, tags, mood ON journal_entries
+        BEGIN
+            INSERT INTO journal_fts (journal_fts, rowid, entry_text, tags, mood, owner)
+            VALUES ('delete', OLD.id, OLD.entry_text, OLD.tags, OLD.mood, 'u' || hex(OLD.user_id));
+            INSERT INTO journal_fts (rowid, entry_text, tags, mood, owner)
+            VALUES (NEW.id, NEW.entry_text, NEW.tags, NEW.mood, 'u' || hex(NEW.user_id));
+        END
+        ''',
+        "INSERT INTO journal_fts (journal_fts) VALUES ('rebuild')",
+        '''
+        CREATE TABLE IF NOT EXISTS tags (
+            tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS journal_entry_tags (
+            entry_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (entry_id, tag_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_journal_entry_tags_tag ON journal_entry_tags (tag_id, entry_id)",
+        '''
+        CREATE TABLE IF NOT EXISTS archetype_tags (
+            archetype_name TEXT NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (archetype_name, tag_id)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_archetype_tags_tag ON archetype_tags (tag_id, archetype_name)",
+        # The free-text tags columns stay the source of truth; these triggers
+        # re-derive the join rows whenever they change.
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_tags_insert AFTER INSERT ON journal_entries
+        WHEN NEW.tags IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO tags (name) {_tag_names("NEW.tags")};
+            INSERT OR IGNORE INTO journal_entry_tags (entry_id, tag_id)
+            SELECT NEW.id, tag_id FROM tags WHERE name IN ({_tag_names("NEW.tags")});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_tags_update AFTER UPDATE OF id, tags ON journal_entries
+        BEGIN
+            DELETE FROM journal_entry_tags WHERE entry_id = OLD.id;
+            INSERT OR IGNORE INTO tags (name) {_tag_names("NEW.tags")};
+            INSERT OR IGNORE INTO journal_entry_tags (entry_id, tag_id)
+            SELECT NEW.id, tag_id FROM tags WHERE name IN ({_tag_names("NEW.tags")});
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_tags_delete AFTER DELETE ON journal_entries
+        BEGIN
+            DELETE FROM journal_entry_tags WHERE entry_id = OLD.id;
+        END
+        ''',
+        # INSERT OR REPLACE on archetypes skips delete triggers, so the insert
+        # trigger clears the old rows itself.
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_archetype_tags_insert AFTER INSERT ON archetypes
+        BEGIN
+            DELETE FROM archetype_tags WHERE archetype_name = NEW.name;
+            INSERT OR IGNORE INTO tags (name) {_tag_names("NEW.tags")};
+            INSERT OR IGNORE INTO archetype_tags (archetype_name, tag_id)
+            SELECT NEW.name, tag_id FROM tags WHERE name IN ({_tag_names("NEW.tags")});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_archetype_tags_update AFTER UPDATE OF name, tags ON archetypes
+        BEGIN
+            DELETE FROM archetype_tags WHERE archetype_name = OLD.name;
+            INSERT OR IGNORE INTO tags (name) {_tag_names("NEW.tags")};
+            INSERT OR IGNORE INTO archetype_tags (archetype_name, tag_id)
+            SELECT NEW.name, tag_id FROM tags WHERE name IN ({_tag_names("NEW.tags")});
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_archetype_tags_delete AFTER DELETE ON archetypes
+        BEGIN
+            DELETE FROM archetype_tags WHERE archetype_name = OLD.name;
+        END
+        ''',
+    ] + _backfill_tag_steps("journal_entries", "id", "journal_entry_tags", "entry_id")
+      + _backfill_tag_steps("archetypes", "name", "archetype_tags", "archetype_name")),
+    (15, "Database identity and edit tracking for the journal vector index", [
+        # A random id per database file lets the on-disk vector index notice
+        # that the database was recreated and its entry ids reused.
+        '''
+        CREATE TABLE IF NOT EXISTS db_instance (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            instance_id TEXT NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO db_instance (id, instance_id) VALUES (1, lower(hex(randomblob(16))))",
+        '''
+        CREATE TABLE IF NOT EXISTS journal_embedding_stale (
+            user_id TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, entry_id)
+        ) WITHOUT ROWID
+        ''',
+        # Edited or reassigned entries are re-embedded (or dropped from the old
+        # owner's index) on that user's next indexing pass.
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_journal_embedding_update AFTER UPDATE OF user_id, entry_text ON journal_entries
+        BEGIN
+            INSERT OR IGNORE INTO journal_embedding_stale (user_id, entry_id) VALUES (OLD.user_id, OLD.id);
+            INSERT OR IGNORE INTO journal_embedding_stale (user_id, entry_id)
+            SELECT NEW.user_id, NEW.id WHERE NEW.user_id IS NOT OLD.user_id;
+        END
+        ''',
+    ]),
+    (16, "Drop journal export fragments rendered before entry fields were escaped", [
+        "DELETE FROM journal_export_fragments",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db_path=None):
+    """
+    Returns the highest migration version applied to a database.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        int: The applied schema version, or 0 for a fresh database.
+    """
+    conn = get_connection(db_path)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not exists:
+        return 0
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(db_path=None, target=None):
+    """
+    Applies all pending migrations up to ``target`` (default: latest).
+
+    Each migration runs in its own write transaction together with its
+    schema_migrations record, so a failure leaves the previous version intact
+    and concurrent workers never apply the same step twice.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        target (int): The version to migrate to. Defaults to LATEST_VERSION.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    target = LATEST_VERSION if target is None else target
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT
+            )
+        ''')
+    current = get_schema_version(db_path)
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        # BEGIN IMMEDIATE serializes concurrent workers starting up together;
+        # re-check inside the lock in case another process already applied it.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(db_path) >= version:
+                conn.commit()
+                continue
+            logger.info(f"Applying schema migration {version}: {description}")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
@@ -0,0 +1,154 @@
+import time
+import threading
+from datetime import datetime
+from app.config import Config
+from app.utils.db import get_connection, resolve_db_path
+
+# === Archetype & Voice Registry ===
+#
+# Archetype prompts and ElevenLabs voice IDs are loaded into memory once per
+# process. Triggers bump a single-row change counter (registry_version) on any
+# edit to archetypes or archetype_voices; each process re-reads that counter
+# at most every Config.REGISTRY_CHECK_INTERVAL seconds and reloads only when
+# it has moved, so edits propagate across gunicorn and Celery workers without
+# a restart and without a query per request.
+
+BUILTIN_ARCHETYPES = frozenset(Config.VOICE_MAP)
+DEFAULT_ARCHETYPE = "Beau"
+
+
+class ArchetypeRegistry:
+    def __init__(self, db_path=None, check_interval=None):
+        """
+        Initializes a registry backed by one SQLite database.
+
+        Args:
+            db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+            check_interval (float): Seconds between change-counter checks (default Config.REGISTRY_CHECK_INTERVAL).
+        """
+        self.db_path = db_path
+        self.check_interval = Config.REGISTRY_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = float("-inf")
+        self._prompts = {}
+        self._voices = dict(Config.VOICE_MAP)
+
+    def _read_version(self, conn):
+        row = conn.execute("SELECT version FROM registry_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            conn = get_connection(self.db_path)
+            version = self._read_version(conn)
+            if version != self._version:
+                self._load(conn, version)
+            self._checked_at = now
+
+    def _load(self, conn, version):
+        prompts = {
+            name: (tone, template)
+            for name, tone, template in conn.execute("SELECT name, tone, template FROM archetypes")
+        }
+        voices = dict(Config.VOICE_MAP)
+        voices.update(conn.execute("SELECT name, voice_id FROM archetype_voices").fetchall())
+        # Swap whole dicts so readers never see a half-built registry.
+        self._prompts = prompts
+        self._voices = voices
+        self._version = version
+
+    def invalidate(self):
+        """
+        Forces the next lookup to re-check the change counter.
+        """
+        self._checked_at = float("-inf")
+
+    def get_prompt(self, name):
+        """
+        Returns the stored tone and template for an archetype.
+
+        Args:
+            name (str): The archetype name.
+
+        Returns:
+            tuple: (tone, template), or None if the archetype is not stored.
+        """
+        self._refresh()
+        return self._prompts.get(name)
+
+    def get_voice_id(self, name):
+        """
+        Returns the ElevenLabs voice ID for an archetype, falling back to Beau's voice.
+
+        Args:
+            name (str): The archetype name.
+
+        Returns:
+            str: The voice ID.
+        """
+        self._refresh()
+        return self._voices.get(name) or self._voices[DEFAULT_ARCHETYPE]
+
+    def voice_map(self):
+        """
+        Returns a copy of the current archetype-to-voice mapping.
+        """
+        self._refresh()
+        return dict(self._voices)
+
+    def names(self):
+        """
+        Returns the names of all built-in and stored archetypes.
+        """
+        self._refresh()
+        return sorted(BUILTIN_ARCHETYPES | set(self._prompts))
+
+    def is_builtin(self, name):
+        """
+        Returns True if ``name`` is one of the built-in archetypes.
+        """
+        return name in BUILTIN_ARCHETYPES
+
+    def set_voice_map(self, new_map):
+        """
+        Persists voice mappings for archetypes and reloads this process's view.
+        Other processes pick the change up on their next counter check.
+
+        Args:
+            new_map (dict): Archetype name to ElevenLabs voice ID.
+        """
+        now = datetime.now().isoformat()
+        with get_connection(self.db_path) as conn:
+            conn.executemany('''
+                INSERT INTO archetype_voices (name, voice_id, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET voice_id = excluded.voice_id, updated_at = excluded.updated_at
+            ''', [(name, voice_id, now) for name, voice_id in new_map.items()])
+        self.invalidate()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(db_path=None):
+    """
+    Returns the process-wide archetype registry for a database, creating it on first use.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        ArchetypeRegistry: The shared registry.
+    """
+    key = resolve_db_path(db_path)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(key, ArchetypeRegistry(db_path))
+    return registry
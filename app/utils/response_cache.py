@@ -0,0 +1,186 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from app.config import Config
+from app.utils.db import get_connection
+from app.utils.tts_cache import normalize_text
+
+# === LLM Response Cache ===
+#
+# Opt-in (Config.LLM_CACHE_ENABLED). Completions are keyed by (model, system
+# message, normalized user content, temperature, max_tokens), so the fixed
+# scaffolds and common short prompts stop reaching the API. A bounded
+# in-process LRU sits in front of the llm_response_cache table, which every
+# web and Celery process shares. Each key keeps up to Config.LLM_CACHE_VARIANTS
+# responses: until that many exist a lookup is a miss and the new completion
+# is added, after which hits sample one at random so replies don't read canned.
+# Lifetimes are per prompt mode (Config.LLM_CACHE_MODE_TTLS); a TTL of 0
+# leaves that mode uncached.
+
+
+def response_cache_key(model, messages, temperature, max_tokens):
+    """
+    Builds the hash identifying one completion request.
+
+    Args:
+        model (str): The OpenAI model.
+        messages (list): The chat messages; whitespace in contents is normalized.
+        temperature (float): The sampling temperature.
+        max_tokens (int): The completion token cap.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    payload = json.dumps(
+        [model, [[m["role"], normalize_text(m["content"])] for m in messages], temperature, max_tokens],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path=None, maxsize=None, variants=None, shared=None):
+        """
+        Initializes a response cache.
+
+        Args:
+            db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+            maxsize (int): Keys held in the in-process LRU.
+            variants (int): Responses collected per key before hits are served.
+            shared (bool): Whether to read and write the SQLite tier.
+        """
+        self.db_path = db_path
+        self.maxsize = maxsize or Config.LLM_CACHE_MAXSIZE
+        self.variants = max(1, variants or Config.LLM_CACHE_VARIANTS)
+        self.shared = Config.LLM_CACHE_SHARED if shared is None else shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def ttl_for(mode):
+        """
+        Returns the lifetime in seconds for responses to a prompt mode (0: don't cache).
+        """
+        return Config.LLM_CACHE_MODE_TTLS.get(mode or "", Config.LLM_CACHE_DEFAULT_TTL)
+
+    def get(self, key):
+        """
+        Returns one cached response for ``key`` once enough variants exist.
+
+        Args:
+            key (str): A response_cache_key().
+
+        Returns:
+            str: A randomly chosen variant, or None on a miss.
+        """
+        now = time.time()
+        variants = self._memory_variants(key, now)
+        if variants is None and self.shared:
+            variants = self._load(key, now)
+            with self._lock:
+                self._remember(key, variants)
+
+        with self._lock:
+            if variants and len(variants) >= self.variants:
+                self.hits += 1
+                return random.choice(variants)[1]
+            self.misses += 1
+        return None
+
+    def put(self, key, response, mode=None):
+        """
+        Adds a response as one variant of ``key``.
+
+        Args:
+            key (str): A response_cache_key().
+            response (str): The completion text.
+            mode (str): The prompt mode, which selects the TTL.
+        """
+        ttl = self.ttl_for(mode)
+        if ttl <= 0 or not response:
+            return
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            variants = [v for v in self._entries.get(key, []) if v[0] > now]
+            if len(variants) >= self.variants:
+                return
+            self._remember(key, variants + [(expires_at, response)])
+        if self.shared:
+            with get_connection(self.db_path) as conn:
+                conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ? AND expires_at <= ?", (key, now))
+                conn.execute('''
+                    INSERT INTO llm_response_cache (cache_key, mode, response, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (key, mode, response, now, expires_at))
+
+    def purge_expired(self):
+        """
+        Deletes expired rows from the shared tier.
+
+        Returns:
+            int: The number of rows removed.
+        """
+        with get_connection(self.db_path) as conn:
+            return conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self):
+        """
+        Returns this process's hit/miss counters.
+
+        Returns:
+            dict: {"hits": int, "misses": int}.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _memory_variants(self, key, now):
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is None:
+                return None
+            self._entries.move_to_end(key)
+            live = [v for v in variants if v[0] > now]
+            # Once enough variants are held locally there is nothing to gain from the shared tier.
+            return live if len(live) >= self.variants or not self.shared else None
+
+    def _load(self, key, now):
+        with get_connection(self.db_path) as conn:
+            rows = conn.execute('''
+                SELECT expires_at, response FROM llm_response_cache
+                WHERE cache_key = ? AND expires_at > ?
+                ORDER BY id LIMIT ?
+            ''', (key, now, self.variants)).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def _remember(self, key, variants):
+        self._entries[key] = variants
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the process-wide response cache, or None unless Config.LLM_CACHE_ENABLED.
+
+    Returns:
+        ResponseCache: The shared cache.
+    """
+    global _cache
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,531 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.config import Config
+from app.utils.db import get_connection, resolve_db_path
+
+# === Journal Retrieval ===
+#
+# Journal entries are embedded into unit-length float32 vectors and stored per
+# user in RETRIEVAL_INDEX_DIR/<db path hash>/<user hash>/ as two flat files:
+#   vectors.f32 - a (capacity, dim) float32 matrix, read through np.memmap
+#   ids.i64     - the journal entry id of each row
+#   meta.json   - embedder name, dim, row count, the last indexed entry id
+#                 and the database's instance id
+# Because the vectors are normalized, cosine similarity is a single
+# matrix-vector product over the mapped rows, and argpartition picks the top k
+# without sorting every score. Mappings stay open between searches (up to
+# MAX_MAPPED_INDEXES users), so a repeat search touches no page it has
+# already faulted in. The files grow by doubling and new entries are
+# appended in place. Indexing is incremental: only entries with an id above
+# the last indexed one are embedded. Searches catch up first, so an entry
+# added without the hook is never missed. Rows whose entry has since been
+# deleted are dropped when results are joined back to journal_entries.
+# Edits are queued in journal_embedding_stale by a trigger (migration 15)
+# and those rows are re-embedded in place on the next pass.
+#
+# Entry ids are only meaningful for one database, so the index is rebuilt if
+# the database's instance id changes (it was recreated) or the journal's
+# AUTOINCREMENT sequence is below the last indexed id (restored from an older
+# copy).
+#
+# The embedder is pluggable (RETRIEVAL_EMBEDDER). "hashing" is a local
+# feature-hashing embedder that needs no network and suits tests and offline
+# use. "openai" uses the embeddings API. Switching embedders rebuilds the index.
+
+INDEX_BATCH = 256
+MIN_CAPACITY = 1024
+MAX_MAPPED_INDEXES = 64
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+# === Embedders ===
+
+class HashingEmbedder:
+    def __init__(self, dim=None):
+        """
+        Initializes a feature-hashing embedder: words and word pairs are hashed
+        into ``dim`` signed buckets with sublinear term weights.
+
+        Args:
+            dim (int): Vector size. Defaults to Config.RETRIEVAL_DIM.
+        """
+        self.dim = dim or Config.RETRIEVAL_DIM
+        self.name = f"hashing-{self.dim}"
+
+    def _features(self, text):
+        words = TOKEN_PATTERN.findall((text or "").lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        """
+        Embeds texts as unit-length vectors.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dim) float32 array.
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                counts[bucket] = counts.get(bucket, 0.0) + sign
+            for bucket, value in counts.items():
+                vectors[row, bucket] = np.sign(value) * (1.0 + np.log(abs(value))) if value else 0.0
+        return normalize(vectors)
+
+
+class OpenAIEmbedder:
+    def __init__(self, model=None, dim=None):
+        """
+        Initializes an embedder backed by the OpenAI embeddings API.
+
+        Args:
+            model (str): Embedding model. Defaults to Config.RETRIEVAL_OPENAI_MODEL.
+            dim (int): Vector size requested from the API. Defaults to Config.RETRIEVAL_DIM.
+        """
+        self.model = model or Config.RETRIEVAL_OPENAI_MODEL
+        self.dim = dim or Config.RETRIEVAL_DIM
+        self.name = f"openai-{self.model}-{self.dim}"
+
+    def embed(self, texts):
+        from app.llm import client
+        from app.utils.llm_limiter import get_llm_limiter
+
+        if client is None:
+            raise Exception("OPENAI_API_KEY is not set.")
+        with get_llm_limiter().slot(sum(len(text or "") // 4 for text in texts)):
+            response = client.embeddings.create(
+                model=self.model, input=[text or " " for text in texts], dimensions=self.dim
+            )
+        return normalize(np.array([item.embedding for item in response.data], dtype=np.float32))
+
+
+EMBEDDERS = {"hashing": HashingEmbedder, "openai": OpenAIEmbedder}
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Returns the process-wide embedder selected by Config.RETRIEVAL_EMBEDDER,
+    creating it on first use.
+
+    Returns:
+        HashingEmbedder | OpenAIEmbedder: The shared embedder.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = EMBEDDERS[Config.RETRIEVAL_EMBEDDER]()
+    return _embedder
+
+
+# === Per-User Vector Index ===
+
+class JournalIndex:
+    def __init__(self, user_id, index_dir=None, db_path=None):
+        """
+        Opens (without loading) a user's vector index.
+
+        Args:
+            user_id (str): Whose journal the index covers.
+            index_dir (str): Root directory for indexes. Defaults to Config.RETRIEVAL_INDEX_DIR.
+            db_path (str): The database the journal lives in. Defaults to Config.DATABASE_PATH.
+        """
+        db_key = hashlib.sha256(os.path.abspath(resolve_db_path(db_path)).encode("utf-8")).hexdigest()[:12]
+        user_key = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+        self.path = os.path.join(index_dir or Config.RETRIEVAL_INDEX_DIR, db_key, user_key)
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.ids_path = os.path.join(self.path, "ids.i64")
+        self.meta_path = os.path.join(self.path, "meta.json")
+
+    def meta(self):
+        """
+        Returns the index metadata.
+
+        Returns:
+            dict: {"embedder", "dim", "count", "capacity", "last_id", "db_instance"};
+            count 0 if the index is new.
+        """
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"embedder": None, "dim": 0, "count": 0, "capacity": 0, "last_id": 0, "db_instance": None}
+
+    def _write_meta(self, meta):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def locked(self):
+        """
+        Returns an exclusive file lock for writers, shared by web and Celery processes.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        return _FileLock(os.path.join(self.path, "lock"))
+
+    def append(self, embedder, entry_ids, vectors):
+        """
+        Appends vectors for new entries, growing the files by doubling when full.
+        Call with locked() held.
+
+        Args:
+            embedder: The embedder that produced the vectors.
+            entry_ids (list): Journal entry ids, ascending.
+            vectors (np.ndarray): A (len(entry_ids), dim) float32 array of unit vectors.
+        """
+        meta = self.meta()
+        if meta["embedder"] != embedder.name:
+            meta = {"embedder": embedder.name, "dim": embedder.dim, "count": 0, "capacity": 0,
+                    "last_id": 0, "db_instance": meta.get("db_instance")}
+            self._remove_files()
+        count, dim = meta["count"], meta["dim"]
+        needed = count + len(entry_ids)
+        if needed > meta["capacity"]:
+            capacity = max(MIN_CAPACITY, meta["capacity"])
+            while capacity < needed:
+                capacity *= 2
+            for path, itemsize in ((self.vectors_path, 4 * dim), (self.ids_path, 8)):
+                with open(path, "ab") as f:
+                    f.truncate(capacity * itemsize)
+            meta["capacity"] = capacity
+
+        rows = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(meta["capacity"], dim))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r+", shape=(meta["capacity"],))
+        rows[count:needed] = vectors
+        ids[count:needed] = entry_ids
+        rows.flush()
+        ids.flush()
+        del rows, ids
+        # Readers only see rows up to count, so the new rows appear once meta lands.
+        self._write_meta({**meta, "count": needed, "last_id": max(meta["last_id"], int(entry_ids[-1]))})
+
+    def replace(self, entry_ids, vectors):
+        """
+        Overwrites the rows of already indexed entries. A zero vector with
+        entry id 0 retires a row, since no journal entry has id 0.
+        Call with locked() held.
+
+        Args:
+            entry_ids (list): Journal entry ids to overwrite.
+            vectors (np.ndarray): A (len(entry_ids), dim) float32 array; all-zero rows are retired.
+
+        Returns:
+            set: The entry ids that had a row.
+        """
+        meta = self.meta()
+        count, dim = meta["count"], meta["dim"]
+        if count == 0 or not entry_ids:
+            return set()
+        rows = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(meta["capacity"], dim))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r+", shape=(meta["capacity"],))
+        positions = np.flatnonzero(np.isin(ids[:count], entry_ids))
+        by_id = {int(entry_id): row for row, entry_id in enumerate(entry_ids)}
+        found = {int(ids[position]) for position in positions}
+        for position in positions:
+            vector = vectors[by_id[int(ids[position])]]
+            rows[position] = vector
+            if not vector.any():
+                ids[position] = 0
+        rows.flush()
+        ids.flush()
+        del rows, ids
+        return found
+
+    def search(self, query_vector, k):
+        """
+        Finds the rows most similar to a unit query vector.
+
+        Args:
+            query_vector (np.ndarray): A (dim,) float32 unit vector.
+            k (int): How many matches to return.
+
+        Returns:
+            list: (entry_id, score) pairs, best first.
+        """
+        meta = self.meta()
+        count = meta["count"]
+        if count == 0 or k <= 0 or meta["dim"] != len(query_vector):
+            return []
+        rows, ids = self._mapped(meta["dim"])
+        scores = rows[:count] @ query_vector
+        if k < count:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _mapped(self, dim):
+        """
+        Returns read-only maps of the vector and id files, reusing open ones
+        unless the files were grown or replaced since.
+        """
+        stat = os.stat(self.vectors_path)
+        signature = (stat.st_ino, stat.st_size, dim)
+        with _mapped_lock:
+            cached = _mapped_indexes.get(self.path)
+            if cached and cached[0] == signature:
+                _mapped_indexes.move_to_end(self.path)
+                return cached[1], cached[2]
+        capacity = stat.st_size // (4 * dim)
+        rows = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(capacity, dim))
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(capacity,))
+        with _mapped_lock:
+            _mapped_indexes[self.path] = (signature, rows, ids)
+            _mapped_indexes.move_to_end(self.path)
+            while len(_mapped_indexes) > MAX_MAPPED_INDEXES:
+                _mapped_indexes.popitem(last=False)
+        return rows, ids
+
+    def reset(self):
+        """
+        Empties the index; the next indexing pass re-embeds every entry.
+        """
+        with self.locked():
+            self._remove_files(self.meta_path)
+
+    def _remove_files(self, *extra):
+        # New files rather than truncating: searches may still map the old ones.
+        for path in (self.vectors_path, self.ids_path, *extra):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+_mapped_indexes = OrderedDict()
+_mapped_lock = threading.Lock()
+
+
+class _FileLock:
+    # An exclusive lock on a sidecar file: flock on POSIX, msvcrt on Windows.
+    # The platform module is imported here so importing retrieval works everywhere.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a+")
+        try:
+            import fcntl
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            self.file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ten one-second retries.
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            import fcntl
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        except ImportError:
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.file.close()
+
+
+# === Indexing & Search ===
+
+def index_journal_entries(user_id, db_path=None, index_dir=None, embedder=None):
+    """
+    Embeds a user's journal entries that are not yet in their index, and
+    re-embeds entries edited since they were indexed.
+
+    Args:
+        user_id (str): Whose entries to index.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        index_dir (str): Root directory for indexes. Defaults to Config.RETRIEVAL_INDEX_DIR.
+        embedder: Embedder to use. Defaults to get_embedder().
+
+    Returns:
+        int: How many entries were added or re-embedded.
+    """
+    embedder = embedder or get_embedder()
+    conn = get_connection(db_path)
+    index = JournalIndex(user_id, index_dir, db_path)
+    if _is_current(conn, index.meta(), user_id, embedder):
+        return 0
+
+    added = 0
+    with index.locked():
+        meta = index.meta()
+        instance, sequence = _db_identity(conn)
+        if (meta["embedder"] != embedder.name or meta.get("db_instance") != instance
+                or meta["last_id"] > sequence):
+            index._remove_files()
+            meta = {"embedder": embedder.name, "dim": embedder.dim, "count": 0, "capacity": 0,
+                    "last_id": 0, "db_instance": instance}
+            index._write_meta(meta)
+            with conn:
+                conn.execute("DELETE FROM journal_embedding_stale WHERE user_id = ?", (user_id,))
+        else:
+            added += _refresh_edited(conn, index, user_id, meta["last_id"], embedder)
+
+        cursor = conn.execute('''
+            SELECT id, entry_text FROM journal_entries
+            WHERE user_id = ? AND id > ? ORDER BY id
+        ''', (user_id, meta["last_id"]))
+        try:
+            while True:
+                rows = cursor.fetchmany(INDEX_BATCH)
+                if not rows:
+                    break
+                index.append(embedder, [row[0] for row in rows], embedder.embed([row[1] for row in rows]))
+                added += len(rows)
+        finally:
+            cursor.close()
+    return added
+
+
+def _db_identity(conn):
+    # The database's instance id and the highest journal entry id it has ever issued.
+    return conn.execute('''
+        SELECT (SELECT instance_id FROM db_instance),
+               COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'journal_entries'), 0)
+    ''').fetchone()
+
+
+def _is_current(conn, meta, user_id, embedder):
+    if meta["embedder"] != embedder.name:
+        return False
+    instance, sequence = _db_identity(conn)
+    if meta.get("db_instance") != instance or meta["last_id"] > sequence:
+        return False
+    newer, edited = conn.execute('''
+        SELECT EXISTS (SELECT 1 FROM journal_entries WHERE user_id = ? AND id > ?),
+               EXISTS (SELECT 1 FROM journal_embedding_stale WHERE user_id = ?)
+    ''', (user_id, meta["last_id"], user_id)).fetchone()
+    return not newer and not edited
+
+
+def _refresh_edited(conn, index, user_id, last_id, embedder):
+    # Re-embeds indexed entries queued by the edit trigger. Entries deleted or
+    # moved to another user are retired with a zero row; ones moved in from
+    # another user are appended. Markers are claimed before the text is read
+    # and put back if embedding fails, so an edit made meanwhile is not lost.
+    claimed = [row[0] for row in conn.execute(
+        "SELECT entry_id FROM journal_embedding_stale WHERE user_id = ? ORDER BY entry_id", (user_id,)
+    )]
+    with conn:
+        conn.executemany(
+            "DELETE FROM journal_embedding_stale WHERE user_id = ? AND entry_id = ?",
+            [(user_id, entry_id) for entry_id in claimed]
+        )
+    entry_ids = [entry_id for entry_id in claimed if entry_id <= last_id]
+    texts = {}
+    for start in range(0, len(entry_ids), INDEX_BATCH):
+        batch = entry_ids[start:start + INDEX_BATCH]
+        placeholders = ", ".join("?" for _ in batch)
+        texts.update(conn.execute(
+            f"SELECT id, entry_text FROM journal_entries WHERE user_id = ? AND id IN ({placeholders})",
+            (user_id, *batch)
+        ))
+    if not entry_ids:
+        return 0
+    try:
+        vectors = np.zeros((len(entry_ids), embedder.dim), dtype=np.float32)
+        current = [row for row, entry_id in enumerate(entry_ids) if entry_id in texts]
+        if current:
+            vectors[current] = embedder.embed([texts[entry_ids[row]] for row in current])
+        found = index.replace(entry_ids, vectors)
+        moved_in = [row for row in current if entry_ids[row] not in found]
+        if moved_in:
+            index.append(embedder, [entry_ids[row] for row in moved_in], vectors[moved_in])
+        return len(found) + len(moved_in)
+    except Exception:
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO journal_embedding_stale (user_id, entry_id) VALUES (?, ?)",
+                [(user_id, entry_id) for entry_id in entry_ids]
+            )
+        raise
+
+
+def search_journal(user_id, query, k=None, min_score=None, db_path=None, index_dir=None, embedder=None):
+    """
+    Returns the user's journal entries most similar to ``query``.
+
+    Args:
+        user_id (str): Whose journal to search.
+        query (str): The text to match, e.g. the user's message.
+        k (int): How many entries to return. Defaults to Config.RETRIEVAL_TOP_K.
+        min_score (float): Lowest cosine similarity kept. Defaults to Config.RETRIEVAL_MIN_SCORE.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        index_dir (str): Root directory for indexes. Defaults to Config.RETRIEVAL_INDEX_DIR.
+        embedder: Embedder to use. Defaults to get_embedder().
+
+    Returns:
+        list: {"id", "date", "entry_text", "score"} dicts, best first.
+    """
+    k = Config.RETRIEVAL_TOP_K if k is None else k
+    min_score = Config.RETRIEVAL_MIN_SCORE if min_score is None else min_score
+    if not query or k <= 0:
+        return []
+    embedder = embedder or get_embedder()
+    index_journal_entries(user_id, db_path, index_dir, embedder)
+
+    # Over-fetch a little so entries deleted since indexing don't shrink the result.
+    hits = [(entry_id, score) for entry_id, score in
+            JournalIndex(user_id, index_dir, db_path).search(embedder.embed([query])[0], k * 2) if score >= min_score]
+    if not hits:
+        return []
+    placeholders = ", ".join("?" for _ in hits)
+    rows = {row[0]: row[1:] for row in get_connection(db_path).execute(
+        f"SELECT id, date, entry_text FROM journal_entries WHERE user_id = ? AND id IN ({placeholders})",
+        (user_id, *[entry_id for entry_id, _ in hits])
+    )}
+    matches = [{"id": entry_id, "date": rows[entry_id][0], "entry_text": rows[entry_id][1], "score": round(score, 4)}
+               for entry_id, score in hits if entry_id in rows]
+    return matches[:k]
+
+
+def format_journal_context(matches, max_chars=None):
+    """
+    Formats retrieved entries as a system message for the prompt.
+
+    Args:
+        matches (list): Results of search_journal().
+        max_chars (int): Longest excerpt per entry. Defaults to Config.RETRIEVAL_MAX_CHARS.
+
+    Returns:
+        dict | None: A chat message, or None if there are no matches.
+    """
+    if not matches:
+        return None
+    max_chars = max_chars or Config.RETRIEVAL_MAX_CHARS
+    lines = []
+    for match in matches:
+        text = " ".join((match["entry_text"] or "").split())
+        if len(text) > max_chars:
+            text = text[:max_chars].rsplit(" ", 1)[0] + "…"
+        lines.append(f"- {(match['date'] or '')[:10]}: {text}")
+    return {"role": "system", "content": "Relevant entries from the user's journal:\n" + "\n".join(lines)}
@@ -0,0 +1,134 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.utils.db import get_connection
+
+# === Timezone-Aware Due-Time Queue ===
+#
+# Every (recipient, program) pair has one row in schedule_due holding the UTC
+# timestamp of its next local delivery time. A dispatcher tick range-scans the
+# next_due index for rows that are due, hands them to the broadcast fan-out
+# and moves each row to its following occurrence. A tick therefore costs in
+# proportion to the users due right now, and load spreads across the day as
+# each timezone reaches 07:00, 21:00 and so on.
+
+# Local delivery times per program, in ascending order.
+PROGRAM_TIMES = {
+    "morning": [time(7, 0)],
+    "evening": [time(21, 0)],
+    "focus": [time(hour, 0) for hour in range(10, 17)],
+}
+
+UTC = ZoneInfo("UTC")
+
+
+def resolve_timezone(name):
+    """
+    Returns the ZoneInfo for an IANA name, falling back to UTC if it is unknown.
+
+    Args:
+        name (str): The timezone name, e.g. "America/New_York".
+
+    Returns:
+        ZoneInfo: The timezone.
+    """
+    try:
+        return ZoneInfo(name) if name else UTC
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"[DEBUG] Unknown timezone {name!r}, using UTC", flush=True)
+        return UTC
+
+
+def next_due_time(program, timezone_name, after):
+    """
+    Returns the first delivery time for a program strictly after ``after``.
+
+    Args:
+        program (str): The program name (a key of PROGRAM_TIMES).
+        timezone_name (str): The recipient's IANA timezone.
+        after (float): A UNIX timestamp.
+
+    Returns:
+        float | None: The next due UNIX timestamp, or None for an unscheduled program.
+    """
+    times = PROGRAM_TIMES.get(program)
+    if not times:
+        return None
+    tz = resolve_timezone(timezone_name)
+    today = datetime.fromtimestamp(after, tz).date()
+    # Three days covers a DST shift pushing today's last slot past midnight.
+    for offset in range(3):
+        day = today + timedelta(days=offset)
+        for local_time in times:
+            candidate = datetime.combine(day, local_time, tzinfo=tz).timestamp()
+            if candidate > after:
+                return candidate
+    return None
+
+
+def schedule_rows(recipient, programs, timezone_name, after):
+    """
+    Builds schedule_due rows for a recipient's programs.
+
+    Args:
+        recipient (str): The recipient address.
+        programs (iterable): Program names.
+        timezone_name (str): The recipient's IANA timezone.
+        after (float): Schedule the first occurrence after this UNIX timestamp.
+
+    Returns:
+        list: (recipient, program, next_due) tuples for scheduled programs.
+    """
+    rows = []
+    for program in programs:
+        due = next_due_time(program, timezone_name, after)
+        if due is not None:
+            rows.append((recipient, program, due))
+    return rows
+
+
+def due_entries(now, limit, db_path=None):
+    """
+    Returns up to ``limit`` schedule entries due at or before ``now``, oldest first.
+
+    Args:
+        now (float): The current UNIX timestamp.
+        limit (int): Maximum entries to return in one tick.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        list: Dicts with recipient, program, next_due and timezone.
+    """
+    rows = get_connection(db_path).execute('''
+        SELECT d.recipient, d.program, d.next_due, s.timezone
+        FROM schedule_due d
+        JOIN subscriptions s ON s.recipient = d.recipient
+        WHERE d.next_due <= ?
+        ORDER BY d.next_due
+        LIMIT ?
+    ''', (now, limit))
+    return [
+        {"recipient": r[0], "program": r[1], "next_due": r[2], "timezone": r[3]}
+        for r in rows
+    ]
+
+
+def advance_entries(entries, now, db_path=None):
+    """
+    Moves dispatched entries to their next occurrence after ``now``. Rows that
+    changed since they were read (e.g. a re-subscription) are left alone.
+
+    Args:
+        entries (list): Entries as returned by due_entries().
+        now (float): The current UNIX timestamp.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+    """
+    updates = []
+    for entry in entries:
+        due = next_due_time(entry["program"], entry["timezone"], now)
+        if due is not None:
+            updates.append((due, entry["recipient"], entry["program"], entry["next_due"]))
+    with get_connection(db_path) as conn:
+        conn.executemany(
+            "UPDATE schedule_due SET next_due = ? WHERE recipient = ? AND program = ? AND next_due = ?",
+            updates
+        )
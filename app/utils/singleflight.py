@@ -0,0 +1,263 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+from app.config import Config
+
+# === Single-Flight Request Coalescing ===
+#
+# Concurrent calls with the same key share one upstream call: the first caller
+# (the leader) runs it, and the rest wait for its result or exception. This
+# caps fan-in when a broadcast or a retry storm sends many identical LLM or TTS
+# requests at once. It is not a cache; the result is dropped as soon as the
+# flight lands.
+#
+# With SINGLEFLIGHT_REDIS_URL set, flights are also coalesced across gunicorn
+# and Celery processes: the leader holds a Redis lock and publishes its result
+# under the lock's token for a few seconds, while followers in other processes
+# poll for it. If the leader fails, or nothing lands within
+# SINGLEFLIGHT_WAIT_TIMEOUT, a follower makes the call itself. If Redis is
+# unreachable, coalescing falls back to the current process.
+#
+# AsyncSingleFlight does the same for coroutines on one event loop (the ASGI
+# engine). The leader's call runs as a task that every caller awaits through
+# asyncio.shield, so a caller disconnecting doesn't cancel the call for the
+# rest. It coalesces within the process only.
+
+POLL_INTERVAL = 0.05
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, redis_url=None, prefix="caelum:flight", wait_timeout=None, lock_ttl=None, result_ttl=None):
+        """
+        Initializes a single-flight group.
+
+        Args:
+            redis_url (str): Optional Redis URL for cross-process coalescing.
+            prefix (str): Namespace for the Redis keys.
+            wait_timeout (float): Longest a follower waits before calling upstream itself.
+            lock_ttl (float): Seconds a cross-process leader lock outlives a crashed leader.
+            result_ttl (float): Seconds a published result stays readable by followers.
+        """
+        self.prefix = prefix
+        self.wait_timeout = Config.SINGLEFLIGHT_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self.lock_ttl = Config.SINGLEFLIGHT_LOCK_TTL if lock_ttl is None else lock_ttl
+        self.result_ttl = Config.SINGLEFLIGHT_RESULT_TTL if result_ttl is None else result_ttl
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+            self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Runs ``fn`` once for all concurrent callers with the same ``key``.
+
+        Args:
+            key (str): Identifies identical calls.
+            fn (callable): Makes the upstream call. Its result must be JSON-serializable
+                when coalescing across processes.
+
+        Returns:
+            The leader's result.
+
+        Raises:
+            Exception: Whatever the leader's call raised.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                return fn()
+            with self._lock:
+                self.shared += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._lead(key, fn)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self):
+        """
+        Returns how many callers in this process were served another caller's result.
+
+        Returns:
+            dict: {"shared": int, "in_flight": int}.
+        """
+        with self._lock:
+            return {"shared": self.shared, "in_flight": len(self._flights)}
+
+    def _lead(self, key, fn):
+        # Coalesces the in-process leader with leaders in other processes.
+        if self.redis is None:
+            return fn()
+        lock_key = f"{self.prefix}:lock:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while True:
+                if self.redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                    break
+                owner = self.redis.get(lock_key)
+                if owner is None:
+                    continue
+                found, result = self._await_result(lock_key, owner.decode(), deadline)
+                if found:
+                    with self._lock:
+                        self.shared += 1
+                    return result
+                if time.monotonic() >= deadline:
+                    return fn()
+        except Exception as e:
+            if not self._is_redis_error(e):
+                raise
+            print(f"[DEBUG] Single-flight Redis error, coalescing within this process: {e}", flush=True)
+            self.redis = None
+            return fn()
+
+        try:
+            result = fn()
+            self._publish(lock_key, token, result)
+            return result
+        finally:
+            try:
+                self._release(keys=[lock_key], args=[token])
+            except Exception as e:
+                print(f"[DEBUG] Single-flight lock release failed: {e}", flush=True)
+
+    def _await_result(self, lock_key, owner, deadline):
+        """
+        Polls for the result of another process's flight.
+
+        Returns:
+            tuple: (True, result) once published, or (False, None) if that leader
+            released the lock without one or the deadline passed.
+        """
+        result_key = f"{lock_key}:{owner}"
+        while time.monotonic() < deadline:
+            payload = self.redis.get(result_key)
+            if payload is not None:
+                return True, json.loads(payload)
+            current = self.redis.get(lock_key)
+            if current is None or current.decode() != owner:
+                # Released: the result may have landed just before the lock went.
+                payload = self.redis.get(result_key)
+                if payload is not None:
+                    return True, json.loads(payload)
+                return False, None
+            time.sleep(POLL_INTERVAL)
+        return False, None
+
+    def _publish(self, lock_key, token, result):
+        try:
+            self.redis.set(f"{lock_key}:{token}", json.dumps(result), px=int(self.result_ttl * 1000))
+        except (TypeError, ValueError):
+            pass
+        except Exception as e:
+            print(f"[DEBUG] Single-flight result publish failed: {e}", flush=True)
+
+    @staticmethod
+    def _is_redis_error(error):
+        import redis
+        return isinstance(error, redis.RedisError)
+
+
+class AsyncSingleFlight:
+    def __init__(self, wait_timeout=None):
+        """
+        Initializes an asyncio single-flight group. Use it from one event loop.
+
+        Args:
+            wait_timeout (float): Longest a follower waits before calling upstream itself.
+        """
+        self.wait_timeout = Config.SINGLEFLIGHT_WAIT_TIMEOUT if wait_timeout is None else wait_timeout
+        self.shared = 0
+        self._flights = {}
+
+    async def do(self, key, fn):
+        """
+        Awaits ``fn()`` once for all concurrent callers with the same ``key``.
+
+        Args:
+            key (str): Identifies identical calls.
+            fn (callable): Returns the coroutine making the upstream call.
+
+        Returns:
+            The leader's result.
+
+        Raises:
+            Exception: Whatever the leader's call raised.
+        """
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+            return await asyncio.shield(task)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError:
+            return await fn()
+        self.shared += 1
+        return result
+
+    def stats(self):
+        """
+        Returns how many callers were served another caller's result.
+
+        Returns:
+            dict: {"shared": int, "in_flight": int}.
+        """
+        return {"shared": self.shared, "in_flight": len(self._flights)}
+
+
+_flight = None
+_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """
+    Returns the process-wide single-flight group, creating it on first use,
+    or None when Config.SINGLEFLIGHT_ENABLED is off.
+
+    Returns:
+        SingleFlight: The shared group.
+    """
+    global _flight
+    if not Config.SINGLEFLIGHT_ENABLED:
+        return None
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                _flight = SingleFlight(Config.SINGLEFLIGHT_REDIS_URL)
+    return _flight
@@ -0,0 +1,104 @@
+import re
+import json
+import base64
+import queue
+import threading
+import websocket
+from app.config import Config
+
+# === Sentence-Pipelined Speech ===
+#
+# LLM deltas are cut at sentence boundaries and each sentence is pushed into a
+# single ElevenLabs stream-input websocket session while generation continues.
+# Audio frames are yielded to the client as soon as ElevenLabs returns them, so
+# time to first audio is roughly one sentence of LLM output plus one sentence
+# of synthesis.
+
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*(?=\s)')
+
+
+def iter_sentences(deltas, min_chars=None):
+    """
+    Regroups streamed text deltas into sentences.
+
+    Args:
+        deltas (iterable): Text fragments in arrival order.
+        min_chars (int): Short sentences are merged until at least this many
+            characters are buffered (default Config.SPEECH_MIN_SENTENCE_CHARS).
+
+    Yields:
+        str: Complete sentences (stripped); any trailing remainder comes last.
+    """
+    min_chars = Config.SPEECH_MIN_SENTENCE_CHARS if min_chars is None else min_chars
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        cut = None
+        for match in SENTENCE_END.finditer(buffer):
+            if match.end() >= min_chars:
+                cut = match.end()
+                break
+        if cut is not None:
+            sentence, buffer = buffer[:cut].strip(), buffer[cut:]
+            if sentence:
+                yield sentence
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def stream_speech(sentences, voice_id, connect=None):
+    """
+    Synthesizes sentences through one ElevenLabs stream-input session and
+    yields MP3 bytes as they arrive. Sentences are sent from a background
+    thread, so upstream generation and audio delivery overlap.
+
+    Args:
+        sentences (iterable): Sentences to speak, possibly produced lazily.
+        voice_id (str): The ElevenLabs voice ID.
+        connect (callable): Websocket factory (default websocket.create_connection).
+
+    Yields:
+        bytes: MP3 audio chunks.
+
+    Raises:
+        Exception: If generating or sending sentences failed.
+    """
+    connect = connect or websocket.create_connection
+    url = (
+        f"wss://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream-input"
+        f"?model_id={Config.ELEVENLABS_MODEL_ID}&output_format={Config.ELEVENLABS_OUTPUT_FORMAT}"
+    )
+    ws = connect(url, header=[f"xi-api-key: {Config.ELEVENLABS_API_KEY}"], timeout=Config.ELEVENLABS_TIMEOUT)
+    errors = queue.Queue()
+
+    def send_sentences():
+        try:
+            ws.send(json.dumps({"text": " ", "voice_settings": Config.ELEVENLABS_VOICE_SETTINGS}))
+            for sentence in sentences:
+                ws.send(json.dumps({"text": sentence + " ", "try_trigger_generation": True}))
+        except Exception as e:
+            errors.put(e)
+        finally:
+            try:
+                # An empty text frame tells ElevenLabs to flush and close the stream.
+                ws.send(json.dumps({"text": ""}))
+            except Exception:
+                pass
+
+    sender = threading.Thread(target=send_sentences, name="speech-sender", daemon=True)
+    sender.start()
+    try:
+        while True:
+            frame = ws.recv()
+            if not frame:
+                break
+            message = json.loads(frame)
+            if message.get("audio"):
+                yield base64.b64decode(message["audio"])
+            if message.get("isFinal"):
+                break
+    finally:
+        ws.close()
+        sender.join(timeout=1)
+    if not errors.empty():
+        raise errors.get()
@@ -0,0 +1,65 @@
+import json
+import itertools
+
+# === Server-Sent Events ===
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx/ngrok-style proxies from buffering the stream.
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(data, event=None):
+    """
+    Formats one Server-Sent Events frame.
+
+    Args:
+        data (dict | str): The payload; dicts are JSON-encoded.
+        event (str): Optional event name. Unnamed frames are "message" events.
+
+    Returns:
+        str: The encoded frame, terminated by a blank line.
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def wants_stream(request, data=None):
+    """
+    Returns True if a request opted into a streamed response, either with
+    ``"stream": true`` in its JSON body or an ``Accept: text/event-stream`` header.
+
+    Args:
+        request: The Flask request.
+        data (dict): The parsed JSON body, if already available.
+
+    Returns:
+        bool: Whether to stream.
+    """
+    if data and data.get("stream"):
+        return True
+    return request.accept_mimetypes.best == "text/event-stream"
+
+
+def prime(iterator):
+    """
+    Pulls the first item of a lazy stream before the response starts, so
+    errors raised before the first token (e.g. overload) can still become a
+    regular HTTP error instead of a truncated stream.
+
+    Args:
+        iterator (iterable): The stream to prime.
+
+    Returns:
+        iterator: An iterator yielding the same items.
+    """
+    iterator = iter(iterator)
+    try:
+        first = next(iterator)
+    except StopIteration:
+        return iter(())
+    return itertools.chain([first], iterator)
@@ -0,0 +1,286 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from app.config import Config
+from app.utils.db import get_connection
+from app.utils.singleflight import get_single_flight
+
+# === Whisper Transcription Pipeline ===
+#
+# Uploads and WhatsApp voice notes are streamed to disk in fixed-size chunks
+# and hashed on the way, so memory stays flat and the content hash is known
+# without a second read. Transcripts are cached by that hash. When ffmpeg is
+# available, a recording longer than TRANSCRIBE_CHUNK_SECONDS is cut into
+# chunks that overlap by TRANSCRIBE_OVERLAP_SECONDS. Up to
+# TRANSCRIBE_PARALLELISM chunks are transcribed at once. The transcripts are
+# then stitched by dropping the words repeated in each overlap, so a long
+# voice journal takes roughly as long as its slowest chunk. Without ffmpeg the
+# file is sent whole. Once transcribed the upload is deleted; only the
+# transcript is kept.
+
+COPY_CHUNK_SIZE = 64 * 1024
+# Chunks are re-encoded small (mono 16 kHz) so each stays far below Whisper's upload limit.
+CHUNK_ENCODE_ARGS = ["-vn", "-ac", "1", "-ar", "16000", "-b:a", "32k"]
+MIN_STITCH_WORDS = 2
+MAX_STITCH_WORDS = 40
+
+AUDIO_EXTENSIONS = {
+    "audio/ogg": ".ogg",
+    "audio/mpeg": ".mp3",
+    "audio/mp4": ".m4a",
+    "audio/x-m4a": ".m4a",
+    "audio/wav": ".wav",
+    "audio/x-wav": ".wav",
+    "audio/webm": ".webm",
+    "audio/amr": ".amr",
+}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds Config.TRANSCRIBE_MAX_UPLOAD_BYTES."""
+
+
+def extension_for(content_type=None, filename=None):
+    """
+    Picks a file extension Whisper and ffmpeg will recognise.
+
+    Args:
+        content_type (str): The upload's MIME type.
+        filename (str): The client-supplied filename, if any.
+
+    Returns:
+        str: An extension such as ".ogg" (".bin" if unknown).
+    """
+    if filename:
+        ext = os.path.splitext(filename)[1].lower()
+        if re.fullmatch(r"\.[a-z0-9]{2,5}", ext):
+            return ext
+    mime = (content_type or "").split(";")[0].strip().lower()
+    return AUDIO_EXTENSIONS.get(mime, ".bin")
+
+
+def save_stream(stream, directory=None, extension=".bin", max_bytes=None):
+    """
+    Copies a file-like stream to disk in chunks, hashing it on the way.
+    The file is stored as ``<sha256>-<random><extension>``, one copy per
+    upload, so discarding it never pulls a file from under a concurrent
+    upload of the same audio.
+
+    Args:
+        stream: A file-like object with ``read(size)``.
+        directory (str): Destination directory. Defaults to Config.UPLOAD_DIR.
+        extension (str): File extension to store under.
+        max_bytes (int): Size limit. Defaults to Config.TRANSCRIBE_MAX_UPLOAD_BYTES.
+
+    Returns:
+        tuple: (path, content_hash, size).
+
+    Raises:
+        UploadTooLarge: If the stream is longer than ``max_bytes``.
+    """
+    directory = directory or Config.UPLOAD_DIR
+    max_bytes = Config.TRANSCRIBE_MAX_UPLOAD_BYTES if max_bytes is None else max_bytes
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = stream.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes.")
+                digest.update(chunk)
+                f.write(chunk)
+        content_hash = digest.hexdigest()
+        path = os.path.join(directory, f"{content_hash}-{uuid.uuid4().hex[:8]}{extension}")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, content_hash, size
+
+
+def discard_upload(path):
+    """
+    Deletes a stored upload once it has been transcribed (or failed to be).
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def download_media(url, directory=None, content_type=None):
+    """
+    Streams a Twilio media URL (e.g. a WhatsApp voice note) to disk.
+
+    Args:
+        url (str): The MediaUrl from the webhook.
+        directory (str): Destination directory. Defaults to Config.UPLOAD_DIR.
+        content_type (str): The MediaContentType from the webhook.
+
+    Returns:
+        tuple: (path, content_hash, size).
+    """
+    auth = (Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN) if Config.TWILIO_ACCOUNT_SID else None
+    with requests.get(url, auth=auth, stream=True, timeout=(5, 60)) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        extension = extension_for(content_type or response.headers.get("Content-Type"))
+        return save_stream(response.raw, directory, extension)
+
+
+def audio_duration(path):
+    """
+    Returns a recording's length in seconds via ffprobe, or None if unavailable.
+    """
+    if not shutil.which("ffprobe"):
+        return None
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30, check=True
+        )
+        return float(result.stdout.strip())
+    except (subprocess.SubprocessError, ValueError):
+        return None
+
+
+def chunk_spans(duration, chunk_seconds=None, overlap_seconds=None):
+    """
+    Plans overlapping chunk windows covering a recording.
+
+    Args:
+        duration (float): Recording length in seconds.
+        chunk_seconds (float): Length of each chunk.
+        overlap_seconds (float): How much each chunk repeats of the previous one.
+
+    Returns:
+        list: (start, length) pairs in seconds.
+    """
+    chunk_seconds = chunk_seconds or Config.TRANSCRIBE_CHUNK_SECONDS
+    overlap_seconds = Config.TRANSCRIBE_OVERLAP_SECONDS if overlap_seconds is None else overlap_seconds
+    step = chunk_seconds - overlap_seconds
+    spans = []
+    start = 0.0
+    while True:
+        spans.append((start, min(chunk_seconds, duration - start)))
+        if start + chunk_seconds >= duration:
+            return spans
+        start += step
+
+
+def split_audio(path, spans, work_dir):
+    """
+    Cuts a recording into the given windows with ffmpeg.
+
+    Returns:
+        list: Paths of the chunk files, in order.
+    """
+    paths = []
+    for index, (start, length) in enumerate(spans):
+        out = os.path.join(work_dir, f"chunk_{index:04d}.mp3")
+        subprocess.run(
+            ["ffmpeg", "-y", "-v", "error", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path,
+             *CHUNK_ENCODE_ARGS, out],
+            check=True, timeout=300
+        )
+        paths.append(out)
+    return paths
+
+
+def _words(text):
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def stitch_transcripts(texts):
+    """
+    Joins chunk transcripts, dropping the words each chunk repeats from the
+    end of the previous one because of the audio overlap.
+
+    Args:
+        texts (list): Chunk transcripts in order.
+
+    Returns:
+        str: The combined transcript.
+    """
+    merged = []
+    for text in texts:
+        words = text.split()
+        if not words:
+            continue
+        if merged:
+            tail, head = _words(" ".join(merged[-MAX_STITCH_WORDS:])), _words(" ".join(words[:MAX_STITCH_WORDS]))
+            # Longest run where the previous tail equals this chunk's head.
+            for size in range(min(len(tail), len(head)), MIN_STITCH_WORDS - 1, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        merged.extend(words)
+    return " ".join(merged)
+
+
+def get_cached_transcript(content_hash, db_path=None):
+    with get_connection(db_path) as conn:
+        row = conn.execute("SELECT text, chunks FROM transcriptions WHERE content_hash = ?", (content_hash,)).fetchone()
+    return {"text": row[0], "chunks": row[1]} if row else None
+
+
+def _store_transcript(content_hash, text, chunks, duration, db_path=None):
+    with get_connection(db_path) as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO transcriptions (content_hash, text, chunks, duration, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (content_hash, text, chunks, duration, datetime.now().isoformat()))
+
+
+def transcribe_file(path, content_hash, transcribe_chunk, db_path=None):
+    """
+    Transcribes a stored recording, serving repeats from the cache and
+    splitting long recordings into parallel chunks.
+
+    Args:
+        path (str): The audio file.
+        content_hash (str): Its SHA-256, as returned by save_stream().
+        transcribe_chunk (callable): ``transcribe_chunk(path) -> str``, e.g.
+            LLMEngine.transcribe_audio_whisper.
+        db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+
+    Returns:
+        dict: {"text", "content_hash", "chunks", "cached"}.
+    """
+    cached = get_cached_transcript(content_hash, db_path)
+    if cached:
+        return {**cached, "content_hash": content_hash, "cached": True}
+
+    def run():
+        duration = audio_duration(path) if shutil.which("ffmpeg") else None
+        if not duration or duration <= Config.TRANSCRIBE_CHUNK_SECONDS:
+            text = transcribe_chunk(path).strip()
+            _store_transcript(content_hash, text, 1, duration, db_path)
+            return {"text": text, "chunks": 1}
+
+        spans = chunk_spans(duration)
+        with tempfile.TemporaryDirectory(prefix="transcribe_") as work_dir:
+            chunk_paths = split_audio(path, spans, work_dir)
+            with ThreadPoolExecutor(max_workers=min(Config.TRANSCRIBE_PARALLELISM, len(chunk_paths))) as pool:
+                texts = list(pool.map(transcribe_chunk, chunk_paths))
+        text = stitch_transcripts(texts)
+        _store_transcript(content_hash, text, len(spans), duration, db_path)
+        return {"text": text, "chunks": len(spans)}
+
+    # The same voice note uploaded twice at once is transcribed once.
+    flight = get_single_flight()
+    result = flight.do("stt:" + content_hash, run) if flight else run()
+    return {**result, "content_hash": content_hash, "cached": False}
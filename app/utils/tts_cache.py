@@ -0,0 +1,195 @@
+import os
+import re
+import asyncio
+import json
+import uuid
+import hashlib
+import threading
+import unicodedata
+from datetime import datetime
+from app.utils.db import get_connection
+from app.utils.event_sink import get_event_writer
+from app.utils.audio_store import AudioStore, get_audio_store
+
+# === Content-Addressed TTS Cache ===
+#
+# Synthesized audio is stored once under a hash of (engine, voice_id,
+# voice_settings, normalized text). Identical requests from the ElevenLabs
+# and gTTS paths reuse the existing MP3 instead of calling the TTS API again.
+# Files are placed and accounted for by the AudioStore, so a clip evicted by
+# the sweep simply becomes a miss.
+
+HIT_UPDATE_SQL = '''
+    UPDATE tts_cache_entries SET hits = hits + 1, last_hit_at = ? WHERE cache_key = ?
+'''
+
+
+def normalize_text(text):
+    """
+    Normalizes text for cache keying: Unicode NFC, collapsed whitespace, trimmed ends.
+
+    Args:
+        text (str): The text to be synthesized.
+
+    Returns:
+        str: The normalized text.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def tts_cache_key(engine, voice_id, voice_settings, text):
+    """
+    Builds the content hash identifying one synthesized clip.
+
+    Args:
+        engine (str): The TTS engine name ("elevenlabs", "gtts").
+        voice_id (str): The engine-specific voice (or language) identifier.
+        voice_settings (dict): Engine settings that affect the audio.
+        text (str): The text to be synthesized.
+
+    Returns:
+        str: A hex SHA-256 digest.
+    """
+    payload = json.dumps(
+        [engine, voice_id, voice_settings or {}, normalize_text(text)],
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    def __init__(self, directory=None, db_path=None):
+        """
+        Initializes a TTS cache.
+
+        Args:
+            directory (str): Root for a dedicated AudioStore. Defaults to the shared store.
+            db_path (str): Path to the SQLite database file. Defaults to Config.DATABASE_PATH.
+        """
+        self.store = AudioStore(directory, db_path=db_path) if directory else get_audio_store()
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        """
+        Returns the file path a cache key is stored at.
+        """
+        return self.store.path_for(f"{key}.mp3")
+
+    def get_or_create(self, engine, voice_id, voice_settings, text, synthesize):
+        """
+        Returns the cached clip for this request, synthesizing it on a miss.
+
+        Args:
+            engine (str): The TTS engine name.
+            voice_id (str): The engine-specific voice identifier.
+            voice_settings (dict): Engine settings that affect the audio.
+            text (str): The text to synthesize.
+            synthesize (callable): ``synthesize(text, output_path)`` writes an MP3 to ``output_path``.
+
+        Returns:
+            Path: The path to the MP3 file.
+        """
+        key, path = self._lookup(engine, voice_id, voice_settings, text)
+        if path.exists():
+            return self._hit(key, path)
+
+        tmp_path = self._begin_miss(key, path)
+        try:
+            synthesize(text, str(tmp_path))
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return self._store(key, engine, voice_id, path)
+
+    def get_cached(self, engine, voice_id, voice_settings, text):
+        """
+        Returns the cached clip for this request without synthesizing.
+
+        Returns:
+            Path | None: The path to the MP3 file, or None on a miss.
+        """
+        key, path = self._lookup(engine, voice_id, voice_settings, text)
+        return self._hit(key, path) if path.exists() else None
+
+    async def aget_or_create(self, engine, voice_id, voice_settings, text, synthesize):
+        """
+        Async counterpart of get_or_create(); ``synthesize`` is a coroutine function
+        with the same ``(text, output_path)`` signature. The SQLite writes that
+        record a hit or a new clip run on a thread, off the event loop.
+        """
+        key, path = self._lookup(engine, voice_id, voice_settings, text)
+        if path.exists():
+            return await asyncio.to_thread(self._hit, key, path)
+
+        tmp_path = self._begin_miss(key, path)
+        try:
+            await synthesize(text, str(tmp_path))
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        return await asyncio.to_thread(self._store, key, engine, voice_id, path)
+
+    def _lookup(self, engine, voice_id, voice_settings, text):
+        key = tts_cache_key(engine, voice_id, voice_settings, text)
+        return key, self.path_for(key)
+
+    def _hit(self, key, path):
+        self._record_hit(key)
+        self.store.touch(path)
+        return path
+
+    def _begin_miss(self, key, path):
+        with self._lock:
+            self.misses += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a unique temp name and rename so readers never see a partial file.
+        return path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+
+    def _store(self, key, engine, voice_id, path):
+        with get_connection(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO tts_cache_entries (cache_key, engine, voice_id, path, bytes, hits, created_at)
+                VALUES (?, ?, ?, ?, ?, 0, ?)
+            ''', (key, engine, voice_id, str(path), path.stat().st_size, datetime.now().isoformat()))
+        self.store.register(path)
+        return path
+
+    def _record_hit(self, key):
+        with self._lock:
+            self.hits += 1
+        # Hit counters are telemetry; batch them through the write-behind writer.
+        get_event_writer(self.db_path).submit(HIT_UPDATE_SQL, (datetime.now().isoformat(), key))
+
+    def stats(self):
+        """
+        Returns this process's hit/miss counters.
+
+        Returns:
+            dict: {"hits": int, "misses": int}.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """
+    Returns the process-wide TTS cache, creating it on first use.
+
+    Returns:
+        TTSCache: The shared cache.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTSCache()
+    return _cache
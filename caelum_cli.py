@@ -5,9 +5,9 @@ This script allows you to interact with the LLM using a selected archetype,
 with options for auto-detection based on recent mood logs.
 """
 
-import sqlite3
 from app.llm import LLMEngine
 from app.utils.helpers import get_recent_mood_summary, map_mood_to_archetype
+from app.utils.registry import get_registry
 
 def load_archetype_prompt(archetype: str):
     """
@@ -15,10 +15,7 @@ def load_archetype_prompt(archetype: str):
     Returns:
         tuple: (tone, template) for the archetype or default values if not found.
     """
-    with sqlite3.connect("custom_archetypes.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT tone, template FROM archetypes WHERE name = ?", (archetype,))
-        row = cursor.fetchone()
+    row = get_registry().get_prompt(archetype)
     if not row:
         return "Warm, structured", "[Beau Mode]\nGently respond."
     return row[0], row[1]
@@ -2,25 +2,30 @@ import os
 from celery import Celery
 from celery.schedules import crontab
 
-celery = Celery('tasks', broker=os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0'))
+celery = Celery('tasks', broker=os.environ.get('CELERY_BROKER_URL', 'redis://redis:6379/0'), include=['tasks'])
 
 celery.conf.update(
     result_backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://redis:6379/0'),
     beat_schedule={
-        'send-morning-affirmation-everyday': {
-            'task': 'tasks.send_morning_affirmation',
-            'schedule': crontab(hour=7, minute=0),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+        'dispatch-due-messages': {
+            'task': 'tasks.dispatch_due_messages',
+            'schedule': crontab(),
         },
-        'send-evening-reflection-everyday': {
-            'task': 'tasks.send_evening_reflection',
-            'schedule': crontab(hour=21, minute=0),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+        'resume-stalled-broadcasts': {
+            'task': 'tasks.resume_broadcasts',
+            'schedule': crontab(minute='*/5'),
         },
-        'send-focus-time-suggestion-every-hour': {
-            'task': 'tasks.send_focus_time_suggestion',
-            'schedule': crontab(minute=0, hour='10-16'),
-            'args': (os.environ.get("RECIPIENT_PHONE"),)
+        'sweep-audio-store': {
+            'task': 'tasks.sweep_audio_store',
+            'schedule': crontab(minute=f"*/{os.environ.get('AUDIO_SWEEP_MINUTES', '15')}"),
+        },
+        'purge-response-cache': {
+            'task': 'tasks.purge_response_cache',
+            'schedule': crontab(minute=0),
+        },
+        'purge-journal-exports': {
+            'task': 'tasks.purge_journal_exports',
+            'schedule': crontab(minute=30),
         },
     }
 )
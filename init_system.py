@@ -3,13 +3,14 @@ init_system.py
 
 This script initializes the required directory structure and SQLite databases
 for the Caelum ADHD Assistant. It ensures that directories for uploads, exports,
-and static audio files exist and then calls functions to initialize the journal
-and archetype databases.
+and static audio files exist and then applies the versioned schema migrations
+that own every table and index.
 """
 
 import os
 import logging
-from app.utils.helpers import init_journal_db, init_archetype_db
+from app.utils.migrations import migrate, LATEST_VERSION
+from app.utils.broadcasts import subscribe, get_subscription
 
 # Set up basic logging configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -34,19 +35,31 @@ def create_directories():
             logging.error(f"❌ Error creating directory {directory}: {e}")
 
 def initialize_databases():
-    """Initialize SQLite databases and tables."""
-    logging.info("🧠 Initializing journal + archetype tables...")
+    """Apply pending schema migrations to the SQLite database."""
+    logging.info("🧠 Applying schema migrations...")
     try:
-        init_journal_db()
-        init_archetype_db()
-        logging.info("✅ Database tables ready.")
+        version = migrate()
+        logging.info(f"✅ Database schema at version {version} (latest {LATEST_VERSION}).")
     except Exception as e:
         logging.error(f"❌ Failed to initialize DB tables: {e}")
 
+def subscribe_legacy_recipient():
+    """Subscribe the single RECIPIENT_PHONE the old crontabs sent to, if it is set."""
+    recipient = os.environ.get("RECIPIENT_PHONE")
+    if not recipient:
+        return
+    try:
+        if get_subscription(recipient) is None:
+            subscribe(recipient, ["morning", "evening", "focus"])
+            logging.info(f"📬 Subscribed RECIPIENT_PHONE {recipient} to all programs.")
+    except Exception as e:
+        logging.error(f"❌ Failed to subscribe RECIPIENT_PHONE: {e}")
+
 def main():
     """Main function to set up directories and initialize databases."""
     create_directories()
     initialize_databases()
+    subscribe_legacy_recipient()
 
 if __name__ == "__main__":
     main()
@@ -1,67 +1,341 @@
 import os
-import uuid
+import time
+from datetime import datetime, timezone
 from celery_app import celery
-from twilio.rest import Client
 from gtts import gTTS
+from app.config import Config
+from app.utils.tts_cache import get_tts_cache
+from app.utils.audio_store import get_audio_store
+from app.utils.response_cache import ResponseCache
+from app.utils.idempotency import get_stage_result, record_stage_result, complete_message
+from app.utils.messaging import get_messaging_service, RateLimitExceeded
+from app.utils.broadcasts import (
+    create_broadcast, get_broadcast, set_broadcast_media, touch_broadcast, pending_recipients,
+    claim_recipient, record_recipient, finish_broadcast_if_done, stalled_broadcasts,
+    RECIPIENT_SENT, RECIPIENT_FAILED, RECIPIENT_PENDING
+)
+from app.utils.scheduler import due_entries, advance_entries
+from app.utils.transcription import download_media, discard_upload
+from app.utils.journal_export import run_export, purge_expired_exports
+from app.utils.conversation import build_context, record_exchange, request_refresh, refresh_summary
 
-def generate_audio_message(text_response):
-    # Generate a unique filename for the audio file
-    audio_filename = f"response_{uuid.uuid4().hex}.mp3"
-    audio_dir = os.path.join(os.getcwd(), "app", "static", "audio")
-    os.makedirs(audio_dir, exist_ok=True)
-    audio_filepath = os.path.join(audio_dir, audio_filename)
-    
-    # Generate the audio file using gTTS
-    tts = gTTS(text_response)
-    tts.save(audio_filepath)
-    
+FALLBACK_REPLY = "I am sorry, I could not process your request."
+GTTS_LANGUAGE = "en"
+
+_llm = None
+
+
+def get_llm():
+    # Built lazily so the worker only needs OpenAI credentials once a task runs.
+    global _llm
+    if _llm is None:
+        from app.llm import LLMEngine
+        _llm = LLMEngine()
+    return _llm
+
+
+def media_url_for(audio_path):
     # Construct the media URL using your static domain
-    media_url = f"https://duck-healthy-easily.ngrok-free.app/static/audio/{audio_filename}"
-    return media_url
+    relative = os.path.relpath(audio_path, Config.AUDIO_OUTPUT_DIR).replace(os.sep, "/")
+    return f"{Config.PUBLIC_BASE_URL}/static/audio/{relative}"
+
+
+def pin_media(media_url, ttl=None):
+    # Keep the file out of the eviction sweep until Twilio has fetched it;
+    # the /status callback releases the pin once the message is final.
+    relative = media_url.split("/static/audio/", 1)[-1]
+    return get_audio_store().pin(os.path.join(Config.AUDIO_OUTPUT_DIR, relative), ttl=ttl)
+
+
+def generate_audio_message(text_response):
+    # Identical text reuses the cached gTTS clip, so fixed scheduled messages
+    # are synthesized once rather than on every run.
+    def synthesize(text, output_path):
+        tts = gTTS(text, lang=GTTS_LANGUAGE)
+        tts.save(output_path)
+
+    audio_filepath = get_tts_cache().get_or_create("gtts", GTTS_LANGUAGE, {}, text_response, synthesize)
+    return media_url_for(audio_filepath)
+
+def cached_audio_message(text_response):
+    # The media URL of an already synthesized clip for this text, else None.
+    audio_filepath = get_tts_cache().get_cached("gtts", GTTS_LANGUAGE, {}, text_response)
+    return media_url_for(audio_filepath) if audio_filepath else None
+
+# === Inbound WhatsApp Reply Pipeline ===
+#
+# /webhook enqueues generate_reply_text and acknowledges Twilio immediately.
+# The text is sent right away and the media message follows as its own
+# chained stage. With MESSAGING_COMBINE_MEDIA, a reply whose audio is already
+# cached goes out as one message instead; the text never waits on gTTS. When a MessageSid is given, each stage records its result
+# so a redelivered task reuses it instead of calling the LLM, gTTS or Twilio again.
+# A WhatsApp voice note is transcribed first and answered like a text message.
+
+def transcribe_voice_note(media_url, content_type=None, message_sid=None):
+    # Downloaded and transcribed once per MessageSid; the transcript itself is
+    # also cached by audio hash.
+    transcript = get_stage_result(message_sid, "transcript") if message_sid else None
+    if transcript is None:
+        path, content_hash, _ = download_media(media_url, content_type=content_type)
+        try:
+            transcript = get_llm().transcribe_audio(path, content_hash)["text"]
+        finally:
+            discard_upload(path)
+        if message_sid:
+            record_stage_result(message_sid, "transcript", transcript)
+    return transcript
 
 @celery.task
-def send_morning_affirmation(recipient):
-    affirmation = "Good morning! You are capable, resilient, and ready to seize the day!"
-    media_url = generate_audio_message(affirmation)
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-    message = client.messages.create(
-        body=affirmation,
-        media_url=[media_url],
-        from_=twilio_number,
-        to=recipient,
-        status_callback="https://duck-healthy-easily.ngrok-free.app/status"
+def generate_reply_text(sender, message_body, message_sid=None, media_url=None, media_content_type=None):
+    generated_response = get_stage_result(message_sid, "text") if message_sid else None
+    if generated_response is None and media_url:
+        try:
+            transcript = transcribe_voice_note(media_url, media_content_type, message_sid)
+            message_body = f"{message_body}\n{transcript}" if message_body else transcript
+        except Exception as e:
+            print(f"[DEBUG] Voice note transcription failed: {e}", flush=True)
+            if not message_body:
+                generated_response = FALLBACK_REPLY
+    if generated_response is None:
+        try:
+            history = build_context(sender, "whatsapp")["messages"] if Config.CONVERSATION_MEMORY_ENABLED else None
+            generated_response = get_llm().generate_response(message_body, history=history)
+        except Exception as e:
+            print(f"[DEBUG] Error generating LLM response: {e}", flush=True)
+            generated_response = FALLBACK_REPLY
+        else:
+            if Config.CONVERSATION_MEMORY_ENABLED:
+                remember_exchange(sender, "whatsapp", message_body, generated_response)
+        if message_sid:
+            record_stage_result(message_sid, "text", generated_response)
+
+    media_url = cached_audio_message(generated_response) if Config.MESSAGING_COMBINE_MEDIA else None
+    if media_url:
+        if message_sid:
+            record_stage_result(message_sid, "audio", media_url)
+        send_reply_media.delay(media_url, sender, message_sid, generated_response)
+    else:
+        send_reply_text.delay(sender, generated_response, message_sid)
+        (synthesize_reply_audio.s(generated_response, message_sid) | send_reply_media.s(sender, message_sid)).delay()
+    return generated_response
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=5)
+def send_reply_text(self, recipient, text, message_sid=None):
+    sent_sid = get_stage_result(message_sid, "text_sent") if message_sid else None
+    if sent_sid:
+        return sent_sid
+    try:
+        message = get_messaging_service().send(recipient, body=text)
+    except Exception as e:
+        raise self.retry(exc=e)
+    if message_sid:
+        record_stage_result(message_sid, "text_sent", message.sid)
+    return message.sid
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=5)
+def synthesize_reply_audio(self, text, message_sid=None):
+    media_url = get_stage_result(message_sid, "audio") if message_sid else None
+    if media_url:
+        return media_url
+    try:
+        media_url = generate_audio_message(text)
+    except Exception as e:
+        raise self.retry(exc=e)
+    if message_sid:
+        record_stage_result(message_sid, "audio", media_url)
+    return media_url
+
+@celery.task(bind=True, max_retries=3, default_retry_delay=5)
+def send_reply_media(self, media_url, recipient, message_sid=None, text=None):
+    sent_sid = get_stage_result(message_sid, "media_sent") if message_sid else None
+    if sent_sid:
+        return sent_sid
+    pin_id = pin_media(media_url) if media_url else None
+    try:
+        message = get_messaging_service().send(
+            recipient,
+            body=text,
+            media_url=media_url,
+            status_callback=f"{Config.PUBLIC_BASE_URL}/status"
+        )
+    except Exception as e:
+        raise self.retry(exc=e)
+    if pin_id:
+        get_audio_store().attach_pin(pin_id, message.sid)
+    if message_sid:
+        if text:
+            # Sent together, so a redelivered pipeline doesn't send the text again.
+            record_stage_result(message_sid, "text_sent", message.sid)
+        record_stage_result(message_sid, "media_sent", message.sid)
+        complete_message(message_sid)
+    return message.sid
+
+# === Scheduled Messages ===
+
+PROGRAM_MESSAGES = {
+    "morning": "Good morning! You are capable, resilient, and ready to seize the day!",
+    "evening": ("Good evening. Take a moment to reflect on your day, celebrate your victories, "
+                "and learn from your challenges."),
+    "focus": ("This is your moment for focused self-improvement. "
+              "Consider spending 15 minutes in quiet reflection, reading an inspiring article, "
+              "or planning your next step towards a better tomorrow."),
+}
+
+def send_scheduled_message(recipient, text):
+    media_url = generate_audio_message(text)
+    pin_id = pin_media(media_url)
+    message = get_messaging_service().send(
+        recipient,
+        body=text,
+        media_url=media_url,
+        status_callback=f"{Config.PUBLIC_BASE_URL}/status"
     )
+    get_audio_store().attach_pin(pin_id, message.sid)
     return message.sid
 
+@celery.task
+def send_morning_affirmation(recipient):
+    return send_scheduled_message(recipient, PROGRAM_MESSAGES["morning"])
+
 @celery.task
 def send_evening_reflection(recipient):
-    reflection = "Good evening. Take a moment to reflect on your day, celebrate your victories, and learn from your challenges."
-    media_url = generate_audio_message(reflection)
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-    message = client.messages.create(
-        body=reflection,
-        media_url=[media_url],
-        from_=twilio_number,
-        to=recipient,
-        status_callback="https://duck-healthy-easily.ngrok-free.app/status"
-    )
-    return message.sid
+    return send_scheduled_message(recipient, PROGRAM_MESSAGES["evening"])
 
 @celery.task
 def send_focus_time_suggestion(recipient):
-    suggestion = ("This is your moment for focused self-improvement. "
-                  "Consider spending 15 minutes in quiet reflection, reading an inspiring article, "
-                  "or planning your next step towards a better tomorrow.")
-    media_url = generate_audio_message(suggestion)
-    client = Client(os.environ.get("TWILIO_ACCOUNT_SID"), os.environ.get("TWILIO_AUTH_TOKEN"))
-    twilio_number = os.environ.get("TWILIO_NUMBER")
-    message = client.messages.create(
-        body=suggestion,
-        media_url=[media_url],
-        from_=twilio_number,
-        to=recipient,
-        status_callback="https://duck-healthy-easily.ngrok-free.app/status"
-    )
-    return message.sid
+    return send_scheduled_message(recipient, PROGRAM_MESSAGES["focus"])
+
+# === Broadcast Fan-Out ===
+#
+# A broadcast (created by dispatch_due_messages, or by start_broadcast for all
+# of a program's subscribers at once) renders its audio once, snapshots its
+# recipients, and spreads chunks of sends across workers with countdowns that
+# keep the aggregate rate at BROADCAST_RATE_PER_SEC. Each recipient is claimed
+# before sending and its outcome recorded, so resume_broadcasts can pick up a
+# crashed run where it stopped without messaging anyone twice.
+
+@celery.task
+def start_broadcast(program, broadcast_key=None, recipients=None):
+    broadcast_key = broadcast_key or f"{program}:{datetime.now(timezone.utc):%Y-%m-%dT%H}"
+    broadcast_id, _ = create_broadcast(broadcast_key, program, PROGRAM_MESSAGES[program], recipients)
+    return dispatch_broadcast(broadcast_id)
+
+def dispatch_broadcast(broadcast_id):
+    broadcast = get_broadcast(broadcast_id)
+    pending = pending_recipients(broadcast_id, Config.BROADCAST_STALL_SECONDS)
+    if not pending:
+        finish_broadcast_if_done(broadcast_id)
+        return {"broadcast_id": broadcast_id, "recipients": 0, "chunks": 0}
+
+    if not broadcast["media_url"]:
+        media_url = generate_audio_message(broadcast["body"])
+        # Keep the shared clip out of the eviction sweep for the whole run.
+        pin_media(media_url, ttl=Config.AUDIO_PIN_SECONDS + len(pending) / Config.BROADCAST_RATE_PER_SEC)
+        set_broadcast_media(broadcast_id, media_url)
+
+    size = Config.BROADCAST_CHUNK_SIZE
+    spacing = size / Config.BROADCAST_RATE_PER_SEC
+    chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+    for index, chunk in enumerate(chunks):
+        send_broadcast_chunk.apply_async(args=(broadcast_id, chunk), countdown=index * spacing)
+    touch_broadcast(broadcast_id)
+    return {"broadcast_id": broadcast_id, "recipients": len(pending), "chunks": len(chunks)}
+
+@celery.task(bind=True, max_retries=5, default_retry_delay=30)
+def send_broadcast_chunk(self, broadcast_id, recipients):
+    broadcast = get_broadcast(broadcast_id)
+    service = get_messaging_service()
+    for index, recipient in enumerate(recipients):
+        if not claim_recipient(broadcast_id, recipient, Config.BROADCAST_STALL_SECONDS):
+            continue
+        try:
+            message = service.send(
+                recipient,
+                body=broadcast["body"],
+                media_url=broadcast["media_url"],
+                status_callback=f"{Config.PUBLIC_BASE_URL}/status"
+            )
+        except RateLimitExceeded as e:
+            # Hand this and the remaining recipients back and try the rest later.
+            record_recipient(broadcast_id, recipient, RECIPIENT_PENDING)
+            raise self.retry(args=(broadcast_id, recipients[index:]), exc=e)
+        except Exception as e:
+            print(f"[DEBUG] Broadcast {broadcast_id} send to {recipient} failed: {e}", flush=True)
+            record_recipient(broadcast_id, recipient, RECIPIENT_FAILED, error=str(e))
+            continue
+        record_recipient(broadcast_id, recipient, RECIPIENT_SENT, message_sid=message.sid)
+    finish_broadcast_if_done(broadcast_id)
+
+@celery.task
+def send_broadcast(broadcast_id):
+    return dispatch_broadcast(broadcast_id)
+
+@celery.task
+def resume_broadcasts():
+    return [dispatch_broadcast(broadcast_id) for broadcast_id in stalled_broadcasts(Config.BROADCAST_STALL_SECONDS)]
+
+# === Timezone-Aware Dispatch ===
+#
+# Runs every minute. Entries due in schedule_due are grouped by program and
+# UTC minute into one broadcast each (keyed so an overlapping or repeated
+# tick adds to the same broadcast instead of sending twice), then advanced to
+# their next local occurrence. Entries overdue by more than
+# SCHEDULER_MAX_LATE_SECONDS are advanced without sending.
+
+@celery.task
+def dispatch_due_messages():
+    now = time.time()
+    entries = due_entries(now, Config.SCHEDULER_BATCH_LIMIT)
+    slots = {}
+    skipped = 0
+    for entry in entries:
+        if now - entry["next_due"] > Config.SCHEDULER_MAX_LATE_SECONDS or entry["program"] not in PROGRAM_MESSAGES:
+            skipped += 1
+            continue
+        slot = datetime.fromtimestamp(entry["next_due"], timezone.utc).strftime("%Y-%m-%dT%H:%M")
+        slots.setdefault((entry["program"], slot), []).append(entry["recipient"])
+
+    for (program, slot), recipients in slots.items():
+        broadcast_id, _ = create_broadcast(f"{program}@{slot}", program, PROGRAM_MESSAGES[program], recipients)
+        # If this enqueue is lost, resume_broadcasts picks the broadcast up once it stalls.
+        send_broadcast.delay(broadcast_id)
+    advance_entries(entries, now)
+    return {"due": len(entries), "broadcasts": len(slots), "skipped": skipped}
+
+# === Conversation Memory ===
+
+def remember_exchange(user_id, channel, user_text, reply):
+    # Stores the exchange; once the conversation outgrows its token budget the
+    # summary refresh runs in a worker, off the request path. Memory is best
+    # effort: a failure here never holds back the reply.
+    try:
+        if record_exchange(user_id, channel, user_text, reply) and request_refresh(user_id, channel):
+            refresh_conversation_summary.delay(user_id, channel)
+    except Exception as e:
+        print(f"[DEBUG] Error updating conversation memory: {e}", flush=True)
+
+@celery.task
+def refresh_conversation_summary(user_id, channel):
+    return refresh_summary(user_id, channel, get_llm().summarize_conversation)
+
+# === Journal Export ===
+#
+# Rendering, and wkhtmltopdf in particular, runs here rather than in a web worker.
+
+@celery.task
+def export_journal(export_id):
+    return run_export(export_id)["status"]
+
+# === Maintenance ===
+
+@celery.task
+def sweep_audio_store():
+    return get_audio_store().sweep()
+
+@celery.task
+def purge_response_cache():
+    return ResponseCache().purge_expired()
+
+@celery.task
+def purge_journal_exports():
+    return purge_expired_exports()
@@ -0,0 +1,98 @@
+import json
+import asyncio
+import pytest
+from app import asgi
+from app.utils.llm_limiter import LLMOverloaded
+
+
+class FakeEngine:
+    async def generate_response(self, prompt):
+        return f"Echo: {prompt}"
+
+    async def generate_archetype_prompt(self, *args):
+        raise LLMOverloaded(retry_after=4)
+
+    async def stream_archetype_prompt(self, *args):
+        for delta in ["You ", "got this."]:
+            yield delta
+
+    async def generate_tts_elevenlabs(self, text, archetype="Beau"):
+        path = self.tmp_path / "clip.mp3"
+        path.write_bytes(b"ID3" + b"x" * 100000)
+        return str(path)
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    from app.config import Config
+    monkeypatch.setattr(Config, "RETRIEVAL_INDEX_DIR", str(tmp_path / "indexes"))
+    fake = FakeEngine()
+    fake.tmp_path = tmp_path
+    monkeypatch.setattr(asgi, "_engine", fake)
+    return fake
+
+
+def call(method, path, payload=None, headers=()):
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "path": path,
+        "raw_path": path.encode(), "query_string": b"", "root_path": "", "scheme": "http",
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+    }
+    body = json.dumps(payload).encode() if payload is not None else b""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    content = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], headers, content.decode()
+
+
+def test_llm_served_by_async_engine(engine):
+    status, headers, body = call("POST", "/llm", {"prompt": "Hello Caelum!"})
+    assert status == 200
+    assert body == "Echo: Hello Caelum!"
+
+def test_respond_stream_emits_deltas_then_metadata(engine):
+    status, headers, body = call("POST", "/respond", {"input": "Help", "user_id": "asgi001", "stream": True})
+    assert status == 200
+    assert headers["content-type"] == "text/event-stream"
+    assert body.index('data: {"delta": "You "}') < body.index("event: metadata")
+
+def test_respond_overloaded_returns_503(engine):
+    status, headers, body = call("POST", "/respond", {"input": "Help", "user_id": "asgi002"})
+    assert status == 503
+    assert headers["retry-after"] == "4"
+    assert json.loads(body)["error"] == "overloaded"
+
+def test_other_routes_fall_back_to_flask(engine):
+    status, headers, body = call("GET", "/")
+    assert status == 200
+    assert "Royal AI" in body
+
+def test_tts_download_streams_the_file(engine):
+    status, headers, body = call("POST", "/tts-download", {"text": "Hi"})
+    assert status == 200
+    assert headers["content-length"] == "100003"
+    assert headers["content-disposition"] == "attachment; filename=clip.mp3"
+    assert len(body) == 100003
+
+def test_oversize_transcribe_upload_refused_before_fallback(engine, monkeypatch):
+    from app.config import Config
+    monkeypatch.setattr(asgi, "wsgi_fallback", lambda *args: pytest.fail("body reached Flask"))
+    size = str(Config.TRANSCRIBE_MAX_UPLOAD_BYTES + 1).encode()
+    status, headers, body = call("POST", "/transcribe", headers=[(b"content-length", size)])
+    assert status == 413
+
+def test_asgi_app_defaults_to_production_config():
+    assert asgi.flask_app.debug is False
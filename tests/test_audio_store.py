@@ -0,0 +1,92 @@
+import unittest
+import os
+import time
+import shutil
+from app.utils import db, migrations
+from app.utils.audio_store import AudioStore
+
+TEST_DB = "test_audio_store.db"
+TEST_DIR = "test_audio_store_files"
+
+
+class TestAudioStore(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _write(self, store, name, size, last_access):
+        path = store.path_for(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        store.register(path)
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("UPDATE audio_files SET last_access = ? WHERE rel_path = ?", (last_access, store.rel_path(path)))
+        return path
+
+    def test_files_are_sharded(self):
+        store = AudioStore(TEST_DIR, db_path=TEST_DB)
+        rel = store.rel_path(store.path_for("clip.mp3"))
+        self.assertEqual(len(rel.split("/")), 3)
+
+    def test_sweep_evicts_least_recently_used_until_under_budget(self):
+        store = AudioStore(TEST_DIR, max_bytes=250, db_path=TEST_DB)
+        now = time.time()
+        oldest = self._write(store, "a.mp3", 100, now - 300)
+        middle = self._write(store, "b.mp3", 100, now - 200)
+        newest = self._write(store, "c.mp3", 100, now - 100)
+
+        result = store.sweep()
+
+        self.assertEqual(result["evicted"], 1)
+        self.assertFalse(oldest.exists())
+        self.assertTrue(middle.exists())
+        self.assertTrue(newest.exists())
+
+    def test_touch_is_visible_to_the_next_sweep(self):
+        store = AudioStore(TEST_DIR, max_bytes=150, db_path=TEST_DB)
+        now = time.time()
+        touched = self._write(store, "a.mp3", 100, now - 300)
+        other = self._write(store, "b.mp3", 100, now - 200)
+
+        store.touch(touched)
+        self.assertEqual(store.sweep()["evicted"], 1)
+        self.assertTrue(touched.exists())
+        self.assertFalse(other.exists())
+
+    def test_pinned_and_released_files(self):
+        store = AudioStore(TEST_DIR, max_bytes=0, db_path=TEST_DB)
+        path = self._write(store, "sent.mp3", 50, time.time() - 1000)
+        pin_id = store.pin(path)
+        store.attach_pin(pin_id, "SMmedia")
+
+        self.assertEqual(store.sweep()["evicted"], 0)
+        self.assertTrue(path.exists())
+
+        store.release_message_pins("SMmedia")
+        self.assertEqual(store.sweep()["evicted"], 1)
+        self.assertFalse(path.exists())
+
+    def test_sweep_evicts_by_age_and_adopts_legacy_files(self):
+        store = AudioStore(TEST_DIR, max_age=60, db_path=TEST_DB)
+        os.makedirs(TEST_DIR, exist_ok=True)
+        legacy = os.path.join(TEST_DIR, "response_legacy.mp3")
+        with open(legacy, "wb") as f:
+            f.write(b"old")
+        old = time.time() - 3600
+        os.utime(legacy, (old, old))
+
+        self.assertEqual(store.sweep()["evicted"], 1)
+        self.assertFalse(os.path.exists(legacy))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+from app.utils import db, migrations
+from app.utils import broadcasts
+
+TEST_DB = "test_broadcasts.db"
+
+
+class TestBroadcasts(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        broadcasts.subscribe("whatsapp:+1001", ["morning", "focus"], "Europe/Berlin", db_path=TEST_DB)
+        broadcasts.subscribe("whatsapp:+1002", ["morning"], db_path=TEST_DB)
+        broadcasts.subscribe("whatsapp:+1003", ["evening"], db_path=TEST_DB)
+        broadcasts.subscribe("whatsapp:+1004", ["morning"], db_path=TEST_DB)
+        broadcasts.unsubscribe("whatsapp:+1004", db_path=TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def test_subscription_round_trip(self):
+        sub = broadcasts.get_subscription("whatsapp:+1001", db_path=TEST_DB)
+        self.assertEqual(sub["timezone"], "Europe/Berlin")
+        self.assertEqual(sub["programs"], ["focus", "morning"])
+        self.assertFalse(broadcasts.get_subscription("whatsapp:+1004", db_path=TEST_DB)["enabled"])
+
+    def test_broadcast_snapshots_enabled_subscribers_once(self):
+        broadcast_id, created = broadcasts.create_broadcast("morning:T07", "morning", "Hi", db_path=TEST_DB)
+        again, created_again = broadcasts.create_broadcast("morning:T07", "morning", "Hi", db_path=TEST_DB)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again, broadcast_id)
+        self.assertEqual(
+            broadcasts.pending_recipients(broadcast_id, 600, db_path=TEST_DB),
+            ["whatsapp:+1001", "whatsapp:+1002"]
+        )
+
+    def test_resume_skips_sent_and_reclaims_abandoned(self):
+        broadcast_id, _ = broadcasts.create_broadcast("morning:T07", "morning", "Hi", db_path=TEST_DB)
+        self.assertTrue(broadcasts.claim_recipient(broadcast_id, "whatsapp:+1001", 600, db_path=TEST_DB))
+        self.assertFalse(broadcasts.claim_recipient(broadcast_id, "whatsapp:+1001", 600, db_path=TEST_DB))
+        broadcasts.record_recipient(broadcast_id, "whatsapp:+1001", broadcasts.RECIPIENT_SENT, "SM1", db_path=TEST_DB)
+
+        # A worker claims +1002 and dies before recording the outcome.
+        self.assertTrue(broadcasts.claim_recipient(broadcast_id, "whatsapp:+1002", 600, db_path=TEST_DB))
+        self.assertEqual(broadcasts.pending_recipients(broadcast_id, 600, db_path=TEST_DB), [])
+        self.assertFalse(broadcasts.finish_broadcast_if_done(broadcast_id, db_path=TEST_DB))
+
+        self.assertEqual(broadcasts.pending_recipients(broadcast_id, -1, db_path=TEST_DB), ["whatsapp:+1002"])
+        self.assertTrue(broadcasts.claim_recipient(broadcast_id, "whatsapp:+1002", -1, db_path=TEST_DB))
+        broadcasts.record_recipient(broadcast_id, "whatsapp:+1002", broadcasts.RECIPIENT_SENT, "SM2", db_path=TEST_DB)
+
+        self.assertTrue(broadcasts.finish_broadcast_if_done(broadcast_id, db_path=TEST_DB))
+        self.assertEqual(broadcasts.broadcast_progress(broadcast_id, db_path=TEST_DB), {"sent": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+from app.utils import db, migrations
+from app.utils.conversation import count_tokens, record_exchange, build_context, request_refresh, refresh_summary
+
+TEST_DB = "test_conversation.db"
+USER = "memory_tester"
+
+
+class TestConversationMemory(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _exchange(self, n, budget=1000):
+        return record_exchange(USER, "whatsapp", f"message {n} " + "x" * 40, f"reply {n} " + "y" * 40, budget, TEST_DB)
+
+    def test_short_conversation_fits_verbatim(self):
+        self.assertFalse(self._exchange(1))
+        context = build_context(USER, "whatsapp", 1000, TEST_DB)
+        self.assertEqual([m["role"] for m in context["messages"]], ["user", "assistant"])
+        self.assertTrue(context["messages"][0]["content"].startswith("message 1"))
+        self.assertIsNone(context["fold_through"])
+        self.assertEqual(build_context(USER, "respond", 1000, TEST_DB)["messages"], [])
+
+    def test_window_keeps_newest_turns_within_budget(self):
+        turn_tokens = count_tokens("message 1 " + "x" * 40)
+        budget = turn_tokens * 5
+        due = [self._exchange(n, budget) for n in range(1, 5)]
+        self.assertEqual(due, [False, False, True, True])
+
+        context = build_context(USER, "whatsapp", budget, TEST_DB)
+        self.assertLessEqual(context["tokens"], budget)
+        self.assertEqual(len(context["messages"]), 5)
+        self.assertTrue(context["messages"][-1]["content"].startswith("reply 4"))
+        self.assertIsNotNone(context["fold_through"])
+
+    def test_refresh_is_throttled(self):
+        self.assertTrue(request_refresh(USER, "whatsapp", 60, TEST_DB))
+        self.assertFalse(request_refresh(USER, "whatsapp", 60, TEST_DB))
+        self.assertTrue(request_refresh(USER, "whatsapp", 0, TEST_DB))
+
+    def test_refresh_folds_overflow_into_summary(self):
+        budget = count_tokens("message 1 " + "x" * 40) * 5
+        for n in range(1, 6):
+            self._exchange(n, budget)
+        seen = []
+
+        def summarize(previous, turns):
+            seen.extend(turns)
+            return "User is working through messages one to three."
+
+        self.assertTrue(refresh_summary(USER, "whatsapp", summarize, budget, TEST_DB))
+        self.assertTrue(seen[0]["content"].startswith("message 1"))
+
+        context = build_context(USER, "whatsapp", budget, TEST_DB)
+        self.assertEqual(context["messages"][0]["role"], "system")
+        self.assertIn("one to three", context["messages"][0]["content"])
+        self.assertLessEqual(context["tokens"], budget)
+        remaining = db.get_connection(TEST_DB).execute(
+            "SELECT COUNT(*) FROM conversation_turns WHERE user_id = ?", (USER,)
+        ).fetchone()[0]
+        self.assertEqual(remaining, 10 - len(seen))
+
+        # Nothing left to fold: no second summary call.
+        self.assertFalse(refresh_summary(USER, "whatsapp", summarize, budget * 10, TEST_DB))
+
+
+if __name__ == '__main__':
+    unittest.main()
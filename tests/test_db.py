@@ -0,0 +1,91 @@
+import unittest
+import os
+import threading
+from app.utils import db, migrations
+
+TEST_DB = "test_db_pool.db"
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def test_connection_is_reused_within_thread(self):
+        first = db.get_connection(TEST_DB)
+        second = db.get_connection(TEST_DB)
+        self.assertIs(first, second)
+
+    def test_connection_is_per_thread(self):
+        main_conn = db.get_connection(TEST_DB)
+        seen = []
+        worker = threading.Thread(target=lambda: seen.append(db.get_connection(TEST_DB)))
+        worker.start()
+        worker.join()
+        self.assertIsNot(seen[0], main_conn)
+
+    def test_wal_mode_enabled(self):
+        conn = db.get_connection(TEST_DB)
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), "wal")
+
+    def test_replaced_file_gets_fresh_connection(self):
+        conn = db.get_connection(TEST_DB)
+        with conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+        os.remove(TEST_DB)
+        fresh = db.get_connection(TEST_DB)
+        self.assertIsNot(fresh, conn)
+        tables = fresh.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self.assertEqual(tables, [])
+
+    def test_default_path_uses_config(self):
+        original = db.Config.DATABASE_PATH
+        db.Config.DATABASE_PATH = TEST_DB
+        try:
+            self.assertIs(db.get_connection(), db.get_connection(TEST_DB))
+        finally:
+            db.Config.DATABASE_PATH = original
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def test_migrate_fresh_database_to_latest(self):
+        self.assertEqual(migrations.get_schema_version(TEST_DB), 0)
+        self.assertEqual(migrations.migrate(TEST_DB), migrations.LATEST_VERSION)
+        self.assertEqual(migrations.get_schema_version(TEST_DB), migrations.LATEST_VERSION)
+
+    def test_migrate_is_idempotent(self):
+        migrations.migrate(TEST_DB)
+        migrations.migrate(TEST_DB)
+        count = db.get_connection(TEST_DB).execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+        self.assertEqual(count, len(migrations.MIGRATIONS))
+
+    def test_mood_lookup_uses_index(self):
+        migrations.migrate(TEST_DB)
+        plan = db.get_connection(TEST_DB).execute(
+            "EXPLAIN QUERY PLAN SELECT mood FROM journal_entries WHERE user_id = ? AND date >= ?",
+            ("u", "2024-01-01")
+        ).fetchall()
+        self.assertIn("idx_journal_user_date", " ".join(str(row) for row in plan))
+
+
+if __name__ == '__main__':
+    unittest.main()
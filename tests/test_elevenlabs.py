@@ -0,0 +1,78 @@
+import unittest
+import io
+import os
+import requests
+from requests.adapters import BaseAdapter
+from app.utils.elevenlabs import ElevenLabsClient, ElevenLabsError
+
+TEST_FILE = "test_elevenlabs.mp3"
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Replies to each request with the next (status, body, headers) in the script."""
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, body, headers = self.script.pop(0)
+        response = requests.Response()
+        response.status_code = status
+        response.raw = io.BytesIO(body)
+        response.headers.update(headers)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class TestElevenLabsClient(unittest.TestCase):
+    def tearDown(self):
+        if os.path.exists(TEST_FILE):
+            os.remove(TEST_FILE)
+
+    def _client(self, script, max_retries=3):
+        client = ElevenLabsClient(api_key="test-key", max_retries=max_retries, backoff_base=0, backoff_max=0)
+        adapter = ScriptedAdapter(script)
+        client.session.mount("https://", adapter)
+        return client, adapter
+
+    def test_retries_rate_limits_then_streams_to_disk(self):
+        audio = b"ID3" + b"\x00" * 200000
+        client, adapter = self._client([
+            (429, b"slow down", {"Retry-After": "0"}),
+            (503, b"busy", {}),
+            (200, audio, {"Content-Type": "audio/mpeg"}),
+        ])
+
+        written = client.synthesize_to_file("voice", "Hello there", TEST_FILE)
+
+        self.assertEqual(written, len(audio))
+        with open(TEST_FILE, "rb") as f:
+            self.assertEqual(f.read(), audio)
+        self.assertEqual(len(adapter.requests), 3)
+        self.assertEqual(adapter.requests[0].headers["xi-api-key"], "test-key")
+
+    def test_client_errors_are_not_retried(self):
+        client, adapter = self._client([(401, b"bad key", {})])
+
+        with self.assertRaises(ElevenLabsError) as ctx:
+            client.synthesize_to_file("voice", "Hello", TEST_FILE)
+        self.assertEqual(ctx.exception.status_code, 401)
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_gives_up_after_max_retries(self):
+        client, adapter = self._client([(500, b"oops", {})] * 3, max_retries=2)
+
+        with self.assertRaises(ElevenLabsError):
+            client.synthesize_to_file("voice", "Hello", TEST_FILE)
+        self.assertEqual(len(adapter.requests), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import os
+import queue
+import sqlite3
+import threading
+from unittest import mock
+from app.utils import db, helpers
+from app.utils.event_sink import BatchedEventWriter
+
+TEST_DB = "test_event_sink.db"
+
+
+class TestBatchedEventWriter(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        helpers.init_journal_db(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _usage_count(self):
+        return db.get_connection(TEST_DB).execute("SELECT COUNT(*) FROM archetype_usage").fetchone()[0]
+
+    def test_rows_are_written_on_flush(self):
+        writer = BatchedEventWriter(TEST_DB, batch_size=1000, flush_interval=60)
+        for i in range(25):
+            writer.submit(helpers.USAGE_INSERT_SQL, (f"user{i}", "Fox", 0, "respond", "energetic", "2024-01-01T00:00:00"))
+        self.assertTrue(writer.flush())
+        self.assertEqual(self._usage_count(), 25)
+        self.assertEqual(writer.written, 25)
+        writer.close()
+
+    def test_close_flushes_pending_rows(self):
+        writer = BatchedEventWriter(TEST_DB, batch_size=1000, flush_interval=60)
+        writer.submit(helpers.USAGE_INSERT_SQL, ("tester", "Theo", 0, "respond", "tired", "2024-01-01T00:00:00"))
+        writer.close()
+        self.assertEqual(self._usage_count(), 1)
+
+    def test_full_queue_sheds_optional_rows_but_keeps_required(self):
+        writer = BatchedEventWriter(TEST_DB, batch_size=1000, flush_interval=60, max_queue=1)
+        # Simulate a stalled consumer: an alive "worker" and a queue that is already full.
+        writer._pid = os.getpid()
+        writer._thread = threading.current_thread()
+        writer._queue = queue.Queue(maxsize=1)
+        writer._queue.put_nowait((helpers.USAGE_INSERT_SQL, (), False))
+        row = ("tester", "Theo", 0, "respond", "tired", "2024-01-01T00:00:00")
+        self.assertFalse(writer.submit(helpers.USAGE_INSERT_SQL, row))
+        self.assertTrue(writer.submit(helpers.USAGE_INSERT_SQL, row, required=True))
+        self.assertEqual(writer.dropped, 1)
+        self.assertEqual(self._usage_count(), 1)
+
+        # A required row that can't be stored synchronously is an error, not a success.
+        with mock.patch.object(writer, "_execute", side_effect=sqlite3.OperationalError("database is locked")):
+            with self.assertRaises(sqlite3.OperationalError):
+                writer.submit(helpers.USAGE_INSERT_SQL, row, required=True)
+
+    def test_failed_batch_keeps_required_rows_for_retry(self):
+        writer = BatchedEventWriter(TEST_DB, batch_size=1000, flush_interval=60)
+        writer.submit(helpers.USAGE_INSERT_SQL, ("optional", "Fox", 0, "respond", "calm", "2024-01-01T00:00:00"))
+        writer.submit(helpers.FEEDBACK_INSERT_SQL, ("tester", "Theo", "tired", "hi", "ok", 5, "", "2024-01-01T00:00:00"), required=True)
+        execute = writer._execute
+        with mock.patch.object(writer, "_execute", side_effect=sqlite3.OperationalError("database is locked")):
+            self.assertTrue(writer.flush())
+        self.assertEqual(writer.dropped, 1)
+
+        with mock.patch.object(writer, "_execute", side_effect=execute):
+            self.assertTrue(writer.flush())
+        feedback = db.get_connection(TEST_DB).execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+        self.assertEqual(feedback, 1)
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
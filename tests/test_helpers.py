@@ -1,8 +1,11 @@
 import unittest
 import sqlite3
 import os
-from datetime import datetime
-from app.utils import helpers
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from app.config import Config
+from app.utils import helpers, db
 
 TEST_DB = "test_helpers.db"
 
@@ -13,10 +16,16 @@ class TestHelperFunctions(unittest.TestCase):
             os.remove(TEST_DB)
         helpers.init_journal_db(TEST_DB)
         helpers.init_archetype_db(TEST_DB)
+        self.index_dir = Config.RETRIEVAL_INDEX_DIR
+        Config.RETRIEVAL_INDEX_DIR = tempfile.mkdtemp()
 
     def tearDown(self):
-        if os.path.exists(TEST_DB):
-            os.remove(TEST_DB)
+        shutil.rmtree(Config.RETRIEVAL_INDEX_DIR, ignore_errors=True)
+        Config.RETRIEVAL_INDEX_DIR = self.index_dir
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
 
     def test_log_and_get_archetype_use(self):
         user_id = "tester"
@@ -54,6 +63,36 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(rows[0][2], "Fox")       # archetype
         self.assertEqual(rows[0][6], 5)             # rating
         self.assertEqual(rows[0][7], "Very helpful")# comment
+    def test_recent_mood_summary_uses_rollup(self):
+        user_id = "mood_tester"
+        now = datetime.now()
+        helpers.log_journal_entry(user_id, "Rough start", mood="anxious", date=now.isoformat(), db_path=TEST_DB)
+        helpers.log_journal_entry(user_id, "Still wired", mood="anxious", date=now.isoformat(), db_path=TEST_DB)
+        helpers.log_journal_entry(user_id, "Better later", mood="hopeful", date=now.isoformat(), db_path=TEST_DB)
+        helpers.log_journal_entry(user_id, "Old news", mood="tired", date=(now - timedelta(days=10)).isoformat(), db_path=TEST_DB)
+
+        self.assertEqual(helpers.get_recent_mood_summary(user_id, db_path=TEST_DB, top_n=2), ["anxious", "hopeful"])
+
+    def test_recent_mood_summary_cache_invalidated_on_new_entry(self):
+        user_id = "cache_tester"
+        helpers.log_journal_entry(user_id, "Meh", mood="tired", db_path=TEST_DB)
+        self.assertEqual(helpers.get_recent_mood_summary(user_id, db_path=TEST_DB), ["tired"])
+
+        helpers.log_journal_entry(user_id, "Wired", mood="energetic", db_path=TEST_DB)
+        helpers.log_journal_entry(user_id, "Zooming", mood="energetic", db_path=TEST_DB)
+        self.assertEqual(helpers.get_recent_mood_summary(user_id, db_path=TEST_DB), ["energetic"])
+
+    def test_recent_mood_summaries_batch(self):
+        helpers.log_journal_entry("batch_a", "Restless", mood="anxious", db_path=TEST_DB)
+        helpers.log_journal_entry("batch_b", "Slow", mood="tired", db_path=TEST_DB)
+        helpers.log_journal_entry("batch_b", "Slower", mood="tired", db_path=TEST_DB)
+        helpers.log_journal_entry("batch_b", "Bright spot", mood="hopeful", db_path=TEST_DB)
+        helpers.get_recent_mood_summary("batch_a", db_path=TEST_DB)
+
+        summaries = helpers.get_recent_mood_summaries(["batch_a", "batch_b", "batch_none"], db_path=TEST_DB, top_n=2)
+        self.assertEqual(summaries, {"batch_a": ["anxious"], "batch_b": ["tired", "hopeful"], "batch_none": []})
+        self.assertEqual(helpers.get_recent_mood_summary("batch_b", db_path=TEST_DB), ["tired"])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import os
+from app.utils import db, migrations, idempotency
+
+TEST_DB = "test_idempotency.db"
+
+
+class TestIdempotency(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def test_duplicate_claim_returns_existing_attempt(self):
+        claimed, _ = idempotency.claim_message("SM1", task_id="task-a", db_path=TEST_DB)
+        self.assertTrue(claimed)
+        claimed, existing = idempotency.claim_message("SM1", task_id="task-b", db_path=TEST_DB)
+        self.assertFalse(claimed)
+        self.assertEqual(existing, {"status": idempotency.STATUS_IN_FLIGHT, "task_id": "task-a"})
+
+    def test_expired_claim_can_be_reclaimed(self):
+        idempotency.claim_message("SM2", task_id="old", ttl=-1, db_path=TEST_DB)
+        idempotency.record_stage_result("SM2", "text", "stale", db_path=TEST_DB)
+        claimed, _ = idempotency.claim_message("SM2", task_id="new", db_path=TEST_DB)
+        self.assertTrue(claimed)
+        self.assertIsNone(idempotency.get_stage_result("SM2", "text", db_path=TEST_DB))
+
+    def test_stage_results_and_release(self):
+        idempotency.claim_message("SM3", db_path=TEST_DB)
+        idempotency.record_stage_result("SM3", "text_sent", "SMout", db_path=TEST_DB)
+        self.assertEqual(idempotency.get_stage_result("SM3", "text_sent", db_path=TEST_DB), "SMout")
+        idempotency.release_message("SM3", db_path=TEST_DB)
+        claimed, _ = idempotency.claim_message("SM3", db_path=TEST_DB)
+        self.assertTrue(claimed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import os
+import shutil
+from unittest import mock
+from app.config import Config
+from app.utils import db, migrations, helpers, journal_export
+from app.utils.journal_export import create_export, get_export, run_export, write_markdown, purge_expired_exports, EXPORT_DONE
+
+TEST_DB = "test_journal_export.db"
+TEST_DIR = "test_journal_exports"
+USER = "export_tester"
+
+
+class TestJournalExport(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        os.makedirs(TEST_DIR, exist_ok=True)
+        self.index_dir = Config.RETRIEVAL_INDEX_DIR
+        Config.RETRIEVAL_INDEX_DIR = os.path.join(TEST_DIR, "indexes")
+        self.out = os.path.join(TEST_DIR, "journal.md")
+        helpers.log_journal_entry(USER, "Started the new planner.", mood="hopeful", date="2024-01-05T09:00:00", db_path=TEST_DB)
+        helpers.log_journal_entry(USER, "Slept badly.", mood="tired", date="2024-02-10T22:15:00", db_path=TEST_DB)
+        helpers.log_journal_entry(USER, "Early entry.", date="2024-02-01T08:00:00", db_path=TEST_DB)
+        helpers.log_journal_entry("someone_else", "Not mine.", date="2024-01-06T09:00:00", db_path=TEST_DB)
+
+    def tearDown(self):
+        Config.RETRIEVAL_INDEX_DIR = self.index_dir
+        db.close_all_connections()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _read(self):
+        with open(self.out, encoding="utf-8") as f:
+            return f.read()
+
+    def test_markdown_in_date_order(self):
+        stats = write_markdown(USER, self.out, TEST_DB)
+        text = self._read()
+        self.assertEqual(stats, {"rendered": 2, "reused": 0})
+        self.assertLess(text.index("## January 2024"), text.index("## February 2024"))
+        self.assertLess(text.index("Early entry."), text.index("Slept badly."))
+        self.assertIn("*Mood:* hopeful", text)
+        self.assertNotIn("Not mine.", text)
+
+    def test_repeat_export_renders_only_changed_months(self):
+        write_markdown(USER, self.out, TEST_DB)
+        self.assertEqual(write_markdown(USER, self.out, TEST_DB), {"rendered": 0, "reused": 2})
+
+        helpers.log_journal_entry(USER, "Better day.", date="2024-02-20T10:00:00", db_path=TEST_DB)
+        self.assertEqual(write_markdown(USER, self.out, TEST_DB), {"rendered": 1, "reused": 1})
+        self.assertIn("Better day.", self._read())
+
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("UPDATE journal_entries SET entry_text = 'Planner, week one.' WHERE entry_text LIKE 'Started%'")
+        self.assertEqual(write_markdown(USER, self.out, TEST_DB), {"rendered": 1, "reused": 1})
+        self.assertIn("Planner, week one.", self._read())
+
+    def test_entry_markup_is_escaped(self):
+        helpers.log_journal_entry(USER, '<script>alert(1)</script><iframe src="file:///etc/passwd"></iframe>',
+                                  tags="<b>x</b>", date="2024-03-01T09:00:00", db_path=TEST_DB)
+        write_markdown(USER, self.out, TEST_DB)
+        text = self._read()
+        self.assertNotIn("<script>", text)
+        self.assertNotIn("<iframe", text)
+        self.assertIn("&lt;iframe src=&quot;file:///etc/passwd&quot;&gt;", text)
+        self.assertIn("&lt;b&gt;x&lt;/b&gt;", journal_export.markdown(text))
+        self.assertNotIn("<iframe", journal_export.markdown(text))
+
+    def test_run_export_records_download_path(self):
+        export_id = create_export(USER, "markdown", db_path=TEST_DB)
+        with mock.patch.object(journal_export.Config, "JOURNAL_EXPORT_DIR", TEST_DIR):
+            job = run_export(export_id, db_path=TEST_DB)
+        self.assertEqual(job["status"], EXPORT_DONE)
+        self.assertTrue(os.path.exists(job["path"]))
+        self.assertEqual(get_export(export_id, TEST_DB)["path"], job["path"])
+
+        with self.assertRaises(ValueError):
+            create_export(USER, "docx", db_path=TEST_DB)
+
+    def test_purge_removes_expired_exports_and_files(self):
+        queued = create_export(USER, "markdown", db_path=TEST_DB)
+        export_id = create_export(USER, "markdown", db_path=TEST_DB)
+        with mock.patch.object(journal_export.Config, "JOURNAL_EXPORT_DIR", TEST_DIR):
+            job = run_export(export_id, db_path=TEST_DB)
+
+        self.assertEqual(purge_expired_exports(db_path=TEST_DB), 0)
+        self.assertEqual(purge_expired_exports(max_age=-1, db_path=TEST_DB), 1)
+        self.assertFalse(os.path.exists(job["path"]))
+        self.assertIsNone(get_export(export_id, TEST_DB))
+        self.assertIsNotNone(get_export(queued, TEST_DB))
+
+
+if __name__ == '__main__':
+    unittest.main()
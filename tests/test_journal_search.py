@@ -0,0 +1,120 @@
+import unittest
+import os
+import time
+from app.utils import db, migrations, helpers
+from app.config import Config
+from app.utils.journal_search import (
+    search_entries, list_tags, archetypes_with_tag, build_match_query, InvalidCursor
+)
+
+TEST_DB = "test_journal_search.db"
+USER = "search_tester"
+
+
+class TestJournalSearch(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        self.retrieval = Config.RETRIEVAL_ENABLED
+        Config.RETRIEVAL_ENABLED = False
+
+    def tearDown(self):
+        Config.RETRIEVAL_ENABLED = self.retrieval
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _log(self, text, tags=None, date=None, user=USER, mood=None):
+        return helpers.log_journal_entry(user, text, mood=mood, tags=tags, date=date, db_path=TEST_DB)
+
+    def test_match_query_is_quoted(self):
+        self.assertEqual(build_match_query('taxes "due date" plan*'), '"taxes" "due date" "plan"*')
+        self.assertEqual(build_match_query('NEAR( OR -'), '"NEAR" "OR"')
+        self.assertIsNone(build_match_query("  "))
+
+    def test_ranked_search_with_highlighted_snippet(self):
+        self._log("Finally filed my taxes <b>early</b>. Taxes done!", tags="finance")
+        self._log("Walked in the park, thought about taxes once.")
+        self._log("Taxes taxes taxes", user="someone_else")
+        self._log("Baked bread.")
+
+        results = search_entries(USER, "taxes", db_path=TEST_DB)["results"]
+        self.assertEqual(len(results), 2)
+        self.assertIn("<mark>taxes</mark>", results[0]["snippet"])
+        self.assertIn("&lt;b&gt;", results[0]["snippet"])
+        self.assertEqual(results[0]["tags"], ["finance"])
+        self.assertGreaterEqual(results[0]["score"], results[1]["score"])
+        # Porter stemming: "walking" finds "Walked".
+        self.assertEqual(len(search_entries(USER, "walking", db_path=TEST_DB)["results"]), 1)
+
+    def test_edits_and_deletes_stay_in_sync(self):
+        entry_id = self._log("Dentist appointment tomorrow.", tags="health")
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("UPDATE journal_entries SET entry_text = 'Therapist session tomorrow.', tags = 'Therapy' WHERE id = ?", (entry_id,))
+        self.assertEqual(search_entries(USER, "dentist", db_path=TEST_DB)["results"], [])
+        self.assertEqual(len(search_entries(USER, "therapist", db_path=TEST_DB)["results"]), 1)
+        self.assertEqual(list_tags(USER, db_path=TEST_DB), [{"tag": "therapy", "count": 1}])
+
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("DELETE FROM journal_entries WHERE id = ?", (entry_id,))
+        self.assertEqual(search_entries(USER, "therapist", db_path=TEST_DB)["results"], [])
+        self.assertEqual(list_tags(USER, db_path=TEST_DB), [])
+
+    def test_tags_are_normalized(self):
+        self._log("Morning run.", tags="Exercise, #Outdoors; sleep hygiene")
+        self._log("Evening walk.", tags='["exercise", "Evening"]')
+        self._log("Meds refill.", tags="meds")
+
+        self.assertEqual(list_tags(USER, db_path=TEST_DB)[0], {"tag": "exercise", "count": 2})
+        browse = search_entries(USER, tags=["#EXERCISE"], db_path=TEST_DB)["results"]
+        self.assertEqual([r["snippet"] for r in browse], ["Evening walk.", "Morning run."])
+        both = search_entries(USER, tags=["exercise", "sleep hygiene"], db_path=TEST_DB)["results"]
+        self.assertEqual([r["snippet"] for r in both], ["Morning run."])
+        self.assertEqual(len(search_entries(USER, "walk", tags=["meds"], db_path=TEST_DB)["results"]), 0)
+
+    def test_archetype_tags(self):
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("INSERT INTO archetypes (name, tags) VALUES ('Theo', 'calm, focus')")
+            conn.execute("INSERT OR REPLACE INTO archetypes (name, tags) VALUES ('Theo', 'sleep')")
+            conn.execute("INSERT INTO archetypes (name, tags) VALUES ('Orion', 'Calm')")
+        self.assertEqual(archetypes_with_tag("calm", TEST_DB), ["Orion"])
+        self.assertEqual(archetypes_with_tag("sleep", TEST_DB), ["Theo"])
+
+    def test_cursor_pagination_covers_every_match_once(self):
+        for day in range(1, 26):
+            self._log(f"Focus session {day}" + " focus" * (day % 4), tags="focus", date=f"2024-05-{day:02d}T09:00:00")
+
+        for query, tags in (("focus", None), (None, ["focus"])):
+            seen, cursor = [], None
+            while True:
+                page = search_entries(USER, query, tags, limit=7, cursor=cursor, db_path=TEST_DB)
+                seen.extend(r["id"] for r in page["results"])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            self.assertEqual(len(seen), 25)
+            self.assertEqual(len(set(seen)), 25)
+
+        with self.assertRaises(InvalidCursor):
+            search_entries(USER, "focus", cursor="not-a-cursor", db_path=TEST_DB)
+
+    def test_search_stays_fast_on_a_large_journal(self):
+        words = "sleep focus taxes meds anxious dentist coffee garden email deadline walk rain friend work".split()
+        rows = [(f"user{i % 50}", f"2020-01-01T00:00:{i % 60:02d}",
+                 " ".join(words[(i * 7 + j) % len(words)] for j in range(30)) + f" note{i}", "work, sleep")
+                for i in range(20000)]
+        with db.get_connection(TEST_DB) as conn:
+            conn.executemany("INSERT INTO journal_entries (user_id, date, entry_text, tags) VALUES (?, ?, ?, ?)", rows)
+
+        start = time.perf_counter()
+        page = search_entries("user7", "deadline coffee", db_path=TEST_DB)
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual(len(page["results"]), Config.JOURNAL_SEARCH_PAGE_SIZE)
+        self.assertEqual(len(search_entries("user7", "note7", db_path=TEST_DB)["results"]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import time
+import asyncio
+from app.utils.llm_limiter import AdaptiveLimiter, LocalLimiterBackend, LLMOverloaded, parse_reset
+
+
+class TestLLMLimiter(unittest.TestCase):
+    def _limiter(self, **kwargs):
+        options = dict(max_concurrency=2, tokens_per_minute=1000, acquire_timeout=0.2)
+        options.update(kwargs)
+        return AdaptiveLimiter(LocalLimiterBackend(), **options)
+
+    def test_parse_reset(self):
+        self.assertEqual(parse_reset("6m0s"), 360)
+        self.assertEqual(parse_reset("1.5s"), 1.5)
+        self.assertEqual(parse_reset("250ms"), 0.25)
+        self.assertEqual(parse_reset("20"), 20)
+        self.assertIsNone(parse_reset("soon"))
+
+    def test_concurrency_cap_fails_fast(self):
+        limiter = self._limiter()
+        with limiter.slot(10), limiter.slot(10):
+            start = time.monotonic()
+            with self.assertRaises(LLMOverloaded):
+                with limiter.slot(10):
+                    pass
+            self.assertLess(time.monotonic() - start, 1)
+        with limiter.slot(10):
+            pass
+
+    def test_token_budget(self):
+        limiter = self._limiter(max_concurrency=10)
+        with limiter.slot(600):
+            pass
+        with self.assertRaises(LLMOverloaded):
+            with limiter.slot(600):
+                pass
+
+    def test_rate_limit_halves_cap_and_cools_down(self):
+        limiter = self._limiter(max_concurrency=8)
+        limiter.on_rate_limited(retry_after=30)
+        self.assertEqual(limiter.limit, 4)
+
+        with self.assertRaises(LLMOverloaded) as ctx:
+            with limiter.slot(10):
+                pass
+        self.assertGreaterEqual(ctx.exception.retry_after, 29)
+
+    def test_successes_restore_cap(self):
+        limiter = self._limiter(max_concurrency=4)
+        limiter.limit = 1
+        for _ in range(1 + 2 + 3):
+            limiter.on_success()
+        self.assertEqual(limiter.limit, 4)
+
+    def test_exhausted_headers_start_cooldown(self):
+        limiter = self._limiter()
+        limiter.observe_headers({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "20s"})
+        with self.assertRaises(LLMOverloaded):
+            with limiter.slot(10):
+                pass
+
+    def test_async_slot_shares_the_cap(self):
+        limiter = self._limiter(max_concurrency=1)
+
+        async def scenario():
+            async with limiter.aslot(10):
+                with self.assertRaises(LLMOverloaded):
+                    async with limiter.aslot(10):
+                        pass
+            async with limiter.aslot(10):
+                pass
+
+        asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
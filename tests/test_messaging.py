@@ -0,0 +1,65 @@
+import unittest
+from types import SimpleNamespace
+from app.utils.messaging import MessagingService, TokenBucket, RateLimitExceeded
+
+
+class FakeMessages:
+    def __init__(self):
+        self.created = []
+
+    def create(self, **params):
+        self.created.append(params)
+        return SimpleNamespace(sid=f"SM{len(self.created)}")
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertGreater(bucket.try_acquire(), 0.0)
+
+
+class TestMessagingService(unittest.TestCase):
+    def _service(self, **kwargs):
+        self.messages = FakeMessages()
+        client = SimpleNamespace(messages=self.messages)
+        return MessagingService(from_number="whatsapp:+15550000", client=client, **kwargs)
+
+    def test_text_and_media_go_in_one_message(self):
+        service = self._service()
+        message = service.send("whatsapp:+15550001", body="You got this.", media_url="https://example.test/a.mp3")
+
+        self.assertEqual(message.sid, "SM1")
+        self.assertEqual(self.messages.created, [{
+            "from_": "whatsapp:+15550000",
+            "to": "whatsapp:+15550001",
+            "body": "You got this.",
+            "media_url": ["https://example.test/a.mp3"],
+        }])
+        self.assertEqual(service.stats()["sent"], 1)
+
+    def test_sender_over_budget_is_rejected(self):
+        service = self._service(rate=0.01, burst=1, max_wait=0)
+        service.send("whatsapp:+15550001", body="first")
+
+        with self.assertRaises(RateLimitExceeded):
+            service.send("whatsapp:+15550002", body="second")
+        # Buckets are per sending number.
+        service.send("whatsapp:+15550002", body="second", from_="whatsapp:+15559999")
+        self.assertEqual(len(self.messages.created), 2)
+
+    def test_local_buckets_split_the_rate_between_workers(self):
+        service = self._service(rate=4, burst=6, workers=4)
+        bucket = service._bucket("whatsapp:+15550000")
+        self.assertEqual((bucket.rate, bucket.capacity), (1.0, 1.5))
+
+    def test_unreachable_redis_falls_back_to_local_share(self):
+        service = self._service(rate=0.01, burst=2, max_wait=0, workers=2, redis_url="redis://127.0.0.1:1/0")
+        service.send("whatsapp:+15550001", body="first")
+        with self.assertRaises(RateLimitExceeded):
+            service.send("whatsapp:+15550001", body="second")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import os
+from app.utils import db, migrations
+from app.utils.registry import ArchetypeRegistry
+
+TEST_DB = "test_registry.db"
+
+
+class TestArchetypeRegistry(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _add_archetype(self, name, tone, template):
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO archetypes (name, tone, template) VALUES (?, ?, ?)",
+                (name, tone, template)
+            )
+
+    def test_builtin_voices_and_fallback(self):
+        registry = ArchetypeRegistry(TEST_DB, check_interval=0)
+        self.assertTrue(registry.is_builtin("Fox"))
+        self.assertFalse(registry.is_builtin("Nova"))
+        self.assertEqual(registry.get_voice_id("Unknown"), registry.get_voice_id("Beau"))
+
+    def test_edits_propagate_to_other_registries(self):
+        reader = ArchetypeRegistry(TEST_DB, check_interval=0)
+        self.assertIsNone(reader.get_prompt("Nova"))
+
+        self._add_archetype("Nova", "Bright", "[Nova Mode]")
+        self.assertEqual(reader.get_prompt("Nova"), ("Bright", "[Nova Mode]"))
+
+        writer = ArchetypeRegistry(TEST_DB, check_interval=0)
+        writer.set_voice_map({"Nova": "voice-123"})
+        self.assertEqual(reader.get_voice_id("Nova"), "voice-123")
+
+    def test_lookups_served_from_memory_within_interval(self):
+        registry = ArchetypeRegistry(TEST_DB, check_interval=3600)
+        self.assertIsNone(registry.get_prompt("Nova"))
+        self._add_archetype("Nova", "Bright", "[Nova Mode]")
+        self.assertIsNone(registry.get_prompt("Nova"))
+        registry.invalidate()
+        self.assertEqual(registry.get_prompt("Nova"), ("Bright", "[Nova Mode]"))
+
+
+if __name__ == '__main__':
+    unittest.main()
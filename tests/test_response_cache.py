@@ -0,0 +1,100 @@
+import unittest
+import os
+from unittest import mock
+from app.utils import db, migrations
+from app.utils.response_cache import ResponseCache, response_cache_key
+
+TEST_DB = "test_response_cache.db"
+MESSAGES = [
+    {"role": "system", "content": "You are Caelum Wren in Beau mode."},
+    {"role": "user", "content": "Deliver a gentle affirmation.\nUser input: \"hi\""}
+]
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        self.key = response_cache_key("gpt-4", MESSAGES, 0.85, 500)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def test_key_normalizes_whitespace_but_not_parameters(self):
+        spaced = [dict(m, content=f"  {m['content']}  ") for m in MESSAGES]
+        self.assertEqual(self.key, response_cache_key("gpt-4", spaced, 0.85, 500))
+        self.assertNotEqual(self.key, response_cache_key("gpt-4", MESSAGES, 0.2, 500))
+        self.assertNotEqual(self.key, response_cache_key("gpt-4o", MESSAGES, 0.85, 500))
+
+    def test_hits_sample_once_enough_variants_exist(self):
+        cache = ResponseCache(TEST_DB, variants=2)
+        self.assertIsNone(cache.get(self.key))
+        cache.put(self.key, "You are enough.", mode="affirmation")
+        self.assertIsNone(cache.get(self.key))
+        cache.put(self.key, "You are doing fine.", mode="affirmation")
+
+        seen = {cache.get(self.key) for _ in range(40)}
+        self.assertEqual(seen, {"You are enough.", "You are doing fine."})
+
+    def test_shared_tier_serves_other_processes(self):
+        ResponseCache(TEST_DB, variants=1).put(self.key, "You are enough.", mode="affirmation")
+        self.assertEqual(ResponseCache(TEST_DB, variants=1).get(self.key), "You are enough.")
+        self.assertIsNone(ResponseCache(TEST_DB, variants=1, shared=False).get(self.key))
+
+    def test_uncached_modes_and_expiry(self):
+        cache = ResponseCache(TEST_DB, variants=1)
+        cache.put(self.key, "Let's reflect.", mode="reflection")
+        self.assertIsNone(cache.get(self.key))
+
+        cache.put(self.key, "You are enough.", mode="affirmation")
+        with mock.patch("app.utils.response_cache.time.time", return_value=10 ** 12):
+            self.assertIsNone(cache.get(self.key))
+            self.assertEqual(cache.purge_expired(), 1)
+
+    def test_engine_serves_repeat_prompts_from_cache(self):
+        from app import llm as llm_module
+        engine = llm_module.LLMEngine(debug=False)
+        completion = mock.MagicMock()
+        completion.return_value.__enter__.return_value.choices = [mock.Mock(message=mock.Mock(content="Breathe."))]
+        cache = ResponseCache(TEST_DB, variants=1)
+
+        with mock.patch.object(llm_module, "get_response_cache", return_value=cache), \
+                mock.patch.object(engine, "_completion", completion):
+            first = engine.generate_archetype_prompt("hi", "Warm", "Affirm.", "Beau", "affirmation")
+            second = engine.generate_archetype_prompt("hi", "Warm", "Affirm.  ", "Beau", "affirmation")
+            engine.generate_archetype_prompt("hi", "Warm", "Reflect.", "Beau", "reflection")
+            engine.generate_archetype_prompt("hi", "Warm", "Reflect.", "Beau", "reflection")
+
+        self.assertEqual((first, second), ("Breathe.", "Breathe."))
+        self.assertEqual(completion.call_count, 3)
+
+    def test_only_the_flight_leader_caches(self):
+        from app import llm as llm_module
+        engine = llm_module.LLMEngine(debug=False)
+        completion = mock.MagicMock()
+        completion.return_value.__enter__.return_value.choices = [mock.Mock(message=mock.Mock(content="Breathe."))]
+        cache = ResponseCache(TEST_DB, variants=3, shared=True)
+        count = "SELECT COUNT(*) FROM llm_response_cache"
+        follower = mock.Mock()
+        follower.do.return_value = "Shared reply."
+        leader = mock.Mock()
+        leader.do.side_effect = lambda key, fn: fn()
+
+        with mock.patch.object(llm_module, "get_response_cache", return_value=cache), \
+                mock.patch.object(engine, "_completion", completion):
+            with mock.patch.object(llm_module, "get_single_flight", return_value=follower):
+                for _ in range(3):
+                    engine.generate_archetype_prompt("hi", "Warm", "Affirm.", "Beau", "affirmation")
+            self.assertEqual(db.get_connection(TEST_DB).execute(count).fetchone()[0], 0)
+            with mock.patch.object(llm_module, "get_single_flight", return_value=leader):
+                engine.generate_archetype_prompt("hi", "Warm", "Affirm.", "Beau", "affirmation")
+        self.assertEqual(db.get_connection(TEST_DB).execute(count).fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
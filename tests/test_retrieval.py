@@ -0,0 +1,131 @@
+import unittest
+import os
+import time
+import shutil
+import numpy as np
+from app.config import Config
+from app.utils import db, migrations, helpers
+from app.utils.retrieval import HashingEmbedder, JournalIndex, index_journal_entries, search_journal, format_journal_context
+
+TEST_DB = "test_retrieval.db"
+TEST_DIR = "test_retrieval_index"
+USER = "retrieval_tester"
+
+
+class TestJournalRetrieval(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        self.embedder = HashingEmbedder(dim=256)
+        # Index explicitly rather than through the log_journal_entry hook.
+        self.retrieval = Config.RETRIEVAL_ENABLED
+        Config.RETRIEVAL_ENABLED = False
+
+    def tearDown(self):
+        Config.RETRIEVAL_ENABLED = self.retrieval
+        db.close_all_connections()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _log(self, text, user=USER):
+        return helpers.log_journal_entry(user, text, db_path=TEST_DB)
+
+    def _search(self, query, **kwargs):
+        return search_journal(USER, query, db_path=TEST_DB, index_dir=TEST_DIR, embedder=self.embedder, **kwargs)
+
+    def test_embeddings_are_unit_length_and_deterministic(self):
+        vectors = self.embedder.embed(["walked the dog at sunrise", "walked the dog at sunrise", ""])
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        np.testing.assert_array_equal(vectors[0], vectors[1])
+        self.assertEqual(float(np.abs(vectors[2]).sum()), 0.0)
+
+    def test_search_ranks_related_entry_first(self):
+        self._log("Had a panic attack before the dentist appointment.")
+        self._log("Tried the pomodoro timer for my tax paperwork, got two sessions done.")
+        self._log("Baked banana bread with my sister.")
+        self._log("Someone else's tax notes.", user="other_user")
+
+        matches = self._search("the tax paperwork is piling up again", min_score=0.0)
+        self.assertIn("pomodoro", matches[0]["entry_text"])
+        self.assertTrue(all("Someone else" not in m["entry_text"] for m in matches))
+        self.assertEqual(len(self._search("tax paperwork", k=1, min_score=0.0)), 1)
+
+    def test_indexing_is_incremental(self):
+        self._log("First entry about sleep.")
+        self.assertEqual(index_journal_entries(USER, TEST_DB, TEST_DIR, self.embedder), 1)
+        self.assertEqual(index_journal_entries(USER, TEST_DB, TEST_DIR, self.embedder), 0)
+        self._log("Second entry about focus.")
+        self._log("Third entry about sleep hygiene.")
+        self.assertEqual(index_journal_entries(USER, TEST_DB, TEST_DIR, self.embedder), 2)
+        self.assertEqual(JournalIndex(USER, TEST_DIR, TEST_DB).meta()["count"], 3)
+
+    def test_changing_embedder_rebuilds(self):
+        self._log("Meditated for ten minutes.")
+        index_journal_entries(USER, TEST_DB, TEST_DIR, self.embedder)
+        self.assertEqual(index_journal_entries(USER, TEST_DB, TEST_DIR, HashingEmbedder(dim=64)), 1)
+        self.assertEqual(JournalIndex(USER, TEST_DIR, TEST_DB).meta()["dim"], 64)
+
+    def test_deleted_entries_are_skipped(self):
+        entry_id = self._log("Argued with my landlord about the heating.")
+        self._log("The heating is fixed now.")
+        self._search("heating")
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("DELETE FROM journal_entries WHERE id = ?", (entry_id,))
+        self.assertTrue(all(m["id"] != entry_id for m in self._search("landlord heating", min_score=0.0)))
+
+    def test_edited_entries_are_reembedded(self):
+        entry_id = self._log("Argued with my landlord about the heating.")
+        self._log("Planted tomatoes on the balcony.")
+        self.assertEqual(self._search("landlord heating")[0]["id"], entry_id)
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("UPDATE journal_entries SET entry_text = 'Repotted the basil and the mint.' WHERE id = ?", (entry_id,))
+        self.assertEqual(self._search("repotted basil mint")[0]["id"], entry_id)
+        self.assertEqual(self._search("landlord heating"), [])
+        self.assertEqual(JournalIndex(USER, TEST_DIR, TEST_DB).meta()["count"], 2)
+
+    def test_recreated_database_rebuilds_index(self):
+        self._log("Argued with my landlord about the heating.")
+        self._log("Planted tomatoes on the balcony.")
+        self._search("heating")
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+        migrations.migrate(TEST_DB)
+
+        entry_id = self._log("Cycled to work in the rain.")
+        matches = self._search("cycled rain", min_score=0.0)
+        self.assertEqual([m["id"] for m in matches], [entry_id])
+        self.assertEqual(JournalIndex(USER, TEST_DIR, TEST_DB).meta()["count"], 1)
+
+    def test_search_over_large_index_is_fast(self):
+        index = JournalIndex(USER, TEST_DIR, TEST_DB)
+        rng = np.random.default_rng(7)
+        n, dim = 50000, self.embedder.dim
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        with index.locked():
+            index.append(self.embedder, list(range(1, n + 1)), vectors)
+        query = vectors[1234]
+        self.assertEqual(index.search(query, 5)[0][0], 1235)
+
+        start = time.perf_counter()
+        for _ in range(20):
+            index.search(query, 5)
+        self.assertLess((time.perf_counter() - start) / 20, 0.05)
+
+    def test_format_journal_context(self):
+        self.assertIsNone(format_journal_context([]))
+        message = format_journal_context([{"date": "2024-03-01T10:00:00", "entry_text": "word " * 200, "score": 0.5}], max_chars=40)
+        self.assertEqual(message["role"], "system")
+        self.assertIn("- 2024-03-01: word", message["content"])
+        self.assertLess(len(message["content"]), 120)
+
+
+if __name__ == '__main__':
+    unittest.main()
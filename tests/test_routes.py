@@ -1,9 +1,13 @@
+import os
 import json
+import uuid
 import pytest
 from app import create_app  # Ensure you have a create_app factory in __init__.py
 
 @pytest.fixture
-def client():
+def client(tmp_path, monkeypatch):
+    from app.config import Config
+    monkeypatch.setattr(Config, "RETRIEVAL_INDEX_DIR", str(tmp_path / "indexes"))
     app = create_app()
     app.config["TESTING"] = True
     with app.test_client() as client:
@@ -78,3 +82,201 @@ def test_tts_download(client):
     })
     assert resp.status_code == 200
     assert resp.mimetype == "audio/mpeg"
+
+def test_webhook_enqueues_reply_pipeline(client, monkeypatch):
+    enqueued = []
+    monkeypatch.setattr("app.routes.generate_reply_text.apply_async", lambda args, task_id: enqueued.append(args))
+    resp = client.post("/webhook", data={"From": "whatsapp:+15550001", "Body": "Hi Caelum"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/xml"
+    assert enqueued == [("whatsapp:+15550001", "Hi Caelum", None)]
+
+def test_webhook_retry_attaches_to_first_delivery(client, monkeypatch):
+    enqueued = []
+    monkeypatch.setattr("app.routes.generate_reply_text.apply_async", lambda args, task_id: enqueued.append(task_id))
+    message_sid = f"SM{uuid.uuid4().hex}"
+    payload = {"From": "whatsapp:+15550001", "Body": "Hi Caelum", "MessageSid": message_sid}
+    first = client.post("/webhook", data=payload)
+    retry = client.post("/webhook", data=payload)
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert len(enqueued) == 1
+
+def test_respond_stream_emits_deltas_then_metadata(client, monkeypatch):
+    monkeypatch.setattr("app.routes.llm.stream_archetype_prompt", lambda *args: iter(["You ", "got this."]))
+    resp = client.post("/respond", json={"input": "Help", "user_id": "stream001", "stream": True})
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    body = resp.get_data(as_text=True)
+    assert body.index('data: {"delta": "You "}') < body.index("event: metadata")
+    assert '"archetype_used"' in body.split("event: metadata", 1)[1]
+
+def test_llm_overloaded_returns_fast_503(client, monkeypatch):
+    from app.utils.llm_limiter import LLMOverloaded
+
+    def overloaded(*args, **kwargs):
+        raise LLMOverloaded(retry_after=7)
+
+    monkeypatch.setattr("app.routes.llm.generate_archetype_prompt", overloaded)
+    resp = client.post("/respond", json={"input": "Help", "user_id": "busy001"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "7"
+    assert resp.get_json()["error"] == "overloaded"
+
+def test_respond_batch_keeps_order_and_item_errors(client, monkeypatch):
+    from app.utils.llm_limiter import LLMOverloaded
+
+    def reply(user_input, tone, template, archetype, mode=None):
+        if user_input == "busy":
+            raise LLMOverloaded(retry_after=3)
+        return f"{archetype}: {user_input}"
+
+    monkeypatch.setattr("app.routes.llm.generate_archetype_prompt", reply)
+    resp = client.post("/respond/batch", json={"items": [
+        {"user_id": "batch001", "input": "first", "custom_archetype": "Theo"},
+        {"user_id": "batch002", "input": "busy"},
+        {"user_id": "batch003"},
+        {"user_id": "batch004", "input": "last", "custom_archetype": "Fox"},
+    ]})
+    assert resp.status_code == 200
+    results = resp.get_json()["results"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert results[0]["response"] == "Theo: first"
+    assert results[1] == {"index": 1, "user_id": "batch002", "error": "overloaded", "retry_after": 3}
+    assert "error" in results[2]
+    assert results[3]["archetype_used"] == "Fox"
+
+def test_respond_batch_rejects_malformed_items_individually(client, monkeypatch):
+    monkeypatch.setattr("app.routes.llm.generate_archetype_prompt",
+                        lambda user_input, tone, template, archetype, mode=None: f"{archetype}: {user_input}")
+    resp = client.post("/respond/batch", json={"items": [
+        {"user_id": ["batch005"], "input": "list id"},
+        {"user_id": "batch006", "input": "fine", "custom_archetype": "Theo"},
+        "not an item",
+        {"user_id": {"id": "batch007"}, "input": "dict id"},
+        {"user_id": "batch008", "input": 42},
+    ]})
+    assert resp.status_code == 200
+    results = resp.get_json()["results"]
+    assert results[1]["response"] == "Theo: fine"
+    assert [("error" in r) for r in results] == [True, False, True, True, True]
+
+def test_transcribe_streams_upload_to_pipeline(client, monkeypatch):
+    received = []
+
+    def transcribe_audio(path, content_hash):
+        received.append((path, content_hash))
+        return {"text": "Feeling calmer today.", "content_hash": content_hash, "chunks": 1, "cached": False}
+
+    monkeypatch.setattr("app.routes.llm.transcribe_audio", transcribe_audio)
+    resp = client.post("/transcribe", data=b"fake ogg audio", content_type="audio/ogg")
+    assert resp.status_code == 200
+    assert resp.get_json()["text"] == "Feeling calmer today."
+    assert received[0][0].endswith(".ogg")
+    assert not os.path.exists(received[0][0])
+
+def test_transcribe_rejects_oversize_body_before_reading(client, monkeypatch):
+    from app.config import Config
+    monkeypatch.setattr(Config, "TRANSCRIBE_MAX_UPLOAD_BYTES", 16)
+    monkeypatch.setattr("app.routes.save_stream", lambda *a, **k: pytest.fail("body was read"))
+    resp = client.post("/transcribe", data=b"x" * 64, content_type="audio/ogg")
+    assert resp.status_code == 413
+
+def test_oversize_multipart_upload_refused_before_parsing(client, monkeypatch):
+    import io
+    client.application.config["MAX_CONTENT_LENGTH"] = 1024
+    monkeypatch.setattr("app.routes.save_stream", lambda *a, **k: pytest.fail("body was parsed"))
+    resp = client.post("/transcribe", data={"file": (io.BytesIO(b"x" * 4096), "note.ogg")},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 413
+
+def test_webhook_passes_voice_notes_to_pipeline(client, monkeypatch):
+    enqueued = []
+    monkeypatch.setattr("app.routes.generate_reply_text.apply_async", lambda args, task_id: enqueued.append(args))
+    client.post("/webhook", data={
+        "From": "whatsapp:+15550001", "Body": "", "NumMedia": "1",
+        "MediaUrl0": "https://api.twilio.com/media/ME1", "MediaContentType0": "audio/ogg"
+    })
+    assert enqueued == [("whatsapp:+15550001", "", None, "https://api.twilio.com/media/ME1", "audio/ogg")]
+
+def test_journal_export_job_lifecycle(client, monkeypatch):
+    from app.config import Config
+    from app.utils.auth import sign_user_id
+    from app.utils.journal_export import run_export
+    monkeypatch.setattr(Config, "USER_TOKEN_SECRET", "test-secret")
+    headers = {"X-User-Token": sign_user_id("export001")}
+    queued = []
+    monkeypatch.setattr("app.routes.export_journal.delay", queued.append)
+    assert client.post("/journal/export", json={"user_id": "export001", "format": "markdown"}).status_code == 401
+    resp = client.post("/journal/export", json={"user_id": "export001", "format": "markdown"}, headers=headers)
+    assert resp.status_code == 202
+    job = resp.get_json()
+    assert queued == [job["job_id"]]
+    assert client.get(job["download_url"], headers=headers).status_code == 409
+
+    finished = run_export(job["job_id"])
+    assert client.get(job["status_url"], headers=headers).get_json()["status"] == "done"
+    other = {"X-User-Token": sign_user_id("export002")}
+    assert client.get(job["download_url"], headers=other).status_code == 401
+    download = client.get(job["download_url"], headers=headers)
+    assert download.status_code == 200
+    assert "# Journal" in download.get_data(as_text=True)
+    download.close()
+    os.remove(finished["path"])
+
+def test_respond_carries_conversation_history(client, monkeypatch):
+    seen = []
+
+    def reply(user_input, tone, template, archetype, mode=None, history=None):
+        seen.append(history)
+        return f"noted: {user_input}"
+
+    monkeypatch.setattr("app.routes.llm.generate_archetype_prompt", reply)
+    user_id = f"memory-{uuid.uuid4().hex}"
+    for text in ("I parked on level 3", "Where did I park?"):
+        resp = client.post("/respond", json={"input": text, "user_id": user_id, "custom_archetype": "Theo"})
+        assert resp.status_code == 200
+    assert seen[0] == []
+    assert [m["content"] for m in seen[1]] == ["I parked on level 3", "noted: I parked on level 3"]
+
+def test_respond_includes_relevant_journal_entries(client, monkeypatch):
+    from app.utils.helpers import log_journal_entry
+    seen = []
+
+    def reply(user_input, tone, template, archetype, mode=None, history=None):
+        seen.append(history)
+        return "ok"
+
+    monkeypatch.setattr("app.routes.llm.generate_archetype_prompt", reply)
+    user_id = f"journal-{uuid.uuid4().hex}"
+    log_journal_entry(user_id, "The pomodoro timer finally got me through my tax paperwork.")
+    resp = client.post("/respond", json={"input": "Tax paperwork again, help", "user_id": user_id, "custom_archetype": "Theo"})
+    assert resp.status_code == 200
+    assert "pomodoro" in seen[0][0]["content"]
+
+def test_journal_search_route(client, monkeypatch):
+    from app.config import Config
+    from app.utils.auth import sign_user_id
+    from app.utils.helpers import log_journal_entry
+    monkeypatch.setattr(Config, "USER_TOKEN_SECRET", "test-secret")
+    user_id = f"search-{uuid.uuid4().hex}"
+    headers = {"X-User-Token": sign_user_id(user_id)}
+    log_journal_entry(user_id, "Forgot my keys at the gym again.", tags="errands")
+    resp = client.get(f"/journal/search?user_id={user_id}&q=keys", headers=headers)
+    assert resp.status_code == 200
+    assert "<mark>keys</mark>" in resp.get_json()["results"][0]["snippet"]
+    assert client.get(f"/journal/search?user_id={user_id}&tag=Errands", headers=headers).get_json()["results"]
+    assert client.get(f"/journal/tags?user_id={user_id}", headers=headers).get_json()["tags"] == [{"tag": "errands", "count": 1}]
+    assert client.get(f"/journal/search?user_id={user_id}", headers=headers).status_code == 400
+    assert client.get(f"/journal/search?user_id={user_id}&q=keys&cursor=bogus", headers=headers).status_code == 400
+
+def test_journal_search_requires_access(client, monkeypatch):
+    from app.config import Config
+    from app.utils.auth import sign_user_id
+    monkeypatch.setattr(Config, "USER_TOKEN_SECRET", "test-secret")
+    monkeypatch.setattr(Config, "API_KEY", "server-key")
+    assert client.get("/journal/search?user_id=alice&q=keys").status_code == 401
+    other = {"X-User-Token": sign_user_id("mallory")}
+    assert client.get("/journal/tags?user_id=alice", headers=other).status_code == 401
+    assert client.get("/journal/tags?user_id=alice", headers={"X-API-Key": "wrong"}).status_code == 401
+    assert client.get("/journal/tags?user_id=alice", headers={"X-API-Key": "server-key"}).status_code == 200
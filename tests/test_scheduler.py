@@ -0,0 +1,78 @@
+import unittest
+import os
+from datetime import datetime, timezone
+from app.utils import db, migrations
+from app.utils.broadcasts import subscribe, unsubscribe, create_broadcast, pending_recipients
+from app.utils.scheduler import next_due_time, due_entries, advance_entries
+
+TEST_DB = "test_scheduler.db"
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class TestNextDueTime(unittest.TestCase):
+    def test_local_morning_in_each_timezone(self):
+        after = utc(2024, 1, 15, 0, 0)
+        self.assertEqual(next_due_time("morning", "Europe/Berlin", after), utc(2024, 1, 15, 6, 0))
+        self.assertEqual(next_due_time("morning", "America/New_York", after), utc(2024, 1, 15, 12, 0))
+
+    def test_rolls_to_next_slot_and_next_day(self):
+        self.assertEqual(next_due_time("focus", "UTC", utc(2024, 1, 15, 10, 0)), utc(2024, 1, 15, 11, 0))
+        self.assertEqual(next_due_time("focus", "UTC", utc(2024, 1, 15, 16, 30)), utc(2024, 1, 16, 10, 0))
+
+    def test_unknown_timezone_falls_back_to_utc(self):
+        self.assertEqual(next_due_time("evening", "Mars/Olympus", utc(2024, 1, 15)), utc(2024, 1, 15, 21, 0))
+
+
+class TestDueQueue(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+
+    def tearDown(self):
+        db.close_all_connections()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _set_due(self, recipient, program, due):
+        with db.get_connection(TEST_DB) as conn:
+            conn.execute("UPDATE schedule_due SET next_due = ? WHERE recipient = ? AND program = ?", (due, recipient, program))
+
+    def test_only_due_entries_are_returned_then_advanced(self):
+        subscribe("whatsapp:+1", ["morning", "evening"], "Europe/Berlin", db_path=TEST_DB)
+        subscribe("whatsapp:+2", ["morning"], "America/New_York", db_path=TEST_DB)
+        now = utc(2024, 1, 15, 6, 0)
+        self._set_due("whatsapp:+1", "morning", now)
+        self._set_due("whatsapp:+1", "evening", utc(2024, 1, 15, 20, 0))
+        self._set_due("whatsapp:+2", "morning", utc(2024, 1, 15, 12, 0))
+
+        entries = due_entries(now, 100, db_path=TEST_DB)
+        self.assertEqual([(e["recipient"], e["program"]) for e in entries], [("whatsapp:+1", "morning")])
+
+        advance_entries(entries, now, db_path=TEST_DB)
+        self.assertEqual(due_entries(now, 100, db_path=TEST_DB), [])
+        next_morning = [e for e in due_entries(utc(2024, 1, 16, 6, 0), 100, db_path=TEST_DB)
+                        if e["recipient"] == "whatsapp:+1" and e["program"] == "morning"]
+        self.assertEqual(next_morning[0]["next_due"], utc(2024, 1, 16, 6, 0))
+
+    def test_unsubscribe_clears_schedule(self):
+        subscribe("whatsapp:+1", ["focus"], db_path=TEST_DB)
+        unsubscribe("whatsapp:+1", db_path=TEST_DB)
+        self.assertEqual(due_entries(utc(2100, 1, 1), 100, db_path=TEST_DB), [])
+
+    def test_repeated_slot_adds_only_new_recipients(self):
+        broadcast_id, created = create_broadcast("morning@T06:00", "morning", "Hi", ["a", "b"], db_path=TEST_DB)
+        again, created_again = create_broadcast("morning@T06:00", "morning", "Hi", ["b", "c"], db_path=TEST_DB)
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again, broadcast_id)
+        self.assertEqual(pending_recipients(broadcast_id, 600, db_path=TEST_DB), ["a", "b", "c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
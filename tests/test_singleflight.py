@@ -0,0 +1,104 @@
+import unittest
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.singleflight import SingleFlight, AsyncSingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def _upstream(self, result="Breathe."):
+        self.calls += 1
+        self.release.wait(2)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run_concurrently(self, flight, n, fn):
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(flight.do, "llm:same", fn) for _ in range(n)]
+            while flight.stats()["in_flight"] == 0:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            self.release.set()
+            return futures
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight(wait_timeout=5)
+        futures = self._run_concurrently(flight, 8, self._upstream)
+        self.assertEqual([f.result() for f in futures], ["Breathe."] * 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(flight.stats(), {"shared": 7, "in_flight": 0})
+
+    def test_leader_error_reaches_followers(self):
+        flight = SingleFlight(wait_timeout=5)
+        futures = self._run_concurrently(flight, 4, lambda: self._upstream(ValueError("upstream down")))
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result()
+        self.assertEqual(self.calls, 1)
+
+    def test_later_calls_start_a_new_flight(self):
+        flight = SingleFlight(wait_timeout=5)
+        self.release.set()
+        flight.do("tts:clip", self._upstream)
+        flight.do("tts:clip", self._upstream)
+        self.assertEqual(self.calls, 2)
+
+    def test_unreachable_redis_falls_back_to_local(self):
+        flight = SingleFlight("redis://127.0.0.1:1/0", wait_timeout=5)
+        self.release.set()
+        self.assertEqual(flight.do("llm:same", self._upstream), "Breathe.")
+        self.assertIsNone(flight.redis)
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_concurrent_coroutines_share_one_call(self):
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "Breathe."
+
+        async def main():
+            flight = AsyncSingleFlight(wait_timeout=5)
+            results = await asyncio.gather(*(flight.do("tts:same", upstream) for _ in range(5)))
+            return results, flight.stats()
+
+        results, stats = asyncio.run(main())
+        self.assertEqual(results, ["Breathe."] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(stats, {"shared": 4, "in_flight": 0})
+
+    def test_async_engine_coalesces_identical_prompts(self):
+        from app.async_llm import AsyncLLMEngine
+        calls = []
+
+        @asynccontextmanager
+        async def completion(messages, stream=False):
+            calls.append(messages)
+            await asyncio.sleep(0.05)
+            yield SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="You got this."))])
+
+        async def main():
+            engine = AsyncLLMEngine(debug=False)
+            engine._completion = completion
+            engine._cache_key = lambda messages, mode: None
+            try:
+                return await asyncio.gather(engine.generate_response("Help"), engine.generate_response("Help"))
+            finally:
+                await engine.aclose()
+
+        self.assertEqual(asyncio.run(main()), ["You got this."] * 2)
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import json
+import base64
+import threading
+from app.utils.speech import iter_sentences, stream_speech
+
+
+class FakeStreamInput:
+    """Echoes each text frame back as one audio frame, then a final frame after EOS."""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self._frames = []
+        self._ready = threading.Condition()
+
+    def send(self, payload):
+        message = json.loads(payload)
+        self.sent.append(message)
+        with self._ready:
+            if message["text"] == "":
+                self._frames.append(json.dumps({"audio": None, "isFinal": True}))
+            elif message["text"].strip():
+                audio = base64.b64encode(message["text"].strip().encode("utf-8")).decode("ascii")
+                self._frames.append(json.dumps({"audio": audio, "isFinal": False}))
+            self._ready.notify_all()
+
+    def recv(self):
+        with self._ready:
+            self._ready.wait_for(lambda: self._frames, timeout=5)
+            return self._frames.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class TestIterSentences(unittest.TestCase):
+    def test_splits_deltas_at_sentence_boundaries(self):
+        deltas = ["Take a breath", ". You've done", " hard things before! What's one", " small step? Start there"]
+        self.assertEqual(
+            list(iter_sentences(deltas, min_chars=0)),
+            ["Take a breath.", "You've done hard things before!", "What's one small step?", "Start there"]
+        )
+
+    def test_short_sentences_are_merged(self):
+        self.assertEqual(
+            list(iter_sentences(["Hi. Ok. Let's plan the morning together. Go."], min_chars=20)),
+            ["Hi. Ok. Let's plan the morning together.", "Go."]
+        )
+
+
+class TestStreamSpeech(unittest.TestCase):
+    def test_one_session_carries_every_sentence(self):
+        ws = FakeStreamInput()
+        sentences = iter(["First thought.", "Second thought."])
+
+        audio = list(stream_speech(sentences, "voice", connect=lambda url, **kwargs: ws))
+
+        self.assertEqual(audio, [b"First thought.", b"Second thought."])
+        self.assertIn("voice_settings", ws.sent[0])
+        self.assertEqual(ws.sent[-1], {"text": ""})
+        self.assertTrue(ws.closed)
+
+    def test_upstream_failure_is_raised_after_stream_closes(self):
+        ws = FakeStreamInput()
+
+        def failing():
+            yield "Before the error."
+            raise RuntimeError("LLM down")
+
+        with self.assertRaises(RuntimeError):
+            list(stream_speech(failing(), "voice", connect=lambda url, **kwargs: ws))
+        self.assertEqual(ws.sent[-1], {"text": ""})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import io
+import os
+import shutil
+import hashlib
+from unittest import mock
+from app.utils import db, migrations, transcription
+from app.utils.transcription import (
+    save_stream, chunk_spans, stitch_transcripts, transcribe_file, UploadTooLarge
+)
+
+TEST_DB = "test_transcription.db"
+TEST_DIR = "test_transcription_uploads"
+
+
+class TestTranscription(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        self.calls = []
+
+    def tearDown(self):
+        db.close_all_connections()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _whisper(self, path):
+        self.calls.append(path)
+        return {"a.mp3": "so today I went to the shop and", "b.mp3": "the shop and bought some bread"}.get(
+            os.path.basename(path), "Feeling calmer today.")
+
+    def test_save_stream_hashes_and_names_by_content(self):
+        data = os.urandom(200 * 1024)
+        path, content_hash, size = save_stream(io.BytesIO(data), TEST_DIR, ".ogg")
+        self.assertEqual(content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(size, len(data))
+        self.assertTrue(os.path.basename(path).startswith(content_hash))
+        self.assertTrue(path.endswith(".ogg"))
+
+        with self.assertRaises(UploadTooLarge):
+            save_stream(io.BytesIO(data), TEST_DIR, max_bytes=1024)
+        self.assertEqual(os.listdir(TEST_DIR), [os.path.basename(path)])
+
+    def test_chunk_spans_overlap_and_cover(self):
+        self.assertEqual(chunk_spans(50, 120, 4), [(0.0, 50)])
+        spans = chunk_spans(300, 120, 4)
+        self.assertEqual(spans, [(0.0, 120), (116.0, 120), (232.0, 68.0)])
+
+    def test_stitch_drops_repeated_overlap(self):
+        self.assertEqual(
+            stitch_transcripts(["So today I went to the shop and", "the shop, and bought some bread.", ""]),
+            "So today I went to the shop and bought some bread."
+        )
+        self.assertEqual(stitch_transcripts(["One thing.", "Another thing."]), "One thing. Another thing.")
+
+    def test_repeat_audio_is_served_from_cache(self):
+        path, content_hash, _ = save_stream(io.BytesIO(b"voice note"), TEST_DIR, ".ogg")
+        first = transcribe_file(path, content_hash, self._whisper, db_path=TEST_DB)
+        second = transcribe_file(path, content_hash, self._whisper, db_path=TEST_DB)
+        self.assertEqual((first["text"], first["cached"]), ("Feeling calmer today.", False))
+        self.assertEqual((second["text"], second["cached"]), ("Feeling calmer today.", True))
+        self.assertEqual(len(self.calls), 1)
+
+    def test_long_recordings_are_chunked_and_stitched(self):
+        path, content_hash, _ = save_stream(io.BytesIO(b"long voice journal"), TEST_DIR, ".ogg")
+        with mock.patch.object(transcription.shutil, "which", return_value="/usr/bin/ffmpeg"), \
+                mock.patch.object(transcription, "audio_duration", return_value=200), \
+                mock.patch.object(transcription, "split_audio", return_value=["a.mp3", "b.mp3"]):
+            result = transcribe_file(path, content_hash, self._whisper, db_path=TEST_DB)
+        self.assertEqual(result["text"], "so today I went to the shop and bought some bread")
+        self.assertEqual(result["chunks"], 2)
+        self.assertEqual(sorted(self.calls), ["a.mp3", "b.mp3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
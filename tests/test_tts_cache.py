@@ -0,0 +1,81 @@
+import unittest
+import os
+import asyncio
+import shutil
+from app.utils import db, migrations
+from app.utils.event_sink import get_event_writer
+from app.utils.tts_cache import TTSCache, tts_cache_key
+
+TEST_DB = "test_tts_cache.db"
+TEST_DIR = "test_tts_cache_audio"
+
+
+class TestTTSCache(unittest.TestCase):
+    def setUp(self):
+        db.close_all_connections()
+        if os.path.exists(TEST_DB):
+            os.remove(TEST_DB)
+        migrations.migrate(TEST_DB)
+        self.calls = []
+
+    def tearDown(self):
+        get_event_writer(TEST_DB).flush()
+        db.close_all_connections()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+
+    def _synthesize(self, text, output_path):
+        self.calls.append(text)
+        with open(output_path, "wb") as f:
+            f.write(b"ID3" + text.encode("utf-8"))
+
+    def test_key_ignores_whitespace_but_not_voice(self):
+        base = tts_cache_key("gtts", "en", {}, "Good  morning!\n")
+        self.assertEqual(base, tts_cache_key("gtts", "en", {}, " Good morning! "))
+        self.assertNotEqual(base, tts_cache_key("gtts", "fr", {}, "Good morning!"))
+        self.assertNotEqual(base, tts_cache_key("elevenlabs", "en", {}, "Good morning!"))
+
+    def test_repeat_requests_hit_cache(self):
+        cache = TTSCache(TEST_DIR, TEST_DB)
+        first = cache.get_or_create("gtts", "en", {}, "You are capable.", self._synthesize)
+        second = cache.get_or_create("gtts", "en", {}, "You are  capable.", self._synthesize)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+        self.assertEqual(cache.get_cached("gtts", "en", {}, "You are capable."), first)
+        self.assertIsNone(cache.get_cached("gtts", "en", {}, "Not synthesized yet."))
+
+        get_event_writer(TEST_DB).flush()
+        hits = db.get_connection(TEST_DB).execute("SELECT hits FROM tts_cache_entries").fetchone()[0]
+        self.assertEqual(hits, 2)
+
+    def test_async_lookup_shares_entries_with_sync(self):
+        cache = TTSCache(TEST_DIR, TEST_DB)
+        first = cache.get_or_create("gtts", "en", {}, "One step at a time.", self._synthesize)
+
+        async def synthesize(text, output_path):
+            self._synthesize(text, output_path)
+
+        second = asyncio.run(cache.aget_or_create("gtts", "en", {}, "One step at a time.", synthesize))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_failed_synthesis_leaves_no_file(self):
+        cache = TTSCache(TEST_DIR, TEST_DB)
+
+        def broken(text, output_path):
+            with open(output_path, "wb") as f:
+                f.write(b"partial")
+            raise RuntimeError("TTS down")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_create("gtts", "en", {}, "Hello", broken)
+        leftovers = [name for _, _, files in os.walk(TEST_DIR) for name in files]
+        self.assertEqual(leftovers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()